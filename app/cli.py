@@ -0,0 +1,57 @@
+import sys
+import click
+
+def register_commands(app):
+    """
+    Register maintenance commands, e.g. `flask --app wsgi upgrade-db`.
+    """
+    @app.cli.command('upgrade-db')
+    def upgrade_db():
+        """Create missing tables and run pending schema migrations."""
+        from app_factory import db
+        from app.utils.schema import get_schema_version, upgrade_schema
+        db.create_all()
+        for version in upgrade_schema():
+            click.echo(f"Applied migration {version}")
+        click.echo(f"Database schema is at version {get_schema_version()}.")
+
+    @app.cli.command('check-query-plans')
+    def check_query_plans():
+        """Fail if a hot-path query would scan a whole table."""
+        from app.utils.query_plans import check_hot_path_plans
+        failed = False
+        for name, result in check_hot_path_plans():
+            if result == 'ok':
+                click.echo(f"OK   {name}")
+            elif result.startswith('skipped'):
+                click.echo(f"SKIP {name} - {result}")
+            else:
+                failed = True
+                click.echo(f"FAIL {name} - {result}")
+        if failed:
+            sys.exit(1)
+
+    @app.cli.command('prune-sync-history')
+    @click.option('--days', type=int, default=None, help='Keep raw runs for this many days (default SYNC_HISTORY_RETENTION_DAYS).')
+    @click.option('--archive-dir', default=None, help='Archive deleted runs to this directory (default SYNC_HISTORY_ARCHIVE_DIR).')
+    def prune_sync_history(days, archive_dir):
+        """Roll sync history up into daily stats and delete old raw runs."""
+        from app.services.retention import apply_retention
+        result = apply_retention(retention_days=days, archive_dir=archive_dir)
+        click.echo(f"Rolled up {result['days_rolled_up']} days, deleted {result['runs_deleted']} runs.")
+        for path in result['archives']:
+            click.echo(f"Archived to {path}")
+
+    @app.cli.command('plan-ad')
+    @click.option('--scope', type=click.Choice(['pending', 'all']), default='pending', help='Employees waiting for sync, or every employee.')
+    @click.option('--output', type=click.Path(dir_okay=False), default=None, help='Write the full diff as CSV to this file.')
+    def plan_ad(scope, output):
+        """Show what an AD sync would change without writing to AD."""
+        from app.services.ad_plan import build_ad_plan, plan_rows_to_csv
+        plan = build_ad_plan(scope)
+        for key, value in plan['summary'].items():
+            click.echo(f"{key}: {value}")
+        if output:
+            with open(output, 'w', encoding='utf-8', newline='') as f:
+                f.writelines(plan_rows_to_csv(plan['rows']))
+            click.echo(f"Diff written to {output}")
@@ -0,0 +1,9 @@
+from app_factory import db, get_asia_bangkok_time
+
+class ADIdentity(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    employee_id = db.Column(db.String(20), unique=True, nullable=False)  # รหัสพนักงานจาก HR
+    object_guid = db.Column(db.String(36), index=True)  # objectGUID ของผู้ใช้ใน AD (ไม่เปลี่ยนแม้ย้าย OU หรือเปลี่ยนชื่อ)
+    dn = db.Column(db.String(512))  # DN ล่าสุดที่พบ ใช้แสดงผลและตรวจสอบ
+    created_at = db.Column(db.DateTime, default=get_asia_bangkok_time)
+    updated_at = db.Column(db.DateTime, default=get_asia_bangkok_time, onupdate=get_asia_bangkok_time)
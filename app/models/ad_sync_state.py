@@ -0,0 +1,7 @@
+from app_factory import db, get_asia_bangkok_time
+
+class ADSyncState(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    server = db.Column(db.String(255), unique=True, nullable=False)  # dnsHostName ของ DC (uSN แยกตาม DC)
+    highest_usn = db.Column(db.BigInteger, nullable=False, default=0)  # highestCommittedUSN ที่อ่านได้ในรอบล่าสุด
+    last_run = db.Column(db.DateTime, default=get_asia_bangkok_time, onupdate=get_asia_bangkok_time)
@@ -2,16 +2,28 @@ from app_factory import db, get_asia_bangkok_time
 from datetime import datetime
 
 class Employee(db.Model):
+    __table_args__ = (
+        # ใช้สำหรับเรียงตามชื่อและแบ่งหน้าแบบ keyset ในตารางพนักงานบน dashboard
+        db.Index('ix_employee_name_order', db.func.coalesce(db.text('lname'), ''),
+                 db.func.coalesce(db.text('fname'), ''), 'id'),
+        # partial index สำหรับรายการที่รออัพเดต AD (มักมีแค่ส่วนน้อยของตาราง)
+        # query ต้องใช้เงื่อนไข Employee.ad_updated == false() ให้ตรงกับ WHERE ของ index
+        db.Index('ix_employee_ad_pending', 'id',
+                 postgresql_where=db.text('ad_updated = false'),
+                 sqlite_where=db.text('ad_updated = 0')),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     employee_id = db.Column(db.String(20), unique=True, nullable=False)
     fname = db.Column(db.String(64), nullable=True)  # อนุญาให้เป็น nullable=True เพื่อรับข้อมูลที่อาจมีค่าว่าง
     lname = db.Column(db.String(64), nullable=True)  # อนุญาให้เป็น nullable=True เพื่อรับข้อมูลที่อาจมีค่าว่าง
     phone = db.Column(db.String(20))
-    department = db.Column(db.String(64))
+    department = db.Column(db.String(64), index=True)
     position = db.Column(db.String(64))
     start_date = db.Column(db.Date)
-    status = db.Column(db.String(20))
+    status = db.Column(db.String(20), index=True)
     last_updated = db.Column(db.DateTime, default=get_asia_bangkok_time, onupdate=get_asia_bangkok_time)
     ad_updated = db.Column(db.Boolean, default=False)
-    resigndate = db.Column(db.Date, nullable=True)  # วันที่ลาออก
-    account_expires_date = db.Column(db.Date, nullable=True)  # วันที่จะปิดใช้งานบน AD
\ No newline at end of file
+    resigndate = db.Column(db.Date, nullable=True, index=True)  # วันที่ลาออก
+    account_expires_date = db.Column(db.Date, nullable=True)  # วันที่จะปิดใช้งานบน AD
+    sync_fingerprint = db.Column(db.String(64), nullable=True)  # hash ของข้อมูลจาก HR ใช้ตรวจว่ามีการเปลี่ยนแปลงหรือไม่
\ No newline at end of file
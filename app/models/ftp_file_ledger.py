@@ -0,0 +1,14 @@
+from app_factory import db, get_asia_bangkok_time
+
+class FtpFileLedger(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    filename = db.Column(db.String(255), nullable=False)
+    size = db.Column(db.BigInteger)  # ขนาดไฟล์จากคำสั่ง SIZE
+    modified_at = db.Column(db.String(14))  # เวลาแก้ไขไฟล์จากคำสั่ง MDTM (YYYYMMDDHHMMSS)
+    sha256 = db.Column(db.String(64), nullable=False, index=True)
+    row_count = db.Column(db.Integer, default=0)
+    processed_at = db.Column(db.DateTime, default=get_asia_bangkok_time)
+
+    __table_args__ = (
+        db.Index('ix_ftp_file_ledger_file', 'filename', 'size', 'modified_at'),
+    )
@@ -0,0 +1,6 @@
+from app_factory import db, get_asia_bangkok_time
+
+class SchemaVersion(db.Model):
+    version = db.Column(db.Integer, primary_key=True, autoincrement=False)  # เลขของ migration ใน app/utils/schema.py
+    description = db.Column(db.String(255))
+    applied_at = db.Column(db.DateTime, default=get_asia_bangkok_time)
@@ -2,6 +2,12 @@ from app_factory import db, get_asia_bangkok_time
 from datetime import datetime
 
 class SyncHistory(db.Model):
+    __table_args__ = (
+        # dashboard แสดงประวัติล่าสุด และรายงานกรองตามชนิดของการ sync
+        db.Index('ix_sync_history_start_time_desc', db.text('start_time DESC')),
+        db.Index('ix_sync_history_type_start_time', 'sync_type', 'start_time'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     sync_type = db.Column(db.String(20), nullable=False)  # 'myhr', 'ftp', 'ad', 'all'
     status = db.Column(db.String(20), nullable=False)   # 'success', 'failed'
@@ -11,4 +17,10 @@ class SyncHistory(db.Model):
     end_time = db.Column(db.DateTime)
     updated_count = db.Column(db.Integer, default=0)
     not_found_count = db.Column(db.Integer, default=0)
+    unchanged_count = db.Column(db.Integer, default=0)  # จำนวน object ที่ไม่มีค่าเปลี่ยน
+    attribute_writes_skipped = db.Column(db.Integer, default=0)  # จำนวน attribute ที่ไม่ต้องเขียนซ้ำ
+    drift_count = db.Column(db.Integer, default=0)  # จำนวนผู้ใช้ที่ถูกแก้ไขใน AD โดยตรงจนไม่ตรงกับฐานข้อมูล
+    fetch_mode = db.Column(db.String(10))  # 'full' หรือ 'delta' สำหรับการดึงจาก MyHR
+    records_received = db.Column(db.Integer)  # จำนวน record ที่ได้รับจากแหล่งข้อมูลในรอบนี้
+    phase_timings = db.Column(db.Text)  # เวลาที่ใช้ในแต่ละขั้นตอน (วินาที) แบบ JSON string
     error_message = db.Column(db.Text)
\ No newline at end of file
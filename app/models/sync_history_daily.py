@@ -0,0 +1,20 @@
+from app_factory import db
+
+class SyncHistoryDaily(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.Date, nullable=False)  # วันตามเวลา Asia/Bangkok
+    sync_type = db.Column(db.String(20), nullable=False)  # 'myhr', 'ftp', 'ad', 'all'
+    runs = db.Column(db.Integer, default=0)
+    successes = db.Column(db.Integer, default=0)
+    failures = db.Column(db.Integer, default=0)
+    updated_total = db.Column(db.Integer, default=0)
+    not_found_total = db.Column(db.Integer, default=0)
+    unchanged_total = db.Column(db.Integer, default=0)
+    duration_p50 = db.Column(db.Float)  # วินาที
+    duration_p95 = db.Column(db.Float)  # วินาที
+    duration_samples = db.Column(db.Integer, default=0)  # จำนวนรอบที่มี end_time ใช้คำนวณ percentile
+    raw_deleted = db.Column(db.Boolean, default=False)  # ลบ SyncHistory ของวันนี้ไปแล้ว คำนวณใหม่จากข้อมูลดิบไม่ได้
+
+    __table_args__ = (
+        db.UniqueConstraint('day', 'sync_type', name='uq_sync_history_daily_day_type'),
+    )
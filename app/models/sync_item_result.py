@@ -0,0 +1,35 @@
+from app_factory import db
+
+# ผลลัพธ์ของแต่ละรายการใน 1 รอบ sync
+OUTCOMES = ('updated', 'unchanged', 'not_found', 'failed', 'drift')
+
+# ลำดับ bit ของ attribute ใน changed_mask ห้ามสลับลำดับเพราะข้อมูลเก่าอ้างอิงตำแหน่งนี้
+CHANGED_ATTRIBUTES = ('employeeID', 'telephoneNumber', 'department', 'title',
+                      'userAccountControl', 'accountExpires')
+
+def encode_changed_attributes(names):
+    mask = 0
+    for name in names:
+        mask |= 1 << CHANGED_ATTRIBUTES.index(name)
+    return mask
+
+def decode_changed_attributes(mask):
+    return [name for bit, name in enumerate(CHANGED_ATTRIBUTES) if mask and mask & (1 << bit)]
+
+class SyncItemResult(db.Model):
+    id = db.Column(db.BigInteger().with_variant(db.Integer, 'sqlite'), primary_key=True)
+    sync_id = db.Column(db.Integer, db.ForeignKey('sync_history.id', ondelete='CASCADE'), nullable=False)
+    employee_id = db.Column(db.String(20))
+    outcome = db.Column(db.String(16), nullable=False)  # ค่าใน OUTCOMES
+    changed_mask = db.Column(db.Integer, default=0)  # bit ตาม CHANGED_ATTRIBUTES
+    error_code = db.Column(db.String(64))  # เช่น LDAP result description หรือชื่อ exception
+    error_message = db.Column(db.String(255))
+
+    __table_args__ = (
+        db.Index('ix_sync_item_result_sync_outcome', 'sync_id', 'outcome', 'id'),
+        db.Index('ix_sync_item_result_employee', 'employee_id'),
+    )
+
+    @property
+    def changed_attributes(self):
+        return decode_changed_attributes(self.changed_mask)
@@ -0,0 +1,17 @@
+from app_factory import db, get_asia_bangkok_time
+
+class SyncJob(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    job_type = db.Column(db.String(20), nullable=False)  # 'myhr', 'ftp', 'ad', 'all'
+    status = db.Column(db.String(20), nullable=False, default='queued')  # 'queued', 'running', 'success', 'failed'
+    created_at = db.Column(db.DateTime, default=get_asia_bangkok_time)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    heartbeat_at = db.Column(db.DateTime)  # อัปเดตเป็นระยะขณะงานทำงานอยู่ ใช้ตรวจหางานที่ค้าง
+    progress = db.Column(db.Text)  # ตัวนับความคืบหน้าแบบ JSON string
+    result = db.Column(db.Text)  # ผลลัพธ์ของงานแบบ JSON string
+    error_message = db.Column(db.Text)
+
+    __table_args__ = (
+        db.Index('ix_sync_job_type_status', 'job_type', 'status'),
+    )
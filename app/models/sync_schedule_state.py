@@ -0,0 +1,8 @@
+from app_factory import db
+
+class SyncScheduleState(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    job_type = db.Column(db.String(20), unique=True, nullable=False)  # ชนิดงานใน job_runner.JOB_FUNCTIONS
+    next_run_at = db.Column(db.DateTime)
+    last_run_at = db.Column(db.DateTime)
+    last_job_id = db.Column(db.Integer)
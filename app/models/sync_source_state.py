@@ -0,0 +1,10 @@
+from app_factory import db, get_asia_bangkok_time
+
+class SyncSourceState(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    source = db.Column(db.String(20), unique=True, nullable=False)  # แหล่งข้อมูล เช่น 'myhr'
+    etag = db.Column(db.String(255))  # ETag ของหน้าแรกจากรอบที่สำเร็จล่าสุด ส่งกลับเป็น If-None-Match
+    last_modified = db.Column(db.String(64))  # Last-Modified ตามที่ server ส่งมา ส่งกลับเป็น If-Modified-Since
+    watermark = db.Column(db.String(255))  # จุดล่าสุดที่ดึงมาแล้ว (timestamp หรือ change token) สำหรับดึงเฉพาะที่เปลี่ยน
+    last_full_sync_at = db.Column(db.DateTime)  # เวลาที่ดึงข้อมูลทั้งหมดสำเร็จครั้งล่าสุด
+    updated_at = db.Column(db.DateTime, default=get_asia_bangkok_time, onupdate=get_asia_bangkok_time)
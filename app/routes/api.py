@@ -1,37 +1,103 @@
-from flask import Blueprint, jsonify
+import socket
+from flask import Blueprint, Response, jsonify, current_app, request, url_for
 from flask_login import login_required
-from app.services import myhr_service, ftp_service, ad_service
+from ldap3.core.exceptions import LDAPException
+from app_factory import db
+from app.models.sync_job import SyncJob
+from app.services import ad_plan, employee_query, job_runner
 
 bp = Blueprint('api', __name__)
 
+def _start_job(job_type):
+    """
+    Queue a sync job and return its ID immediately; the sync runs in the background.
+    A conflicting queued or running job is returned instead (already_running);
+    see job_runner.submit_job for how that holds across processes.
+    """
+    job, created = job_runner.submit_job(current_app._get_current_object(), job_type)
+    return jsonify({
+        'success': True,
+        'job_id': job.id,
+        'status': job.status,
+        'already_running': not created,
+        'message': f'{job_type.upper()} sync queued.' if created else f'{job.job_type.upper()} sync is already running.'
+    }), 202
+
 @bp.route('/sync/myhr', methods=['POST'])
 @login_required
 def sync_myhr():
-    success = myhr_service.fetch_employees_from_api()
-    return jsonify({'success': success, 'message': 'MyHR API sync completed.'})
+    # ?full=true ดึงข้อมูลทั้งหมดแทนการดึงเฉพาะที่เปลี่ยน
+    full = request.args.get('full', '').lower() in ('true', '1')
+    return _start_job('myhr_full' if full else 'myhr')
 
 @bp.route('/sync/ftp', methods=['POST'])
 @login_required
 def sync_ftp():
-    success = ftp_service.fetch_employees_from_ftp()
-    return jsonify({'success': success, 'message': 'FTP sync completed.'})
+    return _start_job('ftp')
 
 @bp.route('/sync/ad', methods=['POST'])
 @login_required
 def sync_ad():
-    result = ad_service.update_active_directory()
-    return jsonify(result)
+    return _start_job('ad')
 
 @bp.route('/sync/all', methods=['POST'])
 @login_required
 def sync_all():
-    myhr_success = myhr_service.fetch_employees_from_api()
-    ftp_success = ftp_service.fetch_employees_from_ftp()
-    ad_success = ad_service.update_active_directory()
-    
+    return _start_job('all')
+
+@bp.route('/ad/plan')
+@login_required
+def plan_ad():
+    """
+    Dry run of the AD sync: the summary as JSON, or the full diff with format=csv.
+    scope=pending (default) plans the next sync, scope=all checks every employee.
+    """
+    scope = request.args.get('scope', 'pending')
+    export_format = request.args.get('format', 'json').lower()
+    if export_format not in ('json', 'csv'):
+        return jsonify({'success': False, 'error': f"Unsupported format: {export_format}"}), 400
+    try:
+        plan = ad_plan.build_ad_plan(scope)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except (LDAPException, socket.error) as e:
+        return jsonify({'success': False, 'error': f"AD Error: {e}"}), 502
+
+    if export_format == 'csv':
+        response = Response(ad_plan.plan_rows_to_csv(plan['rows']), mimetype='text/csv; charset=utf-8')
+        response.headers['Content-Disposition'] = f'attachment; filename=ad_plan_{scope}.csv'
+        return response
     return jsonify({
-        'myhr_success': myhr_success,
-        'ftp_success': ftp_success,
-        'ad_success': ad_success,
-        'message': 'Full sync process completed.'
-    })
\ No newline at end of file
+        'success': True,
+        'summary': plan['summary'],
+        'diff_url': url_for('api.plan_ad', scope=scope, format='csv')
+    })
+
+@bp.route('/jobs/<int:job_id>')
+@login_required
+def job_status(job_id):
+    job = db.get_or_404(SyncJob, job_id)
+    return jsonify(job_runner.job_to_dict(job))
+
+
+@bp.route('/employees')
+@login_required
+def list_employees():
+    """
+    Paginated employee list for the dashboard table; pass next_cursor back as cursor.
+    """
+    try:
+        filters = employee_query.parse_employee_filters(request.args)
+        limit = request.args.get('limit', type=int)
+        page = employee_query.get_employee_page(filters, cursor=request.args.get('cursor') or None, limit=limit)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    page['success'] = True
+    return jsonify(page)
+
+@bp.route('/employees/filters')
+@login_required
+def employee_filter_options():
+    options = employee_query.list_filter_options()
+    options['success'] = True
+    return jsonify(options)
@@ -1,8 +1,13 @@
-from flask import Blueprint, render_template, jsonify
+import hmac
+import json
+from flask import Blueprint, Response, abort, render_template, jsonify, request, stream_with_context
 from flask_login import login_required
 from app_factory import db
-from app.models.employee import Employee
 from app.models.sync_history import SyncHistory
+from app.models.sync_item_result import OUTCOMES
+from app.services import employee_export, employee_query, retention, sync_results
+from app.utils.metrics import render_metrics
+from config import Config
 
 bp = Blueprint('main', __name__)
 
@@ -10,44 +15,75 @@ bp = Blueprint('main', __name__)
 @bp.route('/dashboard')
 @login_required
 def dashboard():
-    # ดึงข้อมูลพนักงานทั้งหมดจากฐานข้อมูล
-    all_employees = Employee.query.order_by(Employee.lname).all()
-    
+    # ตารางพนักงานโหลดทีละหน้าผ่าน /api/employees จึงไม่ต้องดึงข้อมูลทั้งหมดที่นี่
     # ดึงประวัติการ Sync 10 รายการล่าสุด
     recent_syncs = SyncHistory.query.order_by(SyncHistory.start_time.desc()).limit(4).all()
     
+    # สถิติรายวันจากตาราง rollup
+    daily_stats = retention.recent_daily_stats()
+    
     # ส่งข้อมูลไปยัง template
-    return render_template('dashboard.html', employees=all_employees, sync_history=recent_syncs)
+    return render_template('dashboard.html', sync_history=recent_syncs, daily_stats=daily_stats)
 
 @bp.route('/sync/<int:sync_id>/details')
 @login_required
 def sync_details(sync_id):
     sync_record = SyncHistory.query.get_or_404(sync_id)
+    outcome = request.args.get('outcome') or None
+    if outcome not in OUTCOMES:
+        outcome = None
+
+    # รอบ sync ใหม่เก็บผลรายคนในตาราง SyncItemResult ส่วนรอบเก่ายังเก็บเป็น JSON ใน details
+    counts = sync_results.outcome_counts(sync_id)
+    items, names = None, {}
+    if any(counts.values()):
+        items, names = sync_results.item_results_page(sync_id, outcome, page=request.args.get('page', 1, type=int))
+
     details = []
-    if sync_record.details:
+    if items is None and sync_record.details:
         try:
-            import json
             details = json.loads(sync_record.details)
         except json.JSONDecodeError:
             details = [sync_record.details] # ถ้าไม่ใช่ JSON ให้ใส่ใน list
     
-    return render_template('sync_details.html', sync=sync_record, details=details)
+    return render_template('sync_details.html', sync=sync_record, details=details,
+                           items=items, names=names, counts=counts, outcome=outcome)
 
 @bp.route('/employees')
 @login_required
 def employees():
-    all_employees = Employee.query.all()
-    employees_data = [
-        {
-            'employee_id': emp.employee_id,
-            'fname': emp.fname,
-            'lname': emp.lname,
-            'phone': emp.phone,
-            'department': emp.department,
-            'position': emp.position,
-            'start_date': emp.start_date.strftime('%Y-%m-%d') if emp.start_date else None,
-            'status': emp.status,
-            'ad_updated': emp.ad_updated
-        } for emp in all_employees
-    ]
-    return jsonify(employees_data)
\ No newline at end of file
+    """
+    Stream the employee table as JSON (default), NDJSON or CSV.
+    Optional query parameters: format, columns (comma separated) and the
+    filters of /api/employees.
+    """
+    export_format = request.args.get('format', 'json').lower()
+    if export_format not in employee_export.EXPORT_FORMATS:
+        return jsonify({'success': False, 'error': f"Unsupported format: {export_format}"}), 400
+    try:
+        columns = employee_export.parse_export_columns(request.args.get('columns'))
+        filters = employee_query.parse_employee_filters(request.args)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+
+    response = Response(
+        stream_with_context(employee_export.generate_export(columns, export_format, filters)),
+        mimetype=employee_export.EXPORT_FORMATS[export_format]
+    )
+    if export_format == 'csv':
+        response.headers['Content-Disposition'] = 'attachment; filename=employees.csv'
+    return response
+
+@bp.route('/metrics')
+def metrics():
+    """
+    Prometheus scrape endpoint. No login session; the scraper must send
+    METRICS_TOKEN as a bearer token. Without a configured token the endpoint
+    does not exist (404), so metrics are never exposed unauthenticated.
+    """
+    token = getattr(Config, 'METRICS_TOKEN', None)
+    if not token:
+        abort(404)
+    if not hmac.compare_digest(request.headers.get('Authorization', ''), f"Bearer {token}"):
+        abort(401)
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,130 @@
+import csv
+import io
+import logging
+from collections import Counter
+from sqlalchemy import false, select
+from app_factory import db, get_asia_bangkok_time
+from app.models.employee import Employee
+from app.services.ad_service import get_current_time_gmt7, load_ad_identities, load_ad_index, plan_ad_changes
+from app.services.ldap_pool import get_ad_pool
+from app.utils.date_utils import account_expires_date
+
+logger = logging.getLogger(__name__)
+
+# pending = พนักงานที่รอซิงค์ (เหมือน update_active_directory), all = ตรวจพนักงานทุกคนกับ AD
+PLAN_SCOPES = ('pending', 'all')
+
+PLAN_CSV_COLUMNS = ('employee_id', 'fname', 'lname', 'dn', 'action', 'attribute', 'current_value', 'planned_value',
+                    'current_expires_on', 'planned_expires_on')
+
+# คอลัมน์ที่ใช้คำนวณค่าใน AD (ดูจาก build_desired_ad_attributes และ resolve_ad_user)
+_PLAN_COLUMNS = (
+    Employee.employee_id,
+    Employee.fname,
+    Employee.lname,
+    Employee.phone,
+    Employee.department,
+    Employee.position,
+    Employee.resigndate,
+)
+
+def _load_employees(scope):
+    statement = select(*_PLAN_COLUMNS).order_by(Employee.id)
+    if scope == 'pending':
+        statement = statement.where(Employee.ad_updated == false())
+    return db.session.execute(statement).all()
+
+def _change_action(attribute, current, planned):
+    if attribute == 'userAccountControl':
+        was_disabled = bool(int(current or 0) & 0x0002)
+        return 'enable' if was_disabled and not int(planned) & 0x0002 else 'disable'
+    if attribute == 'accountExpires':
+        return 'expiry'
+    return 'update'
+
+def _expires_on(value):
+    expires_on = account_expires_date(value)
+    return expires_on.isoformat() if expires_on else None
+
+def build_ad_plan(scope='pending'):
+    """
+    Compute the full AD change set without writing anything: the AD users are
+    loaded as in the sync (load_ad_index), then every employee in scope goes through the same
+    planning step as update_active_directory. No modify is sent and no
+    ad_updated flag changes.
+
+    :return: dict with 'summary' (counts) and 'rows' (one row per changed
+             attribute or missing user, keyed by PLAN_CSV_COLUMNS)
+    """
+    if scope not in PLAN_SCOPES:
+        raise ValueError(f"Invalid scope: {scope} (expected one of {', '.join(PLAN_SCOPES)})")
+
+    employees = _load_employees(scope)
+    pool = get_ad_pool()
+    conn = pool.acquire()
+    healthy = False
+    try:
+        identities = load_ad_identities(employee.employee_id for employee in employees)
+        ad_index = load_ad_index(conn, employees, identities)
+        planned, pending_changes, _ = plan_ad_changes(employees, ad_index, get_current_time_gmt7().date(), identities)
+        healthy = True
+    finally:
+        pool.release(conn, discard=not healthy)
+
+    actions = Counter()
+    attributes = Counter()
+    rows = []
+    not_found = unchanged = 0
+    for employee, ad_user, changes, previous in planned:
+        base = {'employee_id': employee.employee_id, 'fname': employee.fname, 'lname': employee.lname}
+        if ad_user is None:
+            not_found += 1
+            rows.append(dict(base, dn=None, action='not_found', attribute=None, current_value=None, planned_value=None))
+            continue
+        if not changes:
+            unchanged += 1
+            continue
+        employee_actions = set()
+        for attribute, [(_, [planned_value])] in changes.items():
+            action = _change_action(attribute, previous[attribute], planned_value)
+            employee_actions.add(action)
+            attributes[attribute] += 1
+            row = dict(base, dn=ad_user['dn'], action=action, attribute=attribute,
+                       current_value=previous[attribute], planned_value=planned_value)
+            if attribute == 'accountExpires':
+                # วันสุดท้ายที่บัญชียังใช้งานได้ อ่านง่ายกว่าค่า FILETIME
+                row['current_expires_on'] = _expires_on(previous[attribute])
+                row['planned_expires_on'] = _expires_on(planned_value)
+            rows.append(row)
+        actions.update(employee_actions)
+
+    summary = {
+        'scope': scope,
+        'generated_at': get_asia_bangkok_time().strftime('%Y-%m-%d %H:%M:%S'),
+        'employees_considered': len(planned),
+        'employees_changed': len(planned) - not_found - unchanged,
+        'modifies': len(pending_changes),
+        'not_found': not_found,
+        'unchanged': unchanged,
+        'disable': actions['disable'],
+        'enable': actions['enable'],
+        'expiry_changed': actions['expiry'],
+        'attributes': dict(sorted(attributes.items())),
+    }
+    logger.info(f"AD plan ({scope}): {summary}")
+    return {'summary': summary, 'rows': rows}
+
+def plan_rows_to_csv(rows):
+    """
+    Yield the plan rows as CSV text with a header line.
+    """
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=PLAN_CSV_COLUMNS)
+    writer.writeheader()
+    for row in rows:
+        writer.writerow(row)
+        if buffer.tell() > 64 * 1024:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
@@ -1,162 +1,490 @@
 import json
 import socket
-import time
 import logging
+import time
+import uuid
 from app.models.sync_history import SyncHistory
-from ldap3 import Server, Connection, ALL, MODIFY_REPLACE
+from ldap3 import BASE, SUBTREE, MODIFY_REPLACE
+from sqlalchemy import false, insert
 from ldap3.core.exceptions import LDAPException
+from ldap3.utils.conv import escape_bytes, escape_filter_chars
 from app_factory import db, get_asia_bangkok_time
 from app.models.employee import Employee
+from app.models.ad_sync_state import ADSyncState
+from app.models.ad_identity import ADIdentity
+from app.services.ad_writer import apply_ad_modifies
+from app.services.ldap_pool import get_ad_pool
+from app.services.sync_results import item_result, record_item_results
+from app.services.job_runner import report_progress, progress_counter
+from app.utils.date_utils import account_expires_filetime, get_current_time_gmt7, parse_account_expires
+from app.utils.metrics import AD_USER_MATCHES, LDAP_OPERATION_SECONDS, PhaseTimer, record_error
 from app.utils.network_diagnostics import troubleshoot_ad_connection
 from config import Config
-from datetime import datetime, timezone, timedelta
 
 # Configure logging for AD service
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def convert_ce_to_ad_filetime(year_ce, month, day, hour, minute, second, timezone_offset_hours):
+# Attributes read from AD for every user the sync touches
+AD_USER_ATTRIBUTES = [
+    'distinguishedName',
+    'userAccountControl',
+    'givenName',
+    'sn',
+    'employeeID',
+    'telephoneNumber',
+    'department',
+    'title',
+    'accountExpires',
+    'objectGUID',
+]
+
+def _normalize_name(value):
     """
-    แปลงวันที่เวลาในรูปแบบ ค.ศ. และ Time Zone Offset เป็นค่า accountExpires (FILETIME) ของ AD
-    
-    :param year_ce: ปี ค.ศ. (เช่น 2025)
-    :param month: เดือน (1-12)
-    :param day: วันที่ (1-31)
-    :param hour: ชั่วโมง (0-23)
-    :param minute: นาที (0-59)
-    :param second: วินาที (0-59)
-    :param timezone_offset_hours: ผลต่างเขตเวลาจาก UTC (เช่น +7 สำหรับ GMT+7)
-    :return: ค่า Long Integer ของ accountExpires (FILETIME)
+    Normalize a name the way AD's caseIgnoreString matching does:
+    case-insensitive, with leading/trailing and repeated spaces collapsed.
     """
-    
-    # --- 1. กำหนดค่าคงที่ ---
-    WINDOWS_EPOCH = datetime(1601, 1, 1, tzinfo=timezone.utc)
-    HNS_PER_SECOND = 10000000 # 100-nanosecond intervals ต่อ 1 วินาที
+    return ' '.join(str(value).split()).casefold()
+
+def _name_key(given_name, surname):
+    """
+    Build the (givenName, sn) lookup key used by the prefetched user index.
+    Returns None when either part is missing, since such a pair never matches.
+    """
+    if given_name is None or surname is None:
+        return None
+    key = (_normalize_name(given_name), _normalize_name(surname))
+    if not key[0] or not key[1]:
+        return None
+    return key
+
+def _entry_to_ad_user(entry):
+    """
+    Convert a raw ldap3 search result entry into a plain dict of attribute values.
+    Raw values are decoded directly so the result does not depend on schema info.
+    """
+    raw_attributes = entry.get('raw_attributes', {})
+    ad_user = {'dn': entry.get('dn')}
+    for attribute in AD_USER_ATTRIBUTES:
+        values = raw_attributes.get(attribute) or []
+        if attribute == 'objectGUID':
+            # objectGUID เป็น binary 16 bytes เก็บเป็นรูปแบบ GUID มาตรฐานของ AD
+            ad_user[attribute] = str(uuid.UUID(bytes_le=values[0])) if values else None
+        else:
+            ad_user[attribute] = values[0].decode('utf-8') if values else None
+    if not ad_user['dn']:
+        ad_user['dn'] = ad_user['distinguishedName']
+    ad_user['userAccountControl'] = int(ad_user['userAccountControl'] or 0)
+    return ad_user
+
+def _new_ad_index():
+    return {'by_guid': {}, 'by_employee_id': {}, 'by_name': {}}
+
+def _index_ad_user(ad_index, ad_user):
+    key = _name_key(ad_user['givenName'], ad_user['sn'])
+    if key is not None:
+        ad_index['by_name'].setdefault(key, ad_user)
+    if ad_user['employeeID']:
+        ad_index['by_employee_id'].setdefault(ad_user['employeeID'], ad_user)
+    if ad_user['objectGUID']:
+        ad_index['by_guid'][ad_user['objectGUID']] = ad_user
+
+def prefetch_ad_users(conn):
+    """
+    Load every user under AD_BASE_DN with a single paged subtree search and
+    index them by objectGUID, by employeeID and by normalized (givenName, sn).
+
+    The first entry returned for a name wins, which mirrors the per-row
+    search that always took conn.entries[0].
+    """
+    page_size = getattr(Config, 'AD_SEARCH_PAGE_SIZE', 1000)
+    ad_index = _new_ad_index()
+
+    entries = conn.extend.standard.paged_search(
+        search_base=Config.AD_BASE_DN,
+        search_filter='(objectClass=user)',
+        search_scope=SUBTREE,
+        attributes=AD_USER_ATTRIBUTES,
+        paged_size=page_size,
+        generator=True
+    )
+    user_count = 0
+    started = time.perf_counter()
+    for entry in entries:
+        if entry.get('type') != 'searchResEntry':
+            continue
+        _index_ad_user(ad_index, _entry_to_ad_user(entry))
+        user_count += 1
+
+    LDAP_OPERATION_SECONDS.observe(time.perf_counter() - started, operation='paged_search')
+    logger.info(f"Prefetched {user_count} AD users ({len(ad_index['by_name'])} distinct names)")
+    return ad_index
+
+def _search_ad_users_batched(conn, ad_index, clauses, seen_dns):
+    """
+    Run one search per AD_LOOKUP_BATCH_SIZE filter clauses (OR-ed together) and
+    add the users found to ad_index. Returns the number of new users.
+    """
+    batch_size = max(1, getattr(Config, 'AD_LOOKUP_BATCH_SIZE', 100))
+    user_count = 0
+    for start in range(0, len(clauses), batch_size):
+        entries = conn.extend.standard.paged_search(
+            search_base=Config.AD_BASE_DN,
+            search_filter=f"(&(objectClass=user)(|{''.join(clauses[start:start + batch_size])}))",
+            search_scope=SUBTREE,
+            attributes=AD_USER_ATTRIBUTES,
+            paged_size=getattr(Config, 'AD_SEARCH_PAGE_SIZE', 1000),
+            generator=True
+        )
+        for entry in entries:
+            if entry.get('type') != 'searchResEntry':
+                continue
+            ad_user = _entry_to_ad_user(entry)
+            # ผู้ใช้คนเดียวกันต้องเป็น dict เดียวกัน เพราะ plan_ad_changes แก้ค่าใน index
+            if ad_user['dn'] in seen_dns:
+                continue
+            seen_dns.add(ad_user['dn'])
+            _index_ad_user(ad_index, ad_user)
+            user_count += 1
+    return user_count
+
+def lookup_ad_users(conn, employees, identities):
+    """
+    Load only the AD users for the given employees instead of the whole
+    directory. The first pass searches by objectGUID (from the identity map)
+    and employeeID, which the DC indexes; only employees still unresolved are
+    searched by givenName and sn in a second pass. Both passes OR together
+    AD_LOOKUP_BATCH_SIZE values per search.
+    """
+    ad_index = _new_ad_index()
+    seen_dns = set()
+    clauses = []
+    for employee in employees:
+        if not employee.employee_id:
+            continue
+        identity = identities.get(employee.employee_id)
+        if identity is not None and identity.object_guid:
+            clauses.append(f"(objectGUID={escape_bytes(uuid.UUID(identity.object_guid).bytes_le)})")
+        clauses.append(f"(employeeID={escape_filter_chars(employee.employee_id)})")
+
+    started = time.perf_counter()
+    user_count = _search_ad_users_batched(conn, ad_index, clauses, seen_dns)
+    LDAP_OPERATION_SECONDS.observe(time.perf_counter() - started, operation='identity_search')
+
+    name_clauses = []
+    for employee in employees:
+        identity = identities.get(employee.employee_id) if employee.employee_id else None
+        if (identity is not None and identity.object_guid in ad_index['by_guid']) or \
+                employee.employee_id in ad_index['by_employee_id']:
+            continue
+        key = _name_key(employee.fname, employee.lname)
+        if key is not None:
+            given_name = escape_filter_chars(' '.join(str(employee.fname).split()))
+            surname = escape_filter_chars(' '.join(str(employee.lname).split()))
+            name_clauses.append(f"(&(givenName={given_name})(sn={surname}))")
+
+    if name_clauses:
+        started = time.perf_counter()
+        user_count += _search_ad_users_batched(conn, ad_index, name_clauses, seen_dns)
+        LDAP_OPERATION_SECONDS.observe(time.perf_counter() - started, operation='search')
+    logger.info(f"Looked up {len(employees)} employees ({len(name_clauses)} by name): {user_count} AD users found")
+    return ad_index
+
+def load_ad_index(conn, employees, identities):
+    """
+    Index the AD users needed to resolve employees. Runs with at least
+    AD_PREFETCH_MIN_EMPLOYEES employees load the whole directory with one paged
+    search; smaller runs (the steady state) only look up their own users.
+    Returns None when there is nobody to resolve.
+    """
+    if not employees:
+        return None
+    if getattr(Config, 'AD_PREFETCH_USERS', True) and len(employees) >= getattr(Config, 'AD_PREFETCH_MIN_EMPLOYEES', 200):
+        return prefetch_ad_users(conn)
+    return lookup_ad_users(conn, employees, identities)
+
+def load_ad_identities(employee_ids):
+    """
+    Load the identity map rows for the given employee IDs, keyed by employee_id.
+    """
+    employee_ids = [employee_id for employee_id in set(employee_ids) if employee_id]
+    identities = {}
+    chunk_size = 500
+    for start in range(0, len(employee_ids), chunk_size):
+        chunk = employee_ids[start:start + chunk_size]
+        for identity in ADIdentity.query.filter(ADIdentity.employee_id.in_(chunk)):
+            identities[identity.employee_id] = identity
+    return identities
+
+def resolve_ad_user(employee, ad_index, identities=None):
+    """
+    Resolve an employee to an AD user in ad_index (from load_ad_index): by the
+    objectGUID stored in the identity map, then by employeeID, and only then
+    by givenName and sn. A name match whose employeeID belongs to another
+    employee is rejected (a namesake, not this person).
+
+    :return: (ad_user, method) with method 'guid', 'employee_id' or 'name',
+             or (None, None) when no AD user matches
+    """
+    identity = identities.get(employee.employee_id) if identities and employee.employee_id else None
+    if identity is not None and identity.object_guid:
+        ad_user = ad_index['by_guid'].get(identity.object_guid)
+        if ad_user is not None:
+            return ad_user, 'guid'
+    if employee.employee_id:
+        ad_user = ad_index['by_employee_id'].get(employee.employee_id)
+        if ad_user is not None:
+            return ad_user, 'employee_id'
+    key = _name_key(employee.fname, employee.lname)
+    if key is None:
+        return None, None
+    ad_user = ad_index['by_name'].get(key)
 
-    # --- 2. กำหนดวันที่เป้าหมาย (Local Time) ---
-    # สร้างวัตถุ datetime จาก ค.ศ. ที่ป้อน
-    local_time = datetime(year_ce, month, day, hour, minute, second)
+    if ad_user is None:
+        return None, None
+    if employee.employee_id and ad_user['employeeID'] and ad_user['employeeID'] != employee.employee_id:
+        logger.warning(f"AD user {ad_user['dn']} matches the name of {employee.employee_id} "
+                       f"but belongs to employee {ad_user['employeeID']}")
+        return None, None
+    return ad_user, 'name'
+
+def remember_ad_identity(identities, employee, ad_user):
+    """
+    Refresh the employee's identity map row after a successful match.
+    Returns a row for record_ad_identities() when the employee is mapped for
+    the first time, otherwise None.
+    """
+    if not employee.employee_id:
+        return None
+    identity = identities.get(employee.employee_id)
+    if identity is None:
+        return {'employee_id': employee.employee_id, 'object_guid': ad_user['objectGUID'], 'dn': ad_user['dn']}
+    if identity.object_guid != ad_user['objectGUID'] or identity.dn != ad_user['dn']:
+        # ผู้ใช้ถูกย้าย OU หรือถูกสร้างใหม่ใน AD
+        identity.object_guid = ad_user['objectGUID']
+        identity.dn = ad_user['dn']
+        db.session.add(identity)
+    return None
+
+def record_ad_identities(rows):
+    """
+    Bulk insert new identity map rows; the caller commits.
+    """
+    chunk_size = getattr(Config, 'INGEST_CHUNK_SIZE', 1000)
+    for start in range(0, len(rows), chunk_size):
+        db.session.execute(insert(ADIdentity), rows[start:start + chunk_size])
+
+def build_desired_ad_attributes(employee, uac, current_date):
+    """
+    Compute the attribute values AD should hold for an employee.
+    userAccountControl is only included when the disabled flag has to flip.
+    """
+    desired = {}
     
-    # --- 3. แปลงเวลาท้องถิ่นเป็น UTC ---
-    # ต้องลบ Time Zone Offset ออกเพื่อให้ได้เวลา UTC ที่แท้จริง
-    tz_offset = timedelta(hours=timezone_offset_hours)
-    utc_time = local_time - tz_offset
+    # อัพเดต employee ID ถ้ามี
+    if employee.employee_id:
+        desired['employeeID'] = employee.employee_id
     
-    # --- 4. คำนวณค่า FILETIME ---
-    # คำนวณระยะเวลา (timedelta) ตั้งแต่ 1601 UTC ถึงวันที่หมดอายุ UTC
-    # .replace(tzinfo=timezone.utc) เพื่อให้ Python รู้ว่าเรากำลังทำงานกับ UTC Time
-    time_difference = utc_time.replace(tzinfo=timezone.utc) - WINDOWS_EPOCH
+    # อัพเดตข้อมูลทั่วไป
+    if employee.phone:
+        desired['telephoneNumber'] = employee.phone
+    if employee.department:
+        desired['department'] = employee.department
+    if employee.position:
+        desired['title'] = employee.position
     
-    # แปลงเป็นช่วงเวลา 100-nanosecond intervals
-    accountExpires_value = int(time_difference.total_seconds() * HNS_PER_SECOND)
+    # จัดการการปิดใช้งานบัญชี - ตรวจสอบเฉพาะเมื่อมีวันที่ลาออกจริง
+    if employee.resigndate:
+        if employee.resigndate <= current_date:
+            # ถ้าวันที่ลาออกผ่านไปแล้ว ให้ปิดใช้งานบัญชี
+            if not (uac & 0x0002):
+                desired['userAccountControl'] = str(uac | 0x0002)
+        else:
+            # ถ้าวันที่ลาออกยังไม่ถึง ให้เปิดใช้งานบัญชีแต่ตั้งวันหมดอายุ
+            if uac & 0x0002:
+                desired['userAccountControl'] = str(uac & ~0x0002)
+        
+        # กำหนดวันที่หมดอายุของบัญชีตามวันที่ลาออก
+        desired['accountExpires'] = account_expires_filetime(employee.resigndate)
+    else:
+        # ถ้าพนักงานยังทำงานอยู่ (ไม่มีวันที่ลาออก) ให้เปิดใช้งานบัญชี
+        if uac & 0x0002:
+            desired['userAccountControl'] = str(uac & ~0x0002)
+        
+        # ตั้งค่า accountExpires เป็น 0 หมายถึงไม่มีวันหมดอายุ
+        desired['accountExpires'] = "0"
     
-    return accountExpires_value
+    return desired
 
-def get_current_time_gmt7():
+def _same_ad_value(attribute, current, desired):
     """
-    ฟังก์ชันนี้ใช้สำหรับดึงเวลาปัจจุบันในเขตเวลา GMT+7 (UTC+7)
-    :return: datetime object ของเวลาปัจจุบันในเขตเวลา GMT+7
+    Compare an AD attribute value with the value the sync wants to write.
     """
-    # ดึงเวลา UTC ปัจจุบัน
-    utc_now = datetime.now(timezone.utc)
-    
-    # แปลงเป็นเวลา GMT+7 โดยการบวก 7 ชั่วโมง
-    gmt7_offset = timedelta(hours=7)
-    gmt7_now = utc_now + gmt7_offset
-    
-    # คืนค่าเป็น datetime โดยไม่รวม timezone information
-    return gmt7_now.replace(tzinfo=None)
+    if current is None:
+        return False
+    if attribute == 'accountExpires':
+        # AD ใช้ได้ทั้ง 0 และ 0x7FFFFFFFFFFFFFFF แทน "ไม่มีวันหมดอายุ"
+        current = parse_account_expires(current)
+        return current is not None and current == parse_account_expires(desired)
+    return str(current) == desired
 
-def test_ad_server_connectivity(server_host, port=389, timeout=10):
+def diff_ad_attributes(ad_user, desired):
     """
-    Test basic TCP connectivity to AD server
+    Build the minimal ldap3 change set between the current AD values and the desired ones.
+    Returns (changes, unchanged_attributes).
     """
-    try:
-        logger.info(f"Testing connectivity to AD server {server_host}:{port}")
-        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        sock.settimeout(timeout)
-        result = sock.connect_ex((server_host, port))
-        sock.close()
-        
-        if result == 0:
-            logger.info(f"Successfully connected to {server_host}:{port}")
-            return True
+    changes = {}
+    unchanged_attributes = []
+    for attribute, value in desired.items():
+        if _same_ad_value(attribute, ad_user.get(attribute), value):
+            unchanged_attributes.append(attribute)
         else:
-            logger.error(f"Failed to connect to {server_host}:{port} - Error code: {result}")
-            return False
-    except socket.error as e:
-        logger.error(f"Socket error when testing connectivity to {server_host}:{port}: {e}")
-        return False
-    except Exception as e:
-        logger.error(f"Unexpected error when testing connectivity to {server_host}:{port}: {e}")
-        return False
+            changes[attribute] = [(MODIFY_REPLACE, [value])]
+    return changes, unchanged_attributes
 
-def create_ad_connection_with_retry():
+def plan_ad_changes(employees, ad_index, current_date, identities=None):
     """
-    Create AD connection with retry mechanism and proper timeout settings
+    Resolve each employee to an AD user and compute the changes the sync would
+    write, without modifying AD. Changes to the same DN are merged into one
+    modify, and the indexed AD values are moved to the planned ones so a later
+    employee mapped to the same user is diffed against the result.
+
+    :return: (planned, pending_changes, attribute_writes_skipped); planned is a
+             list of (employee, ad_user, changes, previous_values) in input order
+             and pending_changes maps DN to the merged ldap3 change set
     """
-    server_host = Config.AD_SERVER
-    server_port = getattr(Config, 'AD_PORT', 389)  # Default LDAP port
-    max_retries = getattr(Config, 'AD_MAX_RETRIES', 3)
-    retry_delay = getattr(Config, 'AD_RETRY_DELAY', 5)
-    connection_timeout = getattr(Config, 'AD_CONNECTION_TIMEOUT', 30)
-    read_timeout = getattr(Config, 'AD_READ_TIMEOUT', 30)
-    use_ssl = getattr(Config, 'AD_USE_SSL', False)
-    
-    # Test basic connectivity first
-    if not test_ad_server_connectivity(server_host, server_port):
-        raise Exception(f"Cannot establish basic TCP connection to AD server {server_host}:{server_port}")
-    
-    for attempt in range(max_retries):
-        try:
-            logger.info(f"Attempting AD connection (attempt {attempt + 1}/{max_retries})")
-            
-            # Create server with timeout settings
-            server = Server(
-                server_host,
-                port=server_port,
-                get_info=ALL,
-                connect_timeout=connection_timeout,
-                use_ssl=use_ssl
-            )
-            
-            user = f"{Config.AD_USER}@{Config.AD_DOMAIN}"
-            
-            # Create connection with explicit timeout
-            conn = Connection(
-                server,
-                user=user,
-                password=Config.AD_PASSWORD,
-                auto_bind=True,
-                client_strategy='SYNC',
-                receive_timeout=read_timeout,
-                raise_exceptions=True
-            )
-            
-            logger.info(f"Successfully connected to AD server {server_host}")
-            return conn
-            
-        except LDAPException as e:
-            logger.error(f"LDAP error on attempt {attempt + 1}: {e}")
-            if attempt < max_retries - 1:
-                logger.info(f"Retrying in {retry_delay} seconds...")
-                time.sleep(retry_delay)
-            else:
-                raise Exception(f"Failed to connect to AD after {max_retries} attempts: {e}")
-        except socket.timeout as e:
-            logger.error(f"Socket timeout on attempt {attempt + 1}: {e}")
-            if attempt < max_retries - 1:
-                logger.info(f"Retrying in {retry_delay} seconds...")
-                time.sleep(retry_delay)
-            else:
-                raise Exception(f"Connection timeout to AD server after {max_retries} attempts: {e}")
-        except Exception as e:
-            logger.error(f"Unexpected error on attempt {attempt + 1}: {e}")
-            if attempt < max_retries - 1:
-                logger.info(f"Retrying in {retry_delay} seconds...")
-                time.sleep(retry_delay)
-            else:
-                raise Exception(f"Failed to connect to AD after {max_retries} attempts: {e}")
+    planned = []
+    pending_changes = {}
+    attribute_writes_skipped = 0
+    for employee in employees:
+        # ค้นหาผู้ใช้ใน AD จาก identity map / employeeID ก่อน แล้วจึงใช้ fname และ lname
+        ad_user, method = resolve_ad_user(employee, ad_index, identities)
+        AD_USER_MATCHES.inc(method=method or 'not_found')
+        changes = None
+        previous = None
+
+        if ad_user:
+            desired = build_desired_ad_attributes(employee, ad_user['userAccountControl'], current_date)
+
+            # ส่งเฉพาะค่าที่ต่างจากที่มีอยู่ใน AD
+            changes, unchanged_attributes = diff_ad_attributes(ad_user, desired)
+            attribute_writes_skipped += len(unchanged_attributes)
+
+            if changes:
+                previous = {attribute: ad_user.get(attribute) for attribute in changes}
+                # ให้ข้อมูลใน index ตรงกับค่าใหม่ที่จะเขียนลง AD
+                ad_user.update(desired)
+                ad_user['userAccountControl'] = int(ad_user['userAccountControl'])
+                # รวมการเปลี่ยนแปลงของ DN เดียวกันไว้ใน modify เดียว เพื่อไม่ให้เขียนชนกัน
+                pending_changes.setdefault(ad_user['dn'], {}).update(changes)
+
+        planned.append((employee, ad_user, changes, previous))
+    return planned, pending_changes, attribute_writes_skipped
+
+def read_directory_usn(conn):
+    """
+    Read highestCommittedUSN and dnsHostName from the rootDSE of the DC behind conn.
+    Returns (server_name, highest_usn), or (None, None) when the DC does not expose them.
+    """
+    try:
+        conn.search(search_base='', search_filter='(objectClass=*)', search_scope=BASE,
+                    attributes=['highestCommittedUSN', 'dnsHostName'])
+    except LDAPException as e:
+        logger.warning(f"Could not read rootDSE for incremental sync: {e}")
+        return None, None
+
+    for entry in conn.response or []:
+        if entry.get('type') != 'searchResEntry':
+            continue
+        raw_attributes = entry.get('raw_attributes', {})
+        usn_values = raw_attributes.get('highestCommittedUSN') or []
+        host_values = raw_attributes.get('dnsHostName') or []
+        if not usn_values:
+            break
+        server_name = host_values[0].decode('utf-8') if host_values else Config.AD_SERVER
+        return server_name, int(usn_values[0])
+    return None, None
+
+def reconcile_ad_changes(conn, current_date, log_messages, item_results=None):
+    """
+    Fetch the AD users whose uSNChanged moved since the last run on this DC and
+    flag employees whose AD values no longer match the database, so the push
+    below rewrites them. The first run against a DC compares every user.
+    Drifted employees are also appended to item_results when it is given.
+    Returns the number of employees that drifted.
+    """
+    server_name, highest_usn = read_directory_usn(conn)
+    if highest_usn is None:
+        return 0
+
+    state = ADSyncState.query.filter_by(server=server_name).first()
+    if state and state.highest_usn <= highest_usn:
+        search_filter = f"(&(objectClass=user)(uSNChanged>={state.highest_usn + 1}))"
+    else:
+        # ไม่เคยซิงค์กับ DC นี้ หรือ DC ถูก restore จน USN ย้อนกลับ ให้ตรวจทั้งหมด
+        search_filter = '(objectClass=user)'
+
+    changed_users = {}
+    started = time.perf_counter()
+    entries = conn.extend.standard.paged_search(
+        search_base=Config.AD_BASE_DN,
+        search_filter=search_filter,
+        search_scope=SUBTREE,
+        attributes=AD_USER_ATTRIBUTES,
+        paged_size=getattr(Config, 'AD_SEARCH_PAGE_SIZE', 1000),
+        generator=True
+    )
+    for entry in entries:
+        if entry.get('type') != 'searchResEntry':
+            continue
+        ad_user = _entry_to_ad_user(entry)
+        # ผู้ใช้ที่ sync แล้วจะมี employeeID ที่ระบบเขียนไว้เสมอ
+        if ad_user['employeeID']:
+            changed_users.setdefault(ad_user['employeeID'], ad_user)
+    LDAP_OPERATION_SECONDS.observe(time.perf_counter() - started, operation='usn_search')
+
+    drift_count = 0
+    employee_ids = list(changed_users)
+    chunk_size = 500
+    for start in range(0, len(employee_ids), chunk_size):
+        chunk = employee_ids[start:start + chunk_size]
+        employees = Employee.query.filter(Employee.employee_id.in_(chunk), Employee.ad_updated.is_(True)).all()
+        for employee in employees:
+            ad_user = changed_users[employee.employee_id]
+            desired = build_desired_ad_attributes(employee, ad_user['userAccountControl'], current_date)
+            changes, _ = diff_ad_attributes(ad_user, desired)
+            if changes:
+                employee.ad_updated = False
+                db.session.add(employee)
+                drift_count += 1
+                log_messages.append(f"Drift detected in AD for {employee.fname} {employee.lname} (ID: {employee.employee_id}): {', '.join(sorted(changes))}")
+                if item_results is not None:
+                    item_results.append(item_result(employee.employee_id, 'drift', changes))
+
+    if state is None:
+        state = ADSyncState(server=server_name)
+    state.highest_usn = highest_usn
+    db.session.add(state)
+
+    logger.info(f"Incremental AD check on {server_name}: {len(changed_users)} changed users, {drift_count} drifted")
+    return drift_count
+
+def advance_ad_watermark(conn):
+    """
+    Move the stored USN of the DC behind conn past this run's own modifies,
+    so the next reconcile_ad_changes does not read back every object the
+    sync just wrote as "changed in AD". Called after the modify phase.
+    """
+    server_name, highest_usn = read_directory_usn(conn)
+    if highest_usn is None:
+        return
+    state = ADSyncState.query.filter_by(server=server_name).first()
+    if state is None:
+        state = ADSyncState(server=server_name)
+    elif state.highest_usn >= highest_usn:
+        return
+    state.highest_usn = highest_usn
+    db.session.add(state)
 
 def update_active_directory():
     # สร้าง record สำหรับเก็บประวัติการ sync
@@ -164,138 +492,153 @@ def update_active_directory():
     db.session.add(sync_record)
     db.session.commit()
     
+    pool = get_ad_pool()
     conn = None
+    conn_healthy = False
+    timer = PhaseTimer('ad')
     try:
         logger.info("Starting AD synchronization process")
         
-        # Use the new connection method with retry
-        conn = create_ad_connection_with_retry()
+        # ยืม connection จาก pool แทนการเปิด connection ใหม่ทุกครั้ง
+        with timer.phase('connect'):
+            conn = pool.acquire()
 
-        # ดึงรายการพนักงานที่ยังไม่ได้อัพเดตใน AD
-        employees_to_update = Employee.query.filter_by(ad_updated=False).all()
-        
         updated_count = 0
         not_found_count = 0
+        unchanged_count = 0
+        failed_count = 0
+        drift_count = 0
+        new_identities = []
         log_messages = []
+        item_results = []  # ผลของแต่ละคน เก็บลงตาราง SyncItemResult
+        current_date = get_current_time_gmt7().date()
+        
+        # ตรวจหาผู้ใช้ที่ถูกแก้ไขใน AD โดยตรงตั้งแต่รอบก่อน
+        if getattr(Config, 'AD_INCREMENTAL_SYNC', True):
+            with timer.phase('reconcile'):
+                drift_count = reconcile_ad_changes(conn, current_date, log_messages, item_results)
+        
+        # ดึงรายการพนักงานที่ยังไม่ได้อัพเดตใน AD
+        with timer.phase('load_pending'):
+            employees_to_update = Employee.query.filter(Employee.ad_updated == false()).all()
+            identities = load_ad_identities(employee.employee_id for employee in employees_to_update)
+        report_progress(stage='resolve', employees_total=len(employees_to_update), drift_count=drift_count)
 
-        for employee in employees_to_update:
-            # ค้นหาผู้ใช้ใน AD โดยใช้ fname และ lname (เหมือนเดิม)
-            search_filter = f"(&(objectClass=user)(givenName={employee.fname})(sn={employee.lname}))"
-            conn.search(search_base=Config.AD_BASE_DN, search_filter=search_filter, attributes=['distinguishedName', 'userAccountControl'])
-            
-            if conn.entries:
-                # ถ้าพบผู้ใช้ใน AD
-                dn = conn.entries[0].distinguishedName.value
-                uac = int(conn.entries[0].userAccountControl.value)
-                
-                changes = {}
-                
-                # อัพเดต employee ID ถ้ามี
-                if employee.employee_id:
-                    changes['employeeID'] = [(MODIFY_REPLACE, [employee.employee_id])]
-                
-                # อัพเดตข้อมูลทั่วไป
-                if employee.phone:
-                    changes['telephoneNumber'] = [(MODIFY_REPLACE, [employee.phone])]
-                if employee.department:
-                    changes['department'] = [(MODIFY_REPLACE, [employee.department])]
-                if employee.position:
-                    changes['title'] = [(MODIFY_REPLACE, [employee.position])]
-                
-                # จัดการการปิดใช้งานบัญชี - ตรวจสอบเฉพาะเมื่อมีวันที่ลาออกจริง
-                if employee.resigndate:
-                    # ตรวจสอบว่าวันที่ลาออกผ่านไปแล้วหรือยัง
-                    current_date = get_current_time_gmt7().date()
-                    
-                    if employee.resigndate <= current_date:
-                        # ถ้าวันที่ลาออกผ่านไปแล้ว ให้ปิดใช้งานบัญชี
-                        if not (uac & 0x0002):
-                            new_uac = uac | 0x0002
-                            changes['userAccountControl'] = [(MODIFY_REPLACE, [str(new_uac)])]
-                        
-                        # กำหนดวันที่หมดอายุของบัญชีตามวันที่ลาออก
-                        expires_date = employee.resigndate
-                        # แปลง date เป็น datetime เพื่อให้ subtraction ทำงานได้
-                        expires_datetime = datetime.combine(expires_date, datetime.min.time())
-                        
-                        # ใช้ฟังก์ชัน convert_ce_to_ad_filetime ในการแปลงค่า
-                        # ส่งปี ค.ศ. และเวลา 23:59:59 พร้อม timezone offset +7
-                        # แต่เพื่อให้ตรงกับวันที่ลาออกพอดี เราต้องเพิ่ม 1 วัน
-                        next_day = expires_date + timedelta(days=1)
-                        filetime_value = convert_ce_to_ad_filetime(
-                            next_day.year,
-                            next_day.month,
-                            next_day.day,
-                            0, 0, 0, 7
-                        )
-                        
-                        changes['accountExpires'] = [(MODIFY_REPLACE, [str(filetime_value)])]
-                    else:
-                        # ถ้าวันที่ลาออกยังไม่ถึง ให้เปิดใช้งานบัญชีแต่ตั้งวันหมดอายุ
-                        if uac & 0x0002:
-                            new_uac = uac & ~0x0002
-                            changes['userAccountControl'] = [(MODIFY_REPLACE, [str(new_uac)])]
-                        
-                        # กำหนดวันที่หมดอายุของบัญชีตามวันที่ลาออก
-                        expires_date = employee.resigndate
-                        # แปลง date เป็น datetime เพื่อให้ subtraction ทำงานได้
-                        expires_datetime = datetime.combine(expires_date, datetime.min.time())
-                        
-                        # ใช้ฟังก์ชัน convert_ce_to_ad_filetime ในการแปลงค่า
-                        # ส่งปี ค.ศ. และเวลา 23:59:59 พร้อม timezone offset +7
-                        # แต่เพื่อให้ตรงกับวันที่ลาออกพอดี เราต้องเพิ่ม 1 วัน
-                        next_day = expires_date + timedelta(days=1)
-                        filetime_value = convert_ce_to_ad_filetime(
-                            next_day.year,
-                            next_day.month,
-                            next_day.day,
-                            0, 0, 0, 7
-                        )
-                        
-                        changes['accountExpires'] = [(MODIFY_REPLACE, [str(filetime_value)])]
-                else:
-                    # ถ้าพนักงานยังทำงานอยู่ (ไม่มีวันที่ลาออก) ให้เปิดใช้งานบัญชี
-                    if uac & 0x0002:
-                        new_uac = uac & ~0x0002
-                        changes['userAccountControl'] = [(MODIFY_REPLACE, [str(new_uac)])]
-                    
-                    # ตั้งค่า accountExpires เป็น 0 หมายถึงไม่มีวันหมดอายุ
-                    changes['accountExpires'] = [(MODIFY_REPLACE, ["0"])]
-                
-                if changes:
-                    conn.modify(dn, changes)
-                    if employee.employee_id:
-                        log_messages.append(f"Updated AD user: {employee.fname} {employee.lname} (ID: {employee.employee_id})")
-                    else:
-                        log_messages.append(f"Updated AD user: {employee.fname} {employee.lname}")
-                    updated_count += 1
-                else:
-                    if employee.employee_id:
-                        log_messages.append(f"No changes needed for AD user: {employee.fname} {employee.lname} (ID: {employee.employee_id})")
-                    else:
-                        log_messages.append(f"No changes needed for AD user: {employee.fname} {employee.lname}")
-                
-                # อัพเดตสถานะในฐานข้อมูลว่าอัพเดตใน AD เรียบร้อยแล้ว
-                employee.ad_updated = True
-                db.session.add(employee)
-            else:
+        # ดึงผู้ใช้ทั้งหมดจาก AD ครั้งเดียว หรือค้นหาเฉพาะคนที่รออัพเดตเมื่อมีไม่มาก
+        with timer.phase('prefetch'):
+            ad_index = load_ad_index(conn, employees_to_update, identities)
+
+        # รอบที่ 1: ค้นหาผู้ใช้และคำนวณค่าที่ต้องเปลี่ยน โดยยังไม่เขียนลง AD
+        with timer.phase('plan'):
+            planned, pending_changes, attribute_writes_skipped = plan_ad_changes(
+                employees_to_update, ad_index, current_date, identities
+            )
+        
+        # รอบที่ 2: ส่ง modify แบบขนานผ่านหลาย connection
+        modify_workers = getattr(Config, 'AD_MODIFY_WORKERS', 4)
+        if modify_workers > pool.max_size - 1:
+            # connection หลักยืมไปแล้วหนึ่งตัว ถ้า worker มากกว่าที่เหลือใน pool จะรอ slot ไปตลอด
+            logger.warning(f"AD_MODIFY_WORKERS={modify_workers} needs more connections than AD_POOL_MAX_SIZE="
+                           f"{pool.max_size} allows; using {max(1, pool.max_size - 1)}")
+            modify_workers = max(1, pool.max_size - 1)
+        main_conn_broken = []
+        work_items = list(pending_changes.items())
+        report_progress(stage='modify', modifies_total=len(work_items))
+        modify_started = time.perf_counter()
+        if modify_workers > 1:
+            modify_results = apply_ad_modifies(
+                work_items,
+                pool.acquire,
+                max_workers=modify_workers,
+                max_ops_per_second=getattr(Config, 'AD_MODIFY_MAX_OPS_PER_SECOND', 0),
+                release_connection=pool.release,
+                on_done=progress_counter('modifies_done')
+            )
+        else:
+            modify_results = apply_ad_modifies(
+                work_items,
+                lambda: conn,
+                max_workers=1,
+                max_ops_per_second=getattr(Config, 'AD_MODIFY_MAX_OPS_PER_SECOND', 0),
+                release_connection=lambda c, discard=False: discard and main_conn_broken.append(c),
+                on_done=progress_counter('modifies_done')
+            )
+        timer.add('modify', time.perf_counter() - modify_started)
+        modify_errors = {dn: error for (dn, _), error in zip(work_items, modify_results)}
+        if getattr(Config, 'AD_INCREMENTAL_SYNC', True) and any(error is None for error in modify_results):
+            with timer.phase('reconcile'):
+                advance_ad_watermark(conn)
+        record_started = time.perf_counter()
+        
+        # รอบที่ 3: เก็บผลลัพธ์ตามลำดับพนักงานเดิม
+        for employee, ad_user, changes, *_ in planned:
+            if ad_user is None:
                 # ถ้าไม่พบผู้ใช้ใน AD
                 if employee.employee_id:
                     log_messages.append(f"User not found in AD with ID: {employee.employee_id} ({employee.fname} {employee.lname})")
                 else:
                     log_messages.append(f"User not found in AD: {employee.fname} {employee.lname}")
+                item_results.append(item_result(employee.employee_id, 'not_found'))
                 not_found_count += 1
+                continue
+            
+            # modify ของ DN เดียวกันถูกรวมไว้ ถ้าล้มเหลวทุกคนที่ map กับ DN นี้ถือว่าล้มเหลว
+            # (รวมคนที่ไม่มี changes เพราะถูกเทียบกับค่าที่วางแผนไว้ของคนก่อนหน้า)
+            error = modify_errors.get(ad_user['dn'])
+            if error:
+                # ไม่เปลี่ยนสถานะ ad_updated เพื่อให้ลองใหม่ในรอบถัดไป
+                log_messages.append(f"Failed to update AD user: {employee.fname} {employee.lname} (ID: {employee.employee_id}) - {error}")
+                item_results.append(item_result(employee.employee_id, 'failed', changes, error))
+                failed_count += 1
+                continue
+            
+            if changes:
+                if employee.employee_id:
+                    log_messages.append(f"Updated AD user: {employee.fname} {employee.lname} (ID: {employee.employee_id})")
+                else:
+                    log_messages.append(f"Updated AD user: {employee.fname} {employee.lname}")
+                item_results.append(item_result(employee.employee_id, 'updated', changes))
+                updated_count += 1
+            else:
+                if employee.employee_id:
+                    log_messages.append(f"No changes needed for AD user: {employee.fname} {employee.lname} (ID: {employee.employee_id})")
+                else:
+                    log_messages.append(f"No changes needed for AD user: {employee.fname} {employee.lname}")
+                item_results.append(item_result(employee.employee_id, 'unchanged'))
+                unchanged_count += 1
+            
+            # จำ objectGUID ของผู้ใช้ไว้ รอบถัดไปจะค้นหาจาก GUID แทนชื่อ
+            new_identity = remember_ad_identity(identities, employee, ad_user)
+            if new_identity:
+                new_identities.append(new_identity)
+            
+            # อัพเดตสถานะในฐานข้อมูลว่าอัพเดตใน AD เรียบร้อยแล้ว
+            employee.ad_updated = True
+            db.session.add(employee)
+        
+        if new_identities:
+            record_ad_identities(new_identities)
+            logger.info(f"Mapped {len(new_identities)} employees to AD users for the first time")
         
+        record_item_results(sync_record.id, item_results)
         db.session.commit()
-        conn.unbind()
+        timer.add('record', time.perf_counter() - record_started)
+        conn_healthy = not main_conn_broken
 
         # อัปเดต record ว่าสำเร็จ
         sync_record.status = 'success'
         sync_record.end_time = get_asia_bangkok_time()
-        sync_record.message = f"AD Sync completed. Updated: {updated_count}, Not found: {not_found_count}"
-        sync_record.details = json.dumps(log_messages) # แปลง list เป็น JSON string
+        sync_record.message = f"AD Sync completed. Updated: {updated_count}, Unchanged: {unchanged_count}, Not found: {not_found_count}"
+        if failed_count:
+            sync_record.message += f", Failed: {failed_count}"
+        if drift_count:
+            sync_record.message += f", Drift detected: {drift_count}"
         sync_record.updated_count = updated_count
         sync_record.not_found_count = not_found_count
+        sync_record.unchanged_count = unchanged_count
+        sync_record.attribute_writes_skipped = attribute_writes_skipped
+        sync_record.drift_count = drift_count
+        sync_record.phase_timings = timer.finish('success')
         db.session.add(sync_record)
         db.session.commit()
         
@@ -304,17 +647,23 @@ def update_active_directory():
             'success': True,
             'updated_count': updated_count,
             'not_found_count': not_found_count,
+            'unchanged_count': unchanged_count,
+            'failed_count': failed_count,
+            'drift_count': drift_count,
+            'attribute_writes_skipped': attribute_writes_skipped,
             'log_messages': log_messages
         }
         return result
         
     except LDAPException as e:
         logger.error(f"LDAP error during AD synchronization: {e}")
+        record_error('ad', e)
         db.session.rollback()
 
         # อัปเดต record ว่าล้มเหลว
         sync_record.status = 'failed'
         sync_record.end_time = get_asia_bangkok_time()
+        sync_record.phase_timings = timer.finish('failed')
         sync_record.error_message = f"LDAP Error: {str(e)}"
         db.session.add(sync_record)
         db.session.commit()
@@ -329,6 +678,7 @@ def update_active_directory():
         
     except socket.timeout as e:
         logger.error(f"Socket timeout during AD synchronization: {e}")
+        record_error('ad', e)
         db.session.rollback()
 
         # Run network diagnostics when timeout occurs
@@ -338,6 +688,7 @@ def update_active_directory():
         # อัปเดต record ว่าล้มเหลว
         sync_record.status = 'failed'
         sync_record.end_time = get_asia_bangkok_time()
+        sync_record.phase_timings = timer.finish('failed')
         sync_record.error_message = f"Connection Timeout: {str(e)}"
         sync_record.details = json.dumps({
             'error': f"Connection Timeout: {str(e)}",
@@ -357,6 +708,7 @@ def update_active_directory():
         
     except socket.error as e:
         logger.error(f"Socket error during AD synchronization: {e}")
+        record_error('ad', e)
         db.session.rollback()
 
         # Run network diagnostics when socket error occurs
@@ -366,6 +718,7 @@ def update_active_directory():
         # อัปเดต record ว่าล้มเหลว
         sync_record.status = 'failed'
         sync_record.end_time = get_asia_bangkok_time()
+        sync_record.phase_timings = timer.finish('failed')
         sync_record.error_message = f"Network Error: {str(e)}"
         sync_record.details = json.dumps({
             'error': f"Network Error: {str(e)}",
@@ -385,11 +738,13 @@ def update_active_directory():
         
     except Exception as e:
         logger.error(f"Unexpected error during AD synchronization: {e}")
+        record_error('ad', e)
         db.session.rollback()
 
         # อัปเดต record ว่าล้มเหลว
         sync_record.status = 'failed'
         sync_record.end_time = get_asia_bangkok_time()
+        sync_record.phase_timings = timer.finish('failed')
         sync_record.error_message = f"Unexpected Error: {str(e)}"
         db.session.add(sync_record)
         db.session.commit()
@@ -403,10 +758,6 @@ def update_active_directory():
         }
         
     finally:
-        # Ensure connection is properly closed
+        # คืน connection ให้ pool (ทิ้งไปถ้าเกิดข้อผิดพลาดระหว่างทาง)
         if conn:
-            try:
-                conn.unbind()
-                logger.info("AD connection closed successfully")
-            except Exception as e:
-                logger.warning(f"Error closing AD connection: {e}")
\ No newline at end of file
+            pool.release(conn, discard=not conn_healthy)
\ No newline at end of file
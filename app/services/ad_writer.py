@@ -0,0 +1,79 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from app.utils.metrics import LDAP_OPERATION_SECONDS, record_error
+from app.utils.rate_limit import RateLimiter
+
+logger = logging.getLogger(__name__)
+
+def apply_ad_modifies(work_items, connection_factory, max_workers=4, max_ops_per_second=0, release_connection=None,
+                      on_done=None):
+    """
+    Send ldap3 modify operations over several connections at once.
+
+    :param work_items: list of (dn, changes) tuples
+    :param connection_factory: callable returning a bound ldap3 connection; each worker thread gets its own
+    :param max_workers: number of concurrent connections
+    :param max_ops_per_second: ceiling on modifies started per second across all workers (0 = unlimited)
+    :param release_connection: callable(conn, discard) used to give a worker connection back (defaults to unbind);
+                               discard is True when a modify on it raised, so it must not be reused
+    :param on_done: optional callable invoked (from the worker thread) after each modify finishes
+    :return: list in the same order as work_items, holding None for success or the exception raised
+    """
+    results = [None] * len(work_items)
+    if not work_items:
+        return results
+
+    limiter = RateLimiter(max_ops_per_second)
+    local = threading.local()
+    connections = []
+    broken = set()
+    connections_lock = threading.Lock()
+
+    def get_connection():
+        conn = getattr(local, 'conn', None)
+        if conn is None:
+            conn = connection_factory()
+            local.conn = conn
+            with connections_lock:
+                connections.append(conn)
+        return conn
+
+    def apply(position):
+        dn, changes = work_items[position]
+        limiter.acquire()
+        try:
+            conn = get_connection()
+            try:
+                with LDAP_OPERATION_SECONDS.time(operation='modify'):
+                    modified = conn.modify(dn, changes)
+            except Exception:
+                # socket/LDAP error ระหว่าง modify: connection อาจเสีย ห้ามคืนเข้า pool ไปใช้ซ้ำ
+                with connections_lock:
+                    broken.add(id(conn))
+                raise
+            if not modified:
+                raise Exception(f"Modify failed for {dn}: {conn.result.get('description')}")
+        except Exception as e:
+            record_error('ldap_modify', e)
+            logger.error(f"Error modifying AD object {dn}: {e}")
+            results[position] = e
+        if on_done:
+            on_done()
+
+    workers = max(1, min(max_workers, len(work_items)))
+    try:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='ad-modify') as executor:
+            # list() ทำให้รอจนทุกงานเสร็จ
+            list(executor.map(apply, range(len(work_items))))
+    finally:
+        for conn in connections:
+            try:
+                if release_connection:
+                    release_connection(conn, discard=id(conn) in broken)
+                else:
+                    conn.unbind()
+            except Exception as e:
+                logger.warning(f"Error closing AD writer connection: {e}")
+
+    return results
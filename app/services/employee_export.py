@@ -0,0 +1,116 @@
+import csv
+import io
+import json
+from datetime import date, datetime
+from sqlalchemy import select
+from app_factory import db
+from app.models.employee import Employee
+from app.services.employee_query import filtered_employee_query
+from config import Config
+
+# คอลัมน์ที่อนุญาตให้ export ได้ (ไม่รวม sync_fingerprint ซึ่งใช้ภายใน)
+EXPORT_COLUMNS = {
+    'employee_id': Employee.employee_id,
+    'fname': Employee.fname,
+    'lname': Employee.lname,
+    'phone': Employee.phone,
+    'department': Employee.department,
+    'position': Employee.position,
+    'start_date': Employee.start_date,
+    'status': Employee.status,
+    'resigndate': Employee.resigndate,
+    'account_expires_date': Employee.account_expires_date,
+    'ad_updated': Employee.ad_updated,
+    'last_updated': Employee.last_updated,
+}
+
+# คอลัมน์เดิมของ /employees
+DEFAULT_EXPORT_COLUMNS = ('employee_id', 'fname', 'lname', 'phone', 'department',
+                          'position', 'start_date', 'status', 'ad_updated')
+
+EXPORT_FORMATS = {
+    'json': 'application/json',
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv; charset=utf-8',
+}
+
+def parse_export_columns(value):
+    """
+    Parse a comma separated column list; raises ValueError for unknown columns.
+    """
+    if not value:
+        return list(DEFAULT_EXPORT_COLUMNS)
+    columns = [name.strip() for name in value.split(',') if name.strip()]
+    unknown = [name for name in columns if name not in EXPORT_COLUMNS]
+    if unknown or not columns:
+        raise ValueError(f"Unknown columns: {', '.join(unknown)}. Available: {', '.join(EXPORT_COLUMNS)}")
+    return columns
+
+def _json_value(value):
+    if isinstance(value, datetime):
+        return value.strftime('%Y-%m-%d %H:%M:%S')
+    if isinstance(value, date):
+        return value.strftime('%Y-%m-%d')
+    return value
+
+def iter_employee_rows(columns, filters=None):
+    """
+    Yield employee rows as tuples of the requested columns, ordered by id.
+    Reads through a server-side cursor in batches of EXPORT_BATCH_SIZE so memory
+    does not grow with the number of employees.
+    """
+    batch_size = getattr(Config, 'EXPORT_BATCH_SIZE', 1000)
+    statement = select(*(EXPORT_COLUMNS[name] for name in columns)).order_by(Employee.id)
+    statement = filtered_employee_query(filters or {}, statement)
+
+    # ใช้ connection แยกจาก session เพราะ generator ทำงานต่อหลังจาก view คืนค่าแล้ว
+    with db.engine.connect() as conn:
+        result = conn.execution_options(yield_per=batch_size).execute(statement)
+        for partition in result.partitions():
+            yield from partition
+
+def _batched_lines(lines):
+    batch_size = getattr(Config, 'EXPORT_BATCH_SIZE', 1000)
+    buffer = []
+    for line in lines:
+        buffer.append(line)
+        if len(buffer) >= batch_size:
+            yield ''.join(buffer)
+            buffer = []
+    if buffer:
+        yield ''.join(buffer)
+
+def generate_export(columns, export_format, filters=None):
+    """
+    Generate the export body in chunks for a streamed response.
+    'json' is a single JSON array (the original /employees format), 'ndjson' is
+    one object per line and 'csv' has a header row.
+    """
+    rows = iter_employee_rows(columns, filters)
+
+    if export_format == 'csv':
+        def csv_lines():
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(columns)
+            for row in rows:
+                writer.writerow([_json_value(value) for value in row])
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+            yield buffer.getvalue()
+        return _batched_lines(csv_lines())
+
+    def json_objects():
+        for row in rows:
+            yield json.dumps({name: _json_value(value) for name, value in zip(columns, row)}, ensure_ascii=False)
+
+    if export_format == 'ndjson':
+        return _batched_lines(line + '\n' for line in json_objects())
+
+    def json_array():
+        yield '['
+        for index, obj in enumerate(json_objects()):
+            yield obj if index == 0 else ',' + obj
+        yield ']'
+    return _batched_lines(json_array())
@@ -0,0 +1,199 @@
+import hashlib
+import json
+import logging
+import time
+from itertools import islice
+from sqlalchemy import insert, select, update
+from app_factory import db, get_asia_bangkok_time
+from app.models.employee import Employee
+from app.services.job_runner import increment_progress
+from app.utils.metrics import DB_UPSERT_ROWS, DB_UPSERT_SECONDS, record_phase
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# ฟิลด์ที่รับมาจากแหล่งข้อมูล HR (MyHR / FTP)
+SYNCED_FIELDS = (
+    'fname',
+    'lname',
+    'phone',
+    'department',
+    'position',
+    'start_date',
+    'status',
+    'resigndate',
+    'account_expires_date',
+)
+
+def compute_fingerprint(values):
+    """
+    Stable SHA-256 of the synced fields, used to tell whether an HR record actually changed.
+    """
+    normalized = [
+        value.isoformat() if hasattr(value, 'isoformat') else ('' if value is None else str(value))
+        for value in (values.get(field) for field in SYNCED_FIELDS)
+    ]
+    payload = json.dumps(normalized, ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def _chunks(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+def _merge_chunk(records):
+    """
+    Merge records that share an employee_id, later records winning field by field.
+    A field missing from a record means "keep the current value".
+    """
+    merged = {}
+    for record in records:
+        merged.setdefault(record['employee_id'], {}).update(record)
+    return merged
+
+def _load_existing(employee_ids):
+    """
+    Load the current synced values for a chunk of employee IDs with one SELECT.
+    """
+    columns = [Employee.id, Employee.employee_id, Employee.sync_fingerprint, Employee.ad_updated] + \
+        [getattr(Employee, field) for field in SYNCED_FIELDS]
+    rows = db.session.execute(select(*columns).where(Employee.employee_id.in_(employee_ids))).mappings()
+    return {row['employee_id']: dict(row) for row in rows}
+
+def _upsert_statement(rows):
+    """
+    Build a single INSERT ... ON CONFLICT (employee_id) DO UPDATE for the given rows,
+    or None when the database dialect has no native upsert.
+    """
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    elif dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    else:
+        return None
+
+    statement = dialect_insert(Employee.__table__).values(rows)
+    update_columns = [column for column in rows[0] if column != 'employee_id']
+    return statement.on_conflict_do_update(
+        index_elements=['employee_id'],
+        set_={column: statement.excluded[column] for column in update_columns}
+    )
+
+def _write_rows(rows, existing):
+    statement = _upsert_statement(rows)
+    if statement is not None:
+        db.session.execute(statement)
+        return
+
+    # ฐานข้อมูลที่ไม่รองรับ ON CONFLICT: แยก insert กับ update เป็น bulk statement
+    new_rows = [row for row in rows if row['employee_id'] not in existing]
+    changed_rows = [dict(row, id=existing[row['employee_id']]['id']) for row in rows if row['employee_id'] in existing]
+    if new_rows:
+        db.session.execute(insert(Employee), new_rows)
+    if changed_rows:
+        db.session.execute(update(Employee), changed_rows)
+
+def upsert_employee_records(records, require_name=False, chunk_size=None, touched=None):
+    """
+    Write employee records to the database in chunks, one SELECT and one
+    upsert statement per chunk instead of one query per record.
+
+    Each record is a dict with employee_id and any of SYNCED_FIELDS; missing
+    fields keep their stored value. With require_name, new employees that end
+    up without both fname and lname are skipped. Employees whose synced
+    fields hash to the stored fingerprint are left untouched, so they are not
+    queued for AD again. The caller commits.
+
+    When touched (a dict) is given, every employee this call writes is added
+    to it the first time as employee_id -> (fingerprint, ad_updated) before
+    the write, or None when it is new; see settle_touched_employees().
+
+    :return: dict with inserted, updated, unchanged and skipped counts
+    """
+    chunk_size = chunk_size or getattr(Config, 'INGEST_CHUNK_SIZE', 1000)
+    stats = {'inserted': 0, 'updated': 0, 'unchanged': 0, 'skipped': 0}
+
+    for chunk in _chunks(records, chunk_size):
+        merged = _merge_chunk(chunk)
+        started = time.perf_counter()
+        existing = _load_existing(list(merged))
+        db_seconds = time.perf_counter() - started
+        now = get_asia_bangkok_time()
+        rows = []
+
+        for employee_id, record in merged.items():
+            current = existing.get(employee_id)
+            values = {field: current[field] if current else None for field in SYNCED_FIELDS}
+            values.update((field, record[field]) for field in SYNCED_FIELDS if field in record)
+
+            # ตรวจสอบว่าข้อมูลครบถ้วนก่อนเพิ่มพนักงานใหม่
+            if current is None and require_name and not any([values['fname'], values['lname']]):
+                print(f"Skipping employee {employee_id} - all required fields are null")
+                stats['skipped'] += 1
+                continue
+
+            # ข้ามพนักงานที่ข้อมูลไม่เปลี่ยน เพื่อไม่ให้ต้องอัพเดต AD ซ้ำ
+            fingerprint = compute_fingerprint(values)
+            if current is not None and fingerprint == (current['sync_fingerprint'] or compute_fingerprint(current)):
+                stats['unchanged'] += 1
+                continue
+
+            if touched is not None and employee_id not in touched:
+                touched[employee_id] = (current['sync_fingerprint'] or compute_fingerprint(current),
+                                        current['ad_updated']) if current else None
+            values['employee_id'] = employee_id
+            values['sync_fingerprint'] = fingerprint
+            values['last_updated'] = now  # อัพเดตเวลาเป็น Asia/Bangkok
+            values['ad_updated'] = False  # รีเซ็ตสถานะเพื่อให้อัพเดต AD ใหม่
+            rows.append(values)
+            stats['updated' if current else 'inserted'] += 1
+
+        if rows:
+            started = time.perf_counter()
+            _write_rows(rows, existing)
+            db_seconds += time.perf_counter() - started
+        DB_UPSERT_SECONDS.observe(db_seconds)
+        record_phase('db_upsert', db_seconds)
+        increment_progress(records_processed=len(chunk), employees_changed=len(rows))
+
+    for result, count in stats.items():
+        DB_UPSERT_ROWS.inc(count, result=result)
+    logger.info(f"Upserted employees: {stats}")
+    return stats
+
+def settle_touched_employees(touched, chunk_size=None):
+    """
+    Reconcile employees written by several upsert_employee_records() calls in
+    one sync (one per source). An employee whose synced fields end up hashing
+    to the same value as before the first write, and that was already in AD,
+    gets ad_updated back, so sources that disagree (e.g. MyHR clearing a field
+    the FTP file fills in again) do not re-queue it for AD on every run.
+    Employees whose writes were rolled back are settled the same way. The
+    caller commits.
+
+    :return: dict with inserted, updated and unchanged counts of distinct employees
+    """
+    chunk_size = chunk_size or getattr(Config, 'INGEST_CHUNK_SIZE', 1000)
+    stats = {'inserted': 0, 'updated': 0, 'unchanged': 0}
+    restored = []
+    for chunk in _chunks(touched, chunk_size):
+        rows = db.session.execute(
+            select(Employee.id, Employee.employee_id, Employee.sync_fingerprint).where(Employee.employee_id.in_(chunk))
+        )
+        for employee_pk, employee_id, fingerprint in rows:
+            original = touched[employee_id]
+            if original is None:
+                stats['inserted'] += 1
+            elif fingerprint == original[0]:
+                stats['unchanged'] += 1
+                if original[1]:
+                    restored.append({'id': employee_pk, 'ad_updated': True})
+            else:
+                stats['updated'] += 1
+    if restored:
+        db.session.execute(update(Employee), restored)
+    return stats
@@ -0,0 +1,152 @@
+import base64
+import binascii
+import json
+from datetime import datetime
+from sqlalchemy import false, func, or_, true, tuple_
+from app_factory import db
+from app.models.employee import Employee
+from config import Config
+
+# ลำดับเดียวกับ index ix_employee_name_order
+SORT_COLUMNS = (
+    func.coalesce(Employee.lname, ''),
+    func.coalesce(Employee.fname, ''),
+    Employee.id,
+)
+
+def employee_to_dict(emp):
+    return {
+        'employee_id': emp.employee_id,
+        'fname': emp.fname,
+        'lname': emp.lname,
+        'phone': emp.phone,
+        'department': emp.department,
+        'position': emp.position,
+        'start_date': emp.start_date.strftime('%Y-%m-%d') if emp.start_date else None,
+        'resigndate': emp.resigndate.strftime('%Y-%m-%d') if emp.resigndate else None,
+        'account_expires_date': emp.account_expires_date.strftime('%Y-%m-%d') if emp.account_expires_date else None,
+        'status': emp.status,
+        'ad_updated': emp.ad_updated
+    }
+
+def encode_cursor(emp):
+    key = [emp.lname or '', emp.fname or '', emp.id]
+    return base64.urlsafe_b64encode(json.dumps(key).encode('utf-8')).decode('ascii')
+
+def decode_cursor(cursor):
+    """
+    Decode a cursor from encode_cursor(); raises ValueError if it is malformed.
+    """
+    try:
+        lname, fname, emp_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except (binascii.Error, UnicodeError, ValueError, TypeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+    if not isinstance(lname, str) or not isinstance(fname, str) or not isinstance(emp_id, int):
+        raise ValueError(f"Invalid cursor: {cursor}")
+    return lname, fname, emp_id
+
+def _parse_date(value, name):
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError as e:
+        raise ValueError(f"Invalid {name}: {value} (expected YYYY-MM-DD)") from e
+
+def parse_employee_filters(args):
+    """
+    Read the filter arguments of /api/employees from a request.args-like mapping.
+    Raises ValueError for values that cannot be parsed.
+    """
+    filters = {}
+    for name in ('department', 'status'):
+        value = (args.get(name) or '').strip()
+        if value:
+            filters[name] = value
+
+    ad_updated = (args.get('ad_updated') or '').strip().lower()
+    if ad_updated:
+        if ad_updated not in ('true', 'false', '1', '0'):
+            raise ValueError(f"Invalid ad_updated: {ad_updated}")
+        filters['ad_updated'] = ad_updated in ('true', '1')
+
+    for name in ('resigned_from', 'resigned_to'):
+        value = (args.get(name) or '').strip()
+        if value:
+            filters[name] = _parse_date(value, name)
+
+    q = (args.get('q') or '').strip()
+    if q:
+        filters['q'] = q
+    return filters
+
+def _escape_like(value):
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+def filtered_employee_query(filters, query=None):
+    """
+    Apply the given filters (see parse_employee_filters) to an Employee query or
+    select() statement; defaults to Employee.query.
+    """
+    if query is None:
+        query = Employee.query
+    if 'department' in filters:
+        query = query.filter(Employee.department == filters['department'])
+    if 'status' in filters:
+        query = query.filter(Employee.status == filters['status'])
+    if 'ad_updated' in filters:
+        # เงื่อนไขเดียวกับขั้นตอน AD เพื่อใช้ partial index ix_employee_ad_pending
+        query = query.filter(Employee.ad_updated == (true() if filters['ad_updated'] else false()))
+    if 'resigned_from' in filters:
+        query = query.filter(Employee.resigndate >= filters['resigned_from'])
+    if 'resigned_to' in filters:
+        query = query.filter(Employee.resigndate <= filters['resigned_to'])
+    if 'q' in filters:
+        pattern = _escape_like(filters['q'])
+        # รหัสพนักงานค้นหาแบบขึ้นต้น ส่วนชื่อค้นหาแบบมีคำนั้นอยู่
+        query = query.filter(or_(
+            Employee.employee_id.like(f"{pattern}%", escape='\\'),
+            Employee.fname.ilike(f"%{pattern}%", escape='\\'),
+            Employee.lname.ilike(f"%{pattern}%", escape='\\'),
+            (func.coalesce(Employee.fname, '') + ' ' + func.coalesce(Employee.lname, '')).ilike(f"%{pattern}%", escape='\\')
+        ))
+    return query
+
+def get_employee_page(filters, cursor=None, limit=None):
+    """
+    Return one page of employees ordered by last name, first name and id.
+    The cursor is the next_cursor of the previous page (keyset pagination), so
+    deep pages cost the same as the first one.
+    Returns {'employees', 'next_cursor', 'total'}; total is only counted for the
+    first page.
+    """
+    max_limit = getattr(Config, 'EMPLOYEE_PAGE_MAX_SIZE', 500)
+    if limit is None:
+        limit = getattr(Config, 'EMPLOYEE_PAGE_SIZE', 50)
+    limit = max(1, min(limit, max_limit))
+
+    query = filtered_employee_query(filters)
+    total = query.order_by(None).count() if cursor is None else None
+
+    if cursor is not None:
+        query = query.filter(tuple_(*SORT_COLUMNS) > tuple_(*decode_cursor(cursor)))
+    # ดึงเกินมา 1 แถวเพื่อดูว่ายังมีหน้าถัดไปหรือไม่
+    rows = query.order_by(*SORT_COLUMNS).limit(limit + 1).all()
+
+    next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return {
+        'employees': [employee_to_dict(emp) for emp in rows[:limit]],
+        'next_cursor': next_cursor,
+        'total': total
+    }
+
+def _distinct_values(column):
+    rows = db.session.query(column).filter(column.isnot(None), column != '').distinct().order_by(column).all()
+    return [row[0] for row in rows]
+
+def list_filter_options():
+    """
+    Distinct departments and statuses for the dashboard filters.
+    """
+    return {
+        'departments': _distinct_values(Employee.department),
+        'statuses': _distinct_values(Employee.status)
+    }
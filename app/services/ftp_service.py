@@ -1,134 +1,335 @@
 import ftplib
 import csv
+import hashlib
 import io
-from datetime import datetime
+import logging
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
 from app_factory import db, get_asia_bangkok_time
-from app.models.employee import Employee
+from app.models.ftp_file_ledger import FtpFileLedger
+from app.models.sync_history import SyncHistory
+from app.services.employee_ingest import upsert_employee_records
+from app.services.job_runner import report_progress, increment_progress
+from app.utils.date_utils import parse_be_date, parse_be_date_columns
+from app.utils.metrics import CSV_ROWS_PARSED, FTP_DOWNLOAD_BYTES, FTP_DOWNLOAD_SECONDS, PhaseTimer, record_error
 from config import Config
 
+logger = logging.getLogger(__name__)
+
+def connect_ftp():
+    """
+    Open and log in a new FTP session in the configured directory.
+    """
+    ftp = ftplib.FTP()
+    ftp.connect(Config.FTP_HOST, getattr(Config, 'FTP_PORT', 21))
+    ftp.login(Config.FTP_USER, Config.FTP_PASSWORD)
+    ftp.set_pasv(True)  # Enable passive mode for better compatibility
+    ftp.cwd(Config.FTP_PATH)
+    return ftp
+
+def download_to_spool(ftp, filename, digest=None):
+    """
+    Download a file from FTP into a spooled temporary file.
+    Small files stay in memory; anything above FTP_SPOOL_MAX_MEMORY bytes is
+    written to disk, so memory use stays bounded whatever the file size.
+    When digest (a hashlib object) is given it is updated with every block.
+    """
+    spool = tempfile.SpooledTemporaryFile(max_size=getattr(Config, 'FTP_SPOOL_MAX_MEMORY', 8 * 1024 * 1024))
+    downloaded = 0
+
+    def write_block(block):
+        nonlocal downloaded
+        spool.write(block)
+        downloaded += len(block)
+        if digest is not None:
+            digest.update(block)
+
+    started = time.perf_counter()
+    try:
+        ftp.retrbinary(f"RETR {filename}", write_block, blocksize=getattr(Config, 'FTP_BLOCK_SIZE', 64 * 1024))
+    except Exception:
+        spool.close()
+        raise
+    finally:
+        FTP_DOWNLOAD_BYTES.inc(downloaded)
+    FTP_DOWNLOAD_SECONDS.observe(time.perf_counter() - started)
+    spool.seek(0)
+    return spool
+
+def iter_csv_rows(binary_file):
+    """
+    Parse CSV rows one at a time from a binary file object through an incremental UTF-8 decoder.
+    """
+    text_file = io.TextIOWrapper(binary_file, encoding='utf-8', newline='')
+    row_count = 0
+    try:
+        for row in csv.DictReader(text_file):
+            row_count += 1
+            yield row
+    finally:
+        CSV_ROWS_PARSED.inc(row_count)
+        text_file.close()
+
+def iter_ftp_csv_rows(ftp, filename):
+    """
+    Download a CSV file from FTP and yield its rows without holding the whole file in memory.
+    """
+    yield from iter_csv_rows(download_to_spool(ftp, filename))
+
+# คอลัมน์วันที่ (ปี พ.ศ.) ในไฟล์ CSV
+FTP_DATE_COLUMNS = ('start_date', 'resigndate', 'account_expires_date')
+
+def parse_ftp_row(row, dates=None):
+    """
+    Convert a CSV row into an employee record for upsert_employee_records.
+    Name, phone, division and position only overwrite stored values when the CSV cell is not empty.
+    dates holds the already converted FTP_DATE_COLUMNS in order (see parse_ftp_rows);
+    without it each date is parsed here.
+    """
+    if dates is None:
+        dates = [parse_be_date(row.get(column)) for column in FTP_DATE_COLUMNS]
+    start_date, resigndate, account_expires_date = dates
+    record = {'employee_id': row['employeeid']}
+    
+    # อัพเดตเฉพาะค่าที่มีใน CSV สำหรับทั้งพนักงานใหม่และพนักงานเดิม
+    for column, field in (('EFNAME', 'fname'), ('ELNAME', 'lname'), ('phone', 'phone'),
+                          ('Division', 'department'), ('POSITION', 'position')):
+        if row.get(column):
+            record[field] = row.get(column)
+    
+    # แปลงวันที่เริ่มงาน (รับเป็นปี พ.ศ.)
+    record['start_date'] = start_date
+    record['status'] = row.get('status')
+    
+    # แปลงวันที่ลาออก (รับเป็นปี พ.ศ.)
+    record['resigndate'] = resigndate
+    
+    if record['resigndate']:
+        # ถ้ามีวันที่ลาออก ให้ตั้งค่า account_expires_date อัตโนมัติเป็นวันเดียวกับ resigndate
+        record['account_expires_date'] = record['resigndate']
+    else:
+        # ใช้ account_expires_date จาก CSV ถ้ามี ไม่เช่นนั้นให้เป็น None
+        record['account_expires_date'] = account_expires_date
+    
+    return record
+
+def parse_ftp_rows(rows):
+    """
+    Convert a stream of CSV rows, parsing the date columns of each
+    INGEST_CHUNK_SIZE chunk at once with parse_be_dates.
+    """
+    chunk_size = getattr(Config, 'INGEST_CHUNK_SIZE', 1000)
+    for row, dates in parse_be_date_columns(rows, FTP_DATE_COLUMNS, chunk_size):
+        yield parse_ftp_row(row, dates)
+
+def get_remote_file_info(ftp, filename):
+    """
+    Return (size, modified_at) for a remote file using SIZE and MDTM.
+    Either value is None when the server does not support the command.
+    """
+    size = None
+    modified_at = None
+    try:
+        ftp.voidcmd('TYPE I')
+        size = ftp.size(filename)
+    except ftplib.all_errors:
+        pass
+    try:
+        modified_at = ftp.voidcmd(f"MDTM {filename}").split()[-1][:14]
+    except ftplib.all_errors:
+        pass
+    return size, modified_at
+
+def is_file_processed(filename, size, modified_at):
+    """
+    Check the ledger for a file with the same name, size and modification time.
+    """
+    if size is None or modified_at is None:
+        return False
+    return db.session.query(FtpFileLedger.id).filter_by(
+        filename=filename, size=size, modified_at=modified_at
+    ).first() is not None
+
+def list_pending_files(ftp):
+    """
+    List the CSV files that still need processing, sorted by name.
+    Files the ledger already knows are moved to processed/ without downloading them.
+    Returns ({filename: (size, modified_at)}, already_processed_count).
+    """
+    file_info = {}
+    already_processed = 0
+    for filename in sorted(ftp.nlst()):
+        if not filename.endswith('.csv'):
+            continue
+        size, modified_at = get_remote_file_info(ftp, filename)
+        if is_file_processed(filename, size, modified_at):
+            print(f"Skipping {filename} - already processed")
+            already_processed += 1
+            move_to_processed(ftp, filename)
+            continue
+        file_info[filename] = (size, modified_at)
+    return file_info, already_processed
+
+def is_content_processed(sha256):
+    """
+    Check whether a file repeats the content of the most recently processed
+    file within FTP_DUPLICATE_WINDOW_HOURS (an accidental re-upload). Older
+    content sent again, e.g. a rollback to an earlier export, is applied.
+    """
+    latest = db.session.query(FtpFileLedger.sha256, FtpFileLedger.processed_at).order_by(
+        FtpFileLedger.id.desc()
+    ).first()
+    if latest is None or latest.sha256 != sha256:
+        return False
+    window = timedelta(hours=getattr(Config, 'FTP_DUPLICATE_WINDOW_HOURS', 24))
+    return latest.processed_at is not None and get_asia_bangkok_time() - latest.processed_at < window
+
+def record_processed_file(filename, size, modified_at, sha256, row_count):
+    """
+    Add a ledger entry for a file; it is committed together with the file's employee rows.
+    """
+    db.session.add(FtpFileLedger(
+        filename=filename,
+        size=size,
+        modified_at=modified_at,
+        sha256=sha256,
+        row_count=row_count
+    ))
+
+def download_files(filenames):
+    """
+    Download files over a small pool of FTP sessions, yielding
+    (filename, spool, sha256, error) in the order of filenames as each one is ready.
+    """
+    local = threading.local()
+    sessions = []
+    sessions_lock = threading.Lock()
+
+    def download(filename):
+        try:
+            ftp = getattr(local, 'ftp', None)
+            if ftp is None:
+                ftp = connect_ftp()
+                local.ftp = ftp
+                with sessions_lock:
+                    sessions.append(ftp)
+            digest = hashlib.sha256()
+            spool = download_to_spool(ftp, filename, digest)
+            return filename, spool, digest.hexdigest(), None
+        except Exception as e:
+            record_error('ftp_download', e)
+            return filename, None, None, e
+
+    workers = max(1, min(getattr(Config, 'FTP_DOWNLOAD_WORKERS', 3), len(filenames)))
+    try:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='ftp-download') as executor:
+            yield from executor.map(download, filenames)
+    finally:
+        for ftp in sessions:
+            try:
+                ftp.quit()
+            except ftplib.all_errors:
+                ftp.close()
+
+def move_to_processed(ftp, filename):
+    try:
+        ftp.rename(filename, f"processed/{filename}")
+        print(f"Successfully moved {filename} to processed folder")
+    except Exception as rename_error:
+        # Continue with other files even if rename fails
+        print(f"Failed to move {filename} to processed folder: {rename_error}")
+
 def fetch_employees_from_ftp():
+    # สร้าง record สำหรับเก็บประวัติการ sync
+    sync_record = SyncHistory(sync_type='ftp', status='running')
+    db.session.add(sync_record)
+    db.session.commit()
+    
+    ftp = None
+    timer = PhaseTimer('ftp')
     try:
-        with db.session.no_autoflush:
-            ftp = ftplib.FTP(Config.FTP_HOST)
-            ftp.login(Config.FTP_USER, Config.FTP_PASSWORD)
-            ftp.set_pasv(True)  # Enable passive mode for better compatibility
-            ftp.cwd(Config.FTP_PATH)
+        totals = {'inserted': 0, 'updated': 0, 'unchanged': 0, 'skipped': 0}
+        failed_files = []
+        duplicate_files = 0
+        
+        # ข้ามไฟล์ที่เคยประมวลผลแล้วตาม ledger โดยไม่ต้องดาวน์โหลดใหม่
+        with timer.phase('list'):
+            ftp = connect_ftp()
+            file_info, already_processed = list_pending_files(ftp)
+        
+        report_progress(files_total=len(file_info), files_processed=0)
+        # download_wait คือเวลาที่รอไฟล์ถัดไปจาก worker ที่ดาวน์โหลดขนานอยู่
+        for filename, spool, sha256, error in timer.iterate(download_files(list(file_info)), 'download_wait'):
+            increment_progress(files_processed=1)
+            if error:
+                print(f"Failed to download {filename}: {error}")
+                failed_files.append(filename)
+                continue
             
-            files = ftp.nlst()
-            
-            for filename in files:
-                if filename.endswith('.csv'):
-                    file_data = io.BytesIO()
-                    ftp.retrbinary(f"RETR {filename}", file_data.write)
-                    file_data.seek(0)
-                    
-                    csv_reader = csv.DictReader(io.StringIO(file_data.read().decode('utf-8')))
-                    
-                    for row in csv_reader:
-                        # Debug: แสดง employee_id ที่กำลังดำเนิน
-                        print(f"Processing employee_id: {row['employeeid']}")
-                        
-                        # ตรวจสอบว่ามีพนักงานที่มี employee_id นี้อยู่แล้ว
-                        employee = Employee.query.filter_by(employee_id=row['employeeid']).first()
-                        
-                        if not employee:
-                            # สร้าง employee ใหม่
-                            employee = Employee(employee_id=row['employeeid'])
-                            print(f"Creating new employee with ID: {row['employeeid']}")
-                        else:
-                            # ตรวจสอบว่ามีการอัพเดตข้อมูลใน CSV (fname, lname)
-                            has_update_data = any([row.get('EFNAME'), row.get('ELNAME')])
-                            
-                            if has_update_data:
-                                print(f"Updating existing employee with ID: {row['employeeid']}")
-                        
-                        # อัพเดตข้อมูลจาก CSV สำหรับทั้งพนักงานใหม่และพนักงานเดิม
-                        if row.get('EFNAME'):
-                            employee.fname = row.get('EFNAME')
-                        if row.get('ELNAME'):
-                            employee.lname = row.get('ELNAME')
-                        if row.get('phone'):
-                            employee.phone = row.get('phone')
-                        if row.get('Division'):
-                            employee.department = row.get('Division')
-                        if row.get('POSITION'):
-                            employee.position = row.get('POSITION')
-                        
-                        # แปลงวันที่เริ่มงาน (รับเป็นปี พ.ศ.)
-                        try:
-                            if row.get('start_date'):
-                                # แปลงจาก พ.ศ. เป็น ค.ศ. สำหรับเก็บในฐานข้อมูล
-                                date_obj = datetime.strptime(row.get('start_date'), '%Y-%m-%d')
-                                if date_obj.year > 2500:  # ถ้าเป็นปี พ.ศ.
-                                    buddhist_year = date_obj.year
-                                    gregorian_year = buddhist_year - 543
-                                    date_obj = date_obj.replace(year=gregorian_year)
-                                employee.start_date = date_obj.date()
-                            else:
-                                employee.start_date = None
-                        except (ValueError, TypeError):
-                            employee.start_date = None
-                        
-                        employee.status = row.get('status')
-                        
-                        # แปลงวันที่ลาออก (รับเป็นปี พ.ศ.)
-                        try:
-                            if row.get('resigndate'):
-                                # แปลงจาก พ.ศ. เป็น ค.ศ. สำหรับเก็บในฐานข้อมูล
-                                date_obj = datetime.strptime(row.get('resigndate'), '%Y-%m-%d')
-                                if date_obj.year > 2500:  # ถ้าเป็นปี พ.ศ.
-                                    buddhist_year = date_obj.year
-                                    gregorian_year = buddhist_year - 543
-                                    date_obj = date_obj.replace(year=gregorian_year)
-                                employee.resigndate = date_obj.date()
-                                # ถ้ามีวันที่ลาออก ให้ตั้งค่า account_expires_date อัตโนมัติเป็นวันเดียวกับ resigndate
-                                employee.account_expires_date = employee.resigndate
-                            else:
-                                employee.resigndate = None
-                        except (ValueError, TypeError):
-                            employee.resigndate = None
-                        
-                        # แปลงวันที่หมดอายุบัญชี (รับเป็นปี พ.ศ.)
-                        try:
-                            # ตรวจสอบว่ามีการกำหนด account_expires_date ในไฟล์ CSV และไม่มี resigndate
-                            if row.get('account_expires_date') and not employee.resigndate:
-                                # แปลงจาก พ.ศ. เป็น ค.ศ. สำหรับเก็บในฐานข้อมูล
-                                date_obj = datetime.strptime(row.get('account_expires_date'), '%Y-%m-%d')
-                                if date_obj.year > 2500:  # ถ้าเป็นปี พ.ศ.
-                                    buddhist_year = date_obj.year
-                                    gregorian_year = buddhist_year - 543
-                                    date_obj = date_obj.replace(year=gregorian_year)
-                                employee.account_expires_date = date_obj.date()
-                            # ถ้าไม่มี account_expires_date ใน CSV และไม่มี resigndate ให้เป็น None
-                            elif not row.get('account_expires_date') and not employee.resigndate:
-                                employee.account_expires_date = None
-                        except (ValueError, TypeError):
-                            # ถ้ามี error แต่มี resigndate ให้คงค่า account_expires_date ที่ตั้งจาก resigndate ไว้
-                            if not employee.resigndate:
-                                employee.account_expires_date = None
-                        
-                        employee.last_updated = get_asia_bangkok_time()  # อัพเดตเวลาเป็น Asia/Bangkok
-                        employee.ad_updated = False  # รีเซ็ตสถานะเพื่อให้อัพเดต AD ใหม่
-                        
-                        # ตรวจสอบว่าข้อมูลครบถ้วก่อนมีค่า null สำหรับ required fields
-                        if not any([employee.fname, employee.lname]):
-                            print(f"Skipping employee {row['employeeid']} - all required fields are null")
-                            continue
-                        
-                        db.session.add(employee)
-                
-            db.session.commit()
+            size, modified_at = file_info[filename]
+            row_count = 0
             try:
-                for filename in files:
-                    ftp.rename(filename, f"processed/{filename}")
-                    print(f"Successfully moved {filename} to processed folder")
-            except Exception as rename_error:
-                print(f"Failed to move {filename} to processed folder: {rename_error}")
-                # Continue with other files even if rename fails
+                if is_content_processed(sha256):
+                    # เนื้อหาเดียวกับไฟล์ล่าสุดที่เพิ่งประมวลผล (เช่น อัปโหลดซ้ำ)
+                    logger.warning(f"Skipping {filename} - same content as the last processed file")
+                    duplicate_files += 1
+                else:
+                    def rows():
+                        nonlocal row_count
+                        for row in iter_csv_rows(spool):
+                            row_count += 1
+                            yield row
+                    
+                    stats = upsert_employee_records(timer.iterate(parse_ftp_rows(rows()), 'parse'), require_name=True)
+                    for key in totals:
+                        totals[key] += stats[key]
+                    print(f"Processed {filename}: {stats['inserted']} new, {stats['updated']} updated, {stats['unchanged']} unchanged, {stats['skipped']} skipped")
                 
+                with timer.phase('commit'):
+                    record_processed_file(filename, size, modified_at, sha256, row_count)
+                    db.session.commit()
+            except Exception as e:
+                print(f"Error processing {filename}: {e}")
+                record_error('ftp', e)
+                db.session.rollback()
+                failed_files.append(filename)
+                continue
+            finally:
+                spool.close()
+            
+            # ย้ายไฟล์เฉพาะที่ commit สำเร็จแล้ว
+            with timer.phase('move'):
+                move_to_processed(ftp, filename)
+        
+        # อัปเดต record ตามผลลัพธ์
+        sync_record.status = 'failed' if failed_files else 'success'
+        sync_record.end_time = get_asia_bangkok_time()
+        sync_record.message = f"FTP Sync completed. New: {totals['inserted']}, Updated: {totals['updated']}, Unchanged: {totals['unchanged']}, Skipped: {totals['skipped']}, Files already processed: {already_processed}, Duplicate files skipped: {duplicate_files}"
+        if failed_files:
+            sync_record.error_message = f"Failed files: {', '.join(failed_files)}"
+        sync_record.updated_count = totals['inserted'] + totals['updated']
+        sync_record.unchanged_count = totals['unchanged']
+        sync_record.phase_timings = timer.finish(sync_record.status)
+        db.session.add(sync_record)
+        db.session.commit()
+        
         ftp.quit()
-        return True
+        return not failed_files
     except Exception as e:
         print(f"Error fetching employees from FTP: {e}")
+        record_error('ftp', e)
         db.session.rollback()
-        return False
\ No newline at end of file
+        if ftp:
+            ftp.close()
+        
+        # อัปเดต record ว่าล้มเหลว
+        sync_record.status = 'failed'
+        sync_record.end_time = get_asia_bangkok_time()
+        sync_record.error_message = str(e)
+        sync_record.phase_timings = timer.finish('failed')
+        db.session.add(sync_record)
+        db.session.commit()
+        return False
@@ -0,0 +1,336 @@
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from sqlalchemy import text, update
+from app_factory import db, get_asia_bangkok_time
+from app.models.sync_job import SyncJob
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_STATUSES = ('queued', 'running')
+
+# ข้อมูลที่แต่ละงานเขียน งานที่มีกลุ่มร่วมกันห้ามทำงานพร้อมกัน ('all' เขียนทุกกลุ่ม)
+JOB_LOCK_GROUPS = {
+    'myhr': ('myhr',),
+    'myhr_full': ('myhr',),
+    'ftp': ('ftp',),
+    'ad': ('ad',),
+    'all': ('myhr', 'ftp', 'ad'),
+    'retention': ('retention',),
+}
+
+# งานที่ห้ามทำงานพร้อมกัน: งานชนิดเดียวกัน และ 'all' ชนกับทุกงานยกเว้น retention
+JOB_CONFLICTS = {
+    job_type: tuple(other for other, other_groups in JOB_LOCK_GROUPS.items() if set(groups) & set(other_groups))
+    for job_type, groups in JOB_LOCK_GROUPS.items()
+}
+
+# key ของ pg advisory lock ต่อกลุ่ม ('HRJ' + ลำดับ) ใช้ร่วมกันทุก process และทุก replica
+JOB_LOCK_KEYS = {
+    'myhr': 0x48524A01,
+    'ftp': 0x48524A02,
+    'ad': 0x48524A03,
+    'retention': 0x48524A04,
+}
+
+_executor = None
+_lock = threading.Lock()
+_live_progress = {}
+_current = threading.local()
+# งานที่ process นี้ส่งเข้า executor แล้วแต่ยังไม่เริ่มทำงาน: job_id -> app
+_queued_jobs = {}
+_queue_heartbeat = None
+
+def _run_myhr():
+    from app.services import myhr_service
+    return myhr_service.fetch_employees_from_api()
+
+def _run_myhr_full():
+    from app.services import myhr_service
+    return myhr_service.fetch_employees_from_api(full=True)
+
+def _run_ftp():
+    from app.services import ftp_service
+    return ftp_service.fetch_employees_from_ftp()
+
+def _run_ad():
+    from app.services import ad_service
+    return ad_service.update_active_directory()
+
+def _run_all():
+    from app.services import sync_pipeline
+    return sync_pipeline.run_full_sync()
+
+def _run_retention():
+    from app.services import retention
+    return dict(retention.apply_retention(), success=True)
+
+JOB_FUNCTIONS = {
+    'myhr': _run_myhr,
+    'myhr_full': _run_myhr_full,
+    'ftp': _run_ftp,
+    'ad': _run_ad,
+    'all': _run_all,
+    'retention': _run_retention,
+}
+
+def _get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(Config, 'SYNC_JOB_WORKERS', 2),
+                thread_name_prefix='sync-job'
+            )
+        return _executor
+
+def report_progress(**counters):
+    """
+    Update the progress counters of the job running in the current thread.
+    Does nothing when called outside a job (e.g. from a script).
+    """
+    job_id = getattr(_current, 'job_id', None)
+    if job_id is None:
+        return
+    with _lock:
+        _live_progress.setdefault(job_id, {}).update(counters)
+
+def _increment(job_id, deltas):
+    with _lock:
+        progress = _live_progress.setdefault(job_id, {})
+        for key, delta in deltas.items():
+            progress[key] = progress.get(key, 0) + delta
+
+def increment_progress(**deltas):
+    """
+    Add to the progress counters of the job running in the current thread.
+    """
+    job_id = getattr(_current, 'job_id', None)
+    if job_id is not None:
+        _increment(job_id, deltas)
+
+def progress_counter(key):
+    """
+    Return a callable that adds 1 to a progress counter of the current job.
+    Unlike increment_progress it can be called from worker threads.
+    """
+    job_id = getattr(_current, 'job_id', None)
+    if job_id is None:
+        return lambda: None
+    return lambda: _increment(job_id, {key: 1})
+
+def _live_progress_for(job_id):
+    with _lock:
+        progress = _live_progress.get(job_id)
+        return dict(progress) if progress is not None else None
+
+def _expire_stale_jobs(job_types):
+    """
+    Mark active jobs whose heartbeat stopped (e.g. the process was restarted) as failed.
+    Queued jobs are heartbeated by the process that queued them, so only jobs
+    whose owning process is gone are expired. The caller commits.
+    """
+    stale_before = get_asia_bangkok_time() - timedelta(seconds=getattr(Config, 'SYNC_JOB_STALE_SECONDS', 300))
+    stale_jobs = SyncJob.query.filter(
+        SyncJob.job_type.in_(job_types),
+        SyncJob.status.in_(ACTIVE_STATUSES),
+        db.func.coalesce(SyncJob.heartbeat_at, SyncJob.created_at) < stale_before
+    ).all()
+    for job in stale_jobs:
+        job.status = 'failed'
+        job.finished_at = get_asia_bangkok_time()
+        job.error_message = 'Job stopped reporting progress and was marked as failed.'
+        db.session.add(job)
+
+def _lock_job_groups(job_type):
+    """
+    On PostgreSQL, take a transaction-level advisory lock for every group the
+    job writes (in a fixed order, so two submits cannot deadlock). The locks
+    are held until the commit or rollback that ends submit_job's check and
+    insert, which makes them atomic across processes and replicas.
+    """
+    if db.engine.dialect.name != 'postgresql':
+        return
+    for group in sorted(JOB_LOCK_GROUPS[job_type]):
+        db.session.execute(text("SELECT pg_advisory_xact_lock(:key)"), {'key': JOB_LOCK_KEYS[group]})
+
+def submit_job(app, job_type):
+    """
+    Queue a sync job and return (job, created). When a conflicting job is
+    already queued or running, that job is returned instead with created=False.
+
+    On PostgreSQL the check and insert run under advisory locks, so this holds
+    across gunicorn workers, the scheduler and other replicas. On other
+    databases only the process-local lock applies: run a single process.
+    """
+    if job_type not in JOB_FUNCTIONS:
+        raise ValueError(f"Unknown job type: {job_type}")
+
+    with _lock:
+        conflicts = JOB_CONFLICTS[job_type]
+        try:
+            _lock_job_groups(job_type)
+            _expire_stale_jobs(conflicts)
+            active = SyncJob.query.filter(
+                SyncJob.job_type.in_(conflicts),
+                SyncJob.status.in_(ACTIVE_STATUSES)
+            ).order_by(SyncJob.id).first()
+            if active:
+                db.session.commit()
+                return active, False
+
+            now = get_asia_bangkok_time()
+            job = SyncJob(job_type=job_type, status='queued', created_at=now, heartbeat_at=now)
+            db.session.add(job)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+        _queued_jobs[job.id] = app
+        _start_queue_heartbeat()
+
+    _get_executor().submit(_run_job, app, job.id)
+    return job, True
+
+def _start_queue_heartbeat():
+    """
+    Start the thread that heartbeats this process's queued jobs; the caller holds _lock.
+    """
+    global _queue_heartbeat
+    if _queue_heartbeat is None or not _queue_heartbeat.is_alive():
+        _queue_heartbeat = threading.Thread(target=_queue_heartbeat_loop, name='sync-job-queue', daemon=True)
+        _queue_heartbeat.start()
+
+def _queue_heartbeat_loop():
+    """
+    Keep heartbeat_at fresh for jobs waiting for a free worker, so a job queued
+    behind long-running ones is not expired as stale while it waits.
+    """
+    interval = getattr(Config, 'SYNC_JOB_HEARTBEAT_SECONDS', 5)
+    while True:
+        time.sleep(interval)
+        with _lock:
+            queued = dict(_queued_jobs)
+        by_app = {}
+        for job_id, app in queued.items():
+            by_app.setdefault(app, []).append(job_id)
+        for app, job_ids in by_app.items():
+            try:
+                with app.app_context(), db.engine.begin() as conn:
+                    conn.execute(
+                        update(SyncJob)
+                        .where(SyncJob.id.in_(job_ids), SyncJob.status == 'queued')
+                        .values(heartbeat_at=get_asia_bangkok_time())
+                    )
+            except Exception as e:
+                logger.warning(f"Failed to write heartbeat for queued jobs {job_ids}: {e}")
+
+def _heartbeat_loop(app, job_id, stop_event):
+    """
+    Persist live progress and a heartbeat timestamp while the job runs.
+    Uses its own connection so it never commits the job's session.
+    """
+    interval = getattr(Config, 'SYNC_JOB_HEARTBEAT_SECONDS', 5)
+    with app.app_context():
+        while not stop_event.wait(interval):
+            try:
+                with db.engine.begin() as conn:
+                    conn.execute(
+                        update(SyncJob)
+                        .where(SyncJob.id == job_id)
+                        .values(heartbeat_at=get_asia_bangkok_time(),
+                                progress=json.dumps(_live_progress_for(job_id) or {}))
+                    )
+            except Exception as e:
+                logger.warning(f"Failed to write heartbeat for job {job_id}: {e}")
+
+def _summarize_result(result):
+    """
+    Keep job results small: per-employee AD results stay in SyncItemResult.
+    """
+    limit = getattr(Config, 'SYNC_JOB_RESULT_LOG_LIMIT', 200)
+    if isinstance(result, dict):
+        result = dict(result)
+        for key, value in result.items():
+            if isinstance(value, dict):
+                result[key] = _summarize_result(value)
+        log_messages = result.get('log_messages')
+        if isinstance(log_messages, list) and len(log_messages) > limit:
+            result['log_messages'] = log_messages[:limit] + [f"... {len(log_messages) - limit} more messages in sync history"]
+    return result
+
+def _run_job(app, job_id):
+    with app.app_context():
+        with _lock:
+            _queued_jobs.pop(job_id, None)
+        # เริ่มเฉพาะงานที่ยังอยู่ในสถานะ queued (งานที่ถูก expire ไปแล้วต้องไม่ทำงานซ้ำกับงานใหม่)
+        now = get_asia_bangkok_time()
+        claimed = db.session.execute(
+            update(SyncJob)
+            .where(SyncJob.id == job_id, SyncJob.status == 'queued')
+            .values(status='running', started_at=now, heartbeat_at=now)
+        ).rowcount
+        db.session.commit()
+        if not claimed:
+            logger.warning(f"Sync job {job_id} is no longer queued; not starting it")
+            db.session.remove()
+            return
+        job = db.session.get(SyncJob, job_id)
+
+        _current.job_id = job_id
+        with _lock:
+            _live_progress[job_id] = {}
+        stop_event = threading.Event()
+        heartbeat = threading.Thread(target=_heartbeat_loop, args=(app, job_id, stop_event), daemon=True)
+        heartbeat.start()
+
+        status = 'failed'
+        result = None
+        error_message = None
+        try:
+            result = JOB_FUNCTIONS[job.job_type]()
+            success = result.get('success') if isinstance(result, dict) else bool(result)
+            status = 'success' if success else 'failed'
+        except Exception as e:
+            logger.error(f"Sync job {job_id} ({job.job_type}) failed: {e}")
+            error_message = str(e)
+        finally:
+            stop_event.set()
+            heartbeat.join()
+            _current.job_id = None
+            with _lock:
+                progress = _live_progress.pop(job_id, {})
+
+            db.session.rollback()
+            job = db.session.get(SyncJob, job_id)
+            job.status = status
+            job.finished_at = get_asia_bangkok_time()
+            job.progress = json.dumps(progress)
+            job.result = json.dumps(_summarize_result(result), default=str)
+            job.error_message = error_message
+            db.session.commit()
+            db.session.remove()
+
+def job_to_dict(job):
+    """
+    Serialize a job for the status API, overlaying live progress when it runs in this process.
+    """
+    progress = _live_progress_for(job.id)
+    if progress is None:
+        progress = json.loads(job.progress) if job.progress else {}
+    return {
+        'job_id': job.id,
+        'job_type': job.job_type,
+        'status': job.status,
+        'created_at': job.created_at.strftime('%Y-%m-%d %H:%M:%S') if job.created_at else None,
+        'started_at': job.started_at.strftime('%Y-%m-%d %H:%M:%S') if job.started_at else None,
+        'finished_at': job.finished_at.strftime('%Y-%m-%d %H:%M:%S') if job.finished_at else None,
+        'progress': progress,
+        'result': json.loads(job.result) if job.result else None,
+        'error_message': job.error_message,
+    }
@@ -0,0 +1,205 @@
+import logging
+import random
+import threading
+import time
+from ldap3 import Server, Connection, NONE, DSA, SCHEMA, ALL
+from ldap3.core.exceptions import LDAPOperationResult
+from app.utils.metrics import LDAP_OPERATION_SECONDS, record_error
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+GET_INFO_OPTIONS = {'NONE': NONE, 'DSA': DSA, 'SCHEMA': SCHEMA, 'ALL': ALL}
+
+class LDAPConnectionPool:
+    """
+    Thread-safe pool of bound ldap3 connections to the AD server.
+
+    Connections are created lazily and bound on first checkout. Idle
+    connections are health-checked before reuse, and extra idle connections
+    beyond min_idle are closed once they sit unused for max_idle_seconds.
+    The ldap3 Server object is built once, so schema/DSA info (if requested
+    with AD_GET_INFO) is downloaded at most once per process.
+    """
+
+    def __init__(self, create_connection=None, max_size=8, min_idle=1, max_idle_seconds=300,
+                 health_check_seconds=60, acquire_timeout=60, max_retries=3,
+                 retry_base_delay=1, retry_max_delay=60):
+        self._create_connection = create_connection or self._create_ad_connection
+        self.max_size = max_size
+        self.min_idle = min_idle
+        self.max_idle_seconds = max_idle_seconds
+        self.health_check_seconds = health_check_seconds
+        self.acquire_timeout = acquire_timeout
+        self.max_retries = max_retries
+        self.retry_base_delay = retry_base_delay
+        self.retry_max_delay = retry_max_delay
+
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._idle = []  # list of (connection, last_used_monotonic)
+        self._server = None
+
+    def _get_server(self):
+        with self._lock:
+            if self._server is None:
+                get_info = GET_INFO_OPTIONS.get(str(getattr(Config, 'AD_GET_INFO', 'NONE')).upper(), NONE)
+                self._server = Server(
+                    Config.AD_SERVER,
+                    port=getattr(Config, 'AD_PORT', 389),
+                    get_info=get_info,
+                    connect_timeout=getattr(Config, 'AD_CONNECTION_TIMEOUT', 30),
+                    use_ssl=getattr(Config, 'AD_USE_SSL', False)
+                )
+            return self._server
+
+    def _create_ad_connection(self):
+        return Connection(
+            self._get_server(),
+            user=f"{Config.AD_USER}@{Config.AD_DOMAIN}",
+            password=Config.AD_PASSWORD,
+            auto_bind=False,
+            client_strategy='SYNC',
+            receive_timeout=getattr(Config, 'AD_READ_TIMEOUT', 30),
+            raise_exceptions=True
+        )
+
+    def _backoff_delay(self, attempt):
+        """
+        Exponential backoff with jitter: a random delay in [50%, 100%] of base * 2^attempt.
+        """
+        delay = min(self.retry_max_delay, self.retry_base_delay * (2 ** attempt))
+        return delay * random.uniform(0.5, 1.0)
+
+    def _open_connection(self):
+        """
+        Create and bind a new connection, retrying with exponential backoff.
+        """
+        for attempt in range(self.max_retries):
+            conn = None
+            try:
+                conn = self._create_connection()
+                if not conn.bound:
+                    with LDAP_OPERATION_SECONDS.time(operation='bind'):
+                        conn.bind()
+                logger.info(f"Opened new AD connection (attempt {attempt + 1}/{self.max_retries})")
+                return conn
+            except Exception as e:
+                self._close(conn)
+                record_error('ldap_connect', e)
+                logger.error(f"AD connection error on attempt {attempt + 1}: {e}")
+                if attempt < self.max_retries - 1:
+                    delay = self._backoff_delay(attempt)
+                    logger.info(f"Retrying in {delay:.1f} seconds...")
+                    time.sleep(delay)
+                else:
+                    raise Exception(f"Failed to connect to AD after {self.max_retries} attempts: {e}")
+
+    def _is_healthy(self, conn):
+        if conn.closed or not conn.bound:
+            return False
+        try:
+            conn.extend.standard.who_am_i()
+            return True
+        except LDAPOperationResult:
+            # เซิร์ฟเวอร์ตอบกลับมา แม้จะปฏิเสธ operation ก็ถือว่า connection ยังใช้ได้
+            return True
+        except Exception as e:
+            logger.warning(f"Idle AD connection failed health check: {e}")
+            return False
+
+    def _close(self, conn):
+        if conn is None:
+            return
+        try:
+            conn.unbind()
+        except Exception as e:
+            logger.warning(f"Error closing AD connection: {e}")
+
+    def _prune_idle(self):
+        """
+        Close idle connections that have been unused for too long, keeping min_idle of them.
+        """
+        now = time.monotonic()
+        expired = []
+        with self._lock:
+            keep = []
+            for conn, last_used in self._idle:
+                if now - last_used > self.max_idle_seconds and len(self._idle) - len(expired) > self.min_idle:
+                    expired.append(conn)
+                else:
+                    keep.append((conn, last_used))
+            self._idle = keep
+        for conn in expired:
+            self._close(conn)
+
+    def acquire(self):
+        """
+        Check out a bound connection, reusing an idle one when possible.
+        """
+        if not self._slots.acquire(timeout=self.acquire_timeout):
+            raise Exception(f"Timed out after {self.acquire_timeout}s waiting for a free AD connection")
+        try:
+            self._prune_idle()
+            while True:
+                with self._lock:
+                    if not self._idle:
+                        break
+                    conn, last_used = self._idle.pop()
+                if time.monotonic() - last_used < self.health_check_seconds or self._is_healthy(conn):
+                    return conn
+                self._close(conn)
+            return self._open_connection()
+        except Exception:
+            self._slots.release()
+            raise
+
+    def release(self, conn, discard=False):
+        """
+        Return a connection to the pool. Broken connections should be released with discard=True.
+        """
+        if discard or conn.closed or not conn.bound:
+            self._close(conn)
+        else:
+            with self._lock:
+                self._idle.append((conn, time.monotonic()))
+        self._slots.release()
+
+    def close_all(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn, _ in idle:
+            self._close(conn)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_ad_pool():
+    """
+    Return the process-wide AD connection pool, creating it from Config on first use.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = LDAPConnectionPool(
+                max_size=getattr(Config, 'AD_POOL_MAX_SIZE', 8),
+                min_idle=getattr(Config, 'AD_POOL_MIN_IDLE', 1),
+                max_idle_seconds=getattr(Config, 'AD_POOL_MAX_IDLE_SECONDS', 300),
+                health_check_seconds=getattr(Config, 'AD_POOL_HEALTH_CHECK_SECONDS', 60),
+                acquire_timeout=getattr(Config, 'AD_POOL_ACQUIRE_TIMEOUT', 60),
+                max_retries=getattr(Config, 'AD_MAX_RETRIES', 3),
+                retry_base_delay=getattr(Config, 'AD_RETRY_DELAY', 5),
+                retry_max_delay=getattr(Config, 'AD_RETRY_MAX_DELAY', 60)
+            )
+        return _pool
+
+def set_ad_pool(pool):
+    """
+    Replace the process-wide pool (used by benchmarks to point the sync at a mock directory).
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close_all()
+        _pool = pool
@@ -0,0 +1,151 @@
+import logging
+import threading
+from urllib.parse import urljoin
+import requests
+from requests.adapters import HTTPAdapter
+from app.utils.metrics import HTTP_REQUEST_SECONDS
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# key ที่อาจเก็บรายการพนักงานเมื่อ API ตอบเป็น object แบบแบ่งหน้า
+RECORD_KEYS = ('data', 'items', 'employees', 'results')
+
+_session = None
+_session_lock = threading.Lock()
+
+def get_myhr_session():
+    """
+    Return the process-wide requests.Session for MyHR, so TCP/TLS connections
+    are kept alive and reused across pages and sync runs.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=getattr(Config, 'MYHR_POOL_MAX_SIZE', 4))
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            session.headers.update({'Accept': 'application/json'})
+            _session = session
+        return _session
+
+def _page_records(body):
+    if isinstance(body, list):
+        return body
+    if isinstance(body, dict):
+        for key in RECORD_KEYS:
+            if isinstance(body.get(key), list):
+                return body[key]
+    raise ValueError(f"Unexpected MyHR response: expected a list or an object with one of {', '.join(RECORD_KEYS)}")
+
+def _next_page(response, body, url, params):
+    """
+    Find the next page from a Link header, a 'next' URL or a 'next_cursor'
+    token in the body. Returns (url, params) or None on the last page.
+    """
+    link = response.links.get('next')
+    if link:
+        return urljoin(response.url, link['url']), {}
+    if isinstance(body, dict):
+        if body.get('next'):
+            return urljoin(response.url, body['next']), {}
+        if body.get('next_cursor'):
+            return url, dict(params, **{getattr(Config, 'MYHR_CURSOR_PARAM', 'cursor'): body['next_cursor']})
+    return None
+
+class MyHRFetch:
+    """
+    One download of the MyHR employee list. Iterating yields the raw employee
+    records page by page, so only one page is held in memory at a time.
+
+    The first request carries If-None-Match / If-Modified-Since when etag or
+    last_modified is given; a 304 ends the iteration with not_modified set.
+    After iteration, etag and last_modified hold the validators to send next
+    time, and pages / records_received describe what came over the wire.
+    Validators are only kept when the whole list came back as one page: the
+    ETag of page 1 says nothing about later pages, so a paginated download is
+    never skipped on the strength of it.
+
+    watermark is where the next delta fetch should start: the change token
+    the API returned (MYHR_WATERMARK_TOKEN_KEY, last page wins), otherwise the
+    highest MYHR_WATERMARK_FIELD seen in the records (ISO 8601 timestamps
+    compare correctly as strings). None when the API provides neither.
+    """
+
+    def __init__(self, etag=None, last_modified=None, params=None):
+        self.request_etag = etag
+        self.request_last_modified = last_modified
+        self.params = dict(params or {})
+        self.not_modified = False
+        self.etag = None
+        self.last_modified = None
+        self.pages = 0
+        self.records_received = 0
+        self.watermark = None
+        self._token = None
+        self._highest = None
+
+    def _get(self, url, params, conditional):
+        headers = {'Authorization': f'Bearer {Config.MYHR_API_KEY}'}
+        if conditional:
+            if self.request_etag:
+                headers['If-None-Match'] = self.request_etag
+            if self.request_last_modified:
+                headers['If-Modified-Since'] = self.request_last_modified
+        with HTTP_REQUEST_SECONDS.time(source='myhr'):
+            response = get_myhr_session().get(url, params=params, headers=headers,
+                                              timeout=getattr(Config, 'MYHR_TIMEOUT', 30))
+            if response.status_code == 304:
+                return response, None
+            response.raise_for_status()
+            return response, response.json()
+
+    def _advance_watermark(self, body, records):
+        token_key = getattr(Config, 'MYHR_WATERMARK_TOKEN_KEY', 'sync_token')
+        if isinstance(body, dict) and body.get(token_key):
+            self._token = str(body[token_key])
+        field = getattr(Config, 'MYHR_WATERMARK_FIELD', 'updated_at')
+        values = [str(record[field]) for record in records if record.get(field)]
+        if values:
+            highest = max(values)
+            if self._highest is None or highest > self._highest:
+                self._highest = highest
+        self.watermark = self._token or self._highest
+
+    def __iter__(self):
+        url = Config.MYHR_API_URL
+        params = dict(self.params)
+        page_size = getattr(Config, 'MYHR_PAGE_SIZE', 0)
+        if page_size:
+            params[getattr(Config, 'MYHR_PAGE_SIZE_PARAM', 'limit')] = page_size
+
+        seen = set()
+        while True:
+            response, body = self._get(url, params, conditional=self.pages == 0)
+            if response.status_code == 304:
+                # เช็คเฉพาะหน้าแรก: ETag ของหน้าแรกต้องเปลี่ยนเมื่อข้อมูลชุดใดก็ตามเปลี่ยน
+                logger.info("MyHR data not modified since last sync")
+                self.not_modified = True
+                return
+            if self.pages == 0:
+                self.etag = response.headers.get('ETag')
+                self.last_modified = response.headers.get('Last-Modified')
+
+            records = _page_records(body)
+            self.pages += 1
+            self.records_received += len(records)
+            self._advance_watermark(body, records)
+            next_page = _next_page(response, body, url, params)
+            yield from records
+
+            if next_page is None:
+                if self.pages > 1:
+                    self.etag = None
+                    self.last_modified = None
+                return
+            url, params = next_page
+            key = (url, tuple(sorted(params.items())))
+            if key in seen:
+                raise ValueError(f"MyHR pagination loop at {url}")
+            seen.add(key)
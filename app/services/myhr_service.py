@@ -1,73 +1,158 @@
-import requests
 from app_factory import db, get_asia_bangkok_time
-from app.models.employee import Employee
+from app.models.sync_history import SyncHistory
+from app.models.sync_source_state import SyncSourceState
+from app.services.employee_ingest import upsert_employee_records
+from app.services.myhr_client import MyHRFetch
+from app.utils.date_utils import parse_be_date, parse_be_date_columns
+from app.utils.metrics import PhaseTimer, record_error
 from config import Config
-from datetime import datetime
+from datetime import timedelta
 
-def convert_date_format(date_str):
+# คอลัมน์วันที่ (ปี พ.ศ.) ใน record ของ MyHR
+MYHR_DATE_FIELDS = ('start_date', 'resigndate', 'account_expires_date')
+
+def parse_myhr_record(emp_data, dates=None):
     """
-    แปลงวันที่ได้รับจาก API หรือ FTP และ MyHR API
-    รับเป็นปี พ.ศ. และแปลงเป็น ค.ศ. สำหรับเก็บในฐานข้อมูล
+    Convert a MyHR API record into an employee record for upsert_employee_records.
+    Every field is overwritten with the API value, even when it is empty.
+    dates holds the already converted MYHR_DATE_FIELDS in order (see parse_myhr_records);
+    without it each date is parsed here.
     """
-    if not date_str:
-        return None
+    if dates is None:
+        dates = [parse_be_date(emp_data.get(field)) for field in MYHR_DATE_FIELDS]
+    start_date, resigndate, account_expires_date = dates
+    record = {
+        'employee_id': emp_data['employeeid'],
+        'fname': emp_data.get('fname'),
+        'lname': emp_data.get('lname'),
+        'phone': emp_data.get('phone'),
+        'department': emp_data.get('department'),
+        'position': emp_data.get('empPostionTdesc'),
+        'start_date': start_date,
+        'status': emp_data.get('status'),
+        # แปลงวันที่ลาออก (รับเป็นปี พ.ศ.)
+        'resigndate': resigndate,
+    }
     
-    try:
-        # แปลง string เป็น datetime object
-        date_obj = datetime.strptime(date_str, '%Y-%m-%d')
-        # ถ้าเป็นปี พ.ศ. (year > 2500) ให้แปลงเป็น ค.ศ.
-        if date_obj.year > 2500:
-            buddhist_year = date_obj.year
-            gregorian_year = buddhist_year - 543
-            date_obj = date_obj.replace(year=gregorian_year)
-        return date_obj.date()
-    except (ValueError, TypeError):
-        return None
+    # แปลงวันที่หมดอายุบัญชี (รับเป็นปี พ.ศ.)
+    if emp_data.get('resigndate'):
+        # ถ้ามีวันที่ลาออก ให้ตั้งค่า account_expires_date อัตโนมัติเป็นวันเดียวกับ resigndate
+        record['account_expires_date'] = record['resigndate']
+    elif emp_data.get('account_expires_date'):
+        # ถ้าไม่มี resigndate แต่มี account_expires_date ให้ใช้ค่านั้น
+        record['account_expires_date'] = account_expires_date
+    else:
+        # ถ้าไม่มีทั้งสองอย่างให้เป็น None
+        record['account_expires_date'] = None
+    
+    return record
+
+def parse_myhr_records(records):
+    """
+    Convert a stream of MyHR records, parsing the date columns of each
+    INGEST_CHUNK_SIZE chunk at once with parse_be_dates.
+    """
+    chunk_size = getattr(Config, 'INGEST_CHUNK_SIZE', 1000)
+    for emp_data, dates in parse_be_date_columns(records, MYHR_DATE_FIELDS, chunk_size):
+        yield parse_myhr_record(emp_data, dates)
+
+def get_source_state(source='myhr'):
+    state = SyncSourceState.query.filter_by(source=source).first()
+    if state is None:
+        state = SyncSourceState(source=source)
+    return state
+
+def _full_pull_due(state, full):
+    """A full pull is forced on demand and every MYHR_FULL_SYNC_INTERVAL_HOURS."""
+    if full or state.last_full_sync_at is None:
+        return True
+    interval = timedelta(hours=getattr(Config, 'MYHR_FULL_SYNC_INTERVAL_HOURS', 24))
+    return get_asia_bangkok_time() - state.last_full_sync_at >= interval
+
+def _use_full_fetch(state, full):
+    """
+    A delta fetch needs a watermark; a full pull is also used when
+    MYHR_DELTA_SYNC is off and whenever _full_pull_due says so.
+    """
+    if not getattr(Config, 'MYHR_DELTA_SYNC', True) or not state.watermark:
+        return True
+    return _full_pull_due(state, full)
 
-def fetch_employees_from_api():
+def start_myhr_fetch(state, full=False):
+    """
+    Build the MyHRFetch for this run from the stored source state.
+    Returns (fetch, mode) with mode 'delta' or 'full'. A due full pull is
+    sent without validators, so a 304 can never stand in for it.
+    """
+    if not _use_full_fetch(state, full):
+        return MyHRFetch(params={getattr(Config, 'MYHR_DELTA_PARAM', 'updated_since'): state.watermark}), 'delta'
+    if getattr(Config, 'MYHR_CONDITIONAL_REQUESTS', True) and not _full_pull_due(state, full):
+        return MyHRFetch(etag=state.etag, last_modified=state.last_modified), 'full'
+    return MyHRFetch(), 'full'
+
+def advance_source_state(state, fetch, mode):
+    """
+    Store the validators, watermark and full-pull time from a finished fetch.
+    Call it before the commit that writes the fetched records, so a failed
+    run starts again from the previous point.
+    """
+    if fetch.not_modified:
+        return
+    if mode == 'full':
+        state.etag = fetch.etag
+        state.last_modified = fetch.last_modified
+        state.last_full_sync_at = get_asia_bangkok_time()
+    if fetch.watermark:
+        state.watermark = fetch.watermark
+    db.session.add(state)
+
+def fetch_employees_from_api(full=False):
+    """
+    Sync employees from MyHR. Normally only records changed since the stored
+    watermark are requested; full=True (or the full-sync schedule) downloads
+    the whole list.
+    """
+    # สร้าง record สำหรับเก็บประวัติการ sync
+    sync_record = SyncHistory(sync_type='myhr', status='running')
+    db.session.add(sync_record)
+    db.session.commit()
+    
+    timer = PhaseTimer('myhr')
     try:
-        headers = {'Authorization': f'Bearer {Config.MYHR_API_KEY}'}
-        response = requests.get(Config.MYHR_API_URL, headers=headers, timeout=30)
-        response.raise_for_status()
-        
-        employees_data = response.json()
-        
-        for emp_data in employees_data:
-            employee = Employee.query.filter_by(employee_id=emp_data['employeeid']).first()
-            
-            if not employee:
-                employee = Employee(employee_id=emp_data['employeeid'])
-            
-            employee.fname = emp_data.get('fname')
-            employee.lname = emp_data.get('lname')
-            employee.phone = emp_data.get('phone')
-            employee.department = emp_data.get('department')
-            employee.position = emp_data.get('empPostionTdesc')
-            employee.start_date = convert_date_format(emp_data.get('start_date'))
-            employee.status = emp_data.get('status')
-            
-            # แปลงวันที่ลาออก (รับเป็นปี พ.ศ.)
-            employee.resigndate = convert_date_format(emp_data.get('resigndate'))
-            
-            # แปลงวันที่หมดอายุบัญชี (รับเป็นปี พ.ศ.)
-            if emp_data.get('resigndate'):
-                # ถ้ามีวันที่ลาออก ให้ตั้งค่า account_expires_date อัตโนมัติเป็นวันเดียวกับ resigndate
-                employee.account_expires_date = employee.resigndate
-            elif emp_data.get('account_expires_date'):
-                # ถ้าไม่มี resigndate แต่มี account_expires_date ให้ใช้ค่านั้น
-                employee.account_expires_date = convert_date_format(emp_data.get('account_expires_date'))
-            else:
-                # ถ้าไม่มีทั้งสองอย่างให้เป็น None
-                employee.account_expires_date = None
-                
-            employee.last_updated = get_asia_bangkok_time()  # อัพเดตเวลาเป็น Asia/Bangkok
-            employee.ad_updated = False # รีเซ็ตสถานะเพื่อให้อัพเดต AD ใหม่
-            
-            db.session.add(employee)
+        state = get_source_state()
+        fetch, sync_record.fetch_mode = start_myhr_fetch(state, full)
+        # ส่งข้อมูลเข้า upsert ทีละหน้าระหว่างที่ดาวน์โหลด แทนการรอให้ได้ครบทั้งหมดก่อน
+        stats = upsert_employee_records(parse_myhr_records(timer.iterate(fetch, 'fetch')))
+        sync_record.records_received = fetch.records_received
         
+        # อัปเดต record ว่าสำเร็จ
+        sync_record.status = 'success'
+        sync_record.end_time = get_asia_bangkok_time()
+        if fetch.not_modified:
+            sync_record.message = "MyHR Sync completed. Data not modified since last sync."
+        else:
+            sync_record.message = (
+                f"MyHR Sync completed ({sync_record.fetch_mode}, {fetch.records_received} records received). "
+                f"New: {stats['inserted']}, Updated: {stats['updated']}, Unchanged: {stats['unchanged']}"
+            )
+        # เก็บ validator และ watermark พร้อม commit ของข้อมูล รอบที่ล้มเหลวจะเริ่มจากจุดเดิม
+        advance_source_state(state, fetch, sync_record.fetch_mode)
+        sync_record.updated_count = stats['inserted'] + stats['updated']
+        sync_record.unchanged_count = stats['unchanged']
+        sync_record.phase_timings = timer.finish('success')
+        db.session.add(sync_record)
         db.session.commit()
         return True
     except Exception as e:
         print(f"Error fetching employees from API: {e}")
+        record_error('myhr', e)
         db.session.rollback()
-        return False
\ No newline at end of file
+        
+        # อัปเดต record ว่าล้มเหลว
+        sync_record.status = 'failed'
+        sync_record.end_time = get_asia_bangkok_time()
+        sync_record.error_message = str(e)
+        sync_record.phase_timings = timer.finish('failed')
+        db.session.add(sync_record)
+        db.session.commit()
+        return False
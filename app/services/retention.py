@@ -0,0 +1,184 @@
+import gzip
+import json
+import logging
+import math
+import os
+from datetime import datetime, time, timedelta
+from sqlalchemy import delete, func, select, text
+from app_factory import db, get_asia_bangkok_time
+from app.models.sync_history import SyncHistory
+from app.models.sync_history_daily import SyncHistoryDaily
+from app.models.sync_item_result import SyncItemResult
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# key ของ pg advisory lock ('HRRT') ให้รวมยอดและลบข้อมูลดิบของแต่ละวันได้ทีละ process
+RETENTION_LOCK_KEY = 0x48525254
+
+def _percentile(sorted_values, pct):
+    """
+    Nearest-rank percentile of an already sorted list.
+    """
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+def _day_bounds(day):
+    start = datetime.combine(day, time.min)
+    return start, start + timedelta(days=1)
+
+def _aggregate_runs(runs):
+    """
+    Aggregate one day's SyncHistory rows per sync_type.
+    """
+    by_type = {}
+    for run in runs:
+        stats = by_type.setdefault(run.sync_type, {
+            'runs': 0, 'successes': 0, 'failures': 0, 'updated_total': 0,
+            'not_found_total': 0, 'unchanged_total': 0, 'durations': []
+        })
+        stats['runs'] += 1
+        if run.status == 'success':
+            stats['successes'] += 1
+        elif run.status == 'failed':
+            stats['failures'] += 1
+        stats['updated_total'] += run.updated_count or 0
+        stats['not_found_total'] += run.not_found_count or 0
+        stats['unchanged_total'] += run.unchanged_count or 0
+        if run.start_time and run.end_time:
+            stats['durations'].append((run.end_time - run.start_time).total_seconds())
+    return by_type
+
+def _store_daily(day, sync_type, stats):
+    row = SyncHistoryDaily.query.filter_by(day=day, sync_type=sync_type).first()
+    durations = sorted(stats['durations'])
+    p50 = _percentile(durations, 50)
+    p95 = _percentile(durations, 95)
+
+    if row is None:
+        row = SyncHistoryDaily(day=day, sync_type=sync_type, raw_deleted=False)
+    elif row.raw_deleted:
+        # มีรอบที่บันทึกย้อนหลังหลังจากลบข้อมูลดิบของวันนี้ไปแล้ว รวมยอดเพิ่ม
+        # ส่วน percentile เฉลี่ยถ่วงน้ำหนักตามจำนวนรอบ (เป็นค่าประมาณ)
+        for key in ('runs', 'successes', 'failures', 'updated_total', 'not_found_total', 'unchanged_total'):
+            setattr(row, key, (getattr(row, key) or 0) + stats[key])
+        old_samples = row.duration_samples or 0
+        total_samples = old_samples + len(durations)
+        if durations and total_samples:
+            row.duration_p50 = ((row.duration_p50 or 0) * old_samples + p50 * len(durations)) / total_samples
+            row.duration_p95 = ((row.duration_p95 or 0) * old_samples + p95 * len(durations)) / total_samples
+        row.duration_samples = total_samples
+        db.session.add(row)
+        return row
+
+    for key in ('runs', 'successes', 'failures', 'updated_total', 'not_found_total', 'unchanged_total'):
+        setattr(row, key, stats[key])
+    row.duration_p50 = p50
+    row.duration_p95 = p95
+    row.duration_samples = len(durations)
+    db.session.add(row)
+    return row
+
+def rollup_day(day):
+    """
+    Recompute the SyncHistoryDaily rows of one day from the raw SyncHistory rows.
+    """
+    start, end = _day_bounds(day)
+    runs = SyncHistory.query.filter(SyncHistory.start_time >= start, SyncHistory.start_time < end).all()
+    for sync_type, stats in _aggregate_runs(runs).items():
+        _store_daily(day, sync_type, stats)
+    return runs
+
+def _archive_runs(archive_dir, day, runs):
+    """
+    Append the runs of a day, with their item results, to a gzip NDJSON file.
+    """
+    os.makedirs(archive_dir, exist_ok=True)
+    path = os.path.join(archive_dir, f"sync_history_{day.isoformat()}.ndjson.gz")
+    run_ids = [run.id for run in runs]
+    items_by_run = {}
+    for start in range(0, len(run_ids), 500):
+        chunk = run_ids[start:start + 500]
+        for item in SyncItemResult.query.filter(SyncItemResult.sync_id.in_(chunk)).order_by(SyncItemResult.id):
+            items_by_run.setdefault(item.sync_id, []).append({
+                'employee_id': item.employee_id,
+                'outcome': item.outcome,
+                'changed_mask': item.changed_mask,
+                'error_code': item.error_code,
+                'error_message': item.error_message
+            })
+
+    # เปิดแบบ append ได้ gzip หลาย member ต่อกัน ซึ่ง gzip/zcat อ่านได้ตามปกติ
+    with gzip.open(path, 'at', encoding='utf-8') as f:
+        for run in runs:
+            record = {column.name: getattr(run, column.name) for column in SyncHistory.__table__.columns}
+            record['items'] = items_by_run.get(run.id, [])
+            f.write(json.dumps(record, default=str, ensure_ascii=False) + '\n')
+    return path
+
+def _delete_runs(run_ids):
+    for start in range(0, len(run_ids), 500):
+        chunk = run_ids[start:start + 500]
+        db.session.execute(delete(SyncItemResult).where(SyncItemResult.sync_id.in_(chunk)))
+        db.session.execute(delete(SyncHistory).where(SyncHistory.id.in_(chunk)))
+
+def apply_retention(retention_days=None, archive_dir=None):
+    """
+    Roll every completed day up into SyncHistoryDaily, then delete the raw runs
+    (and their item results) older than retention_days. When archive_dir is set
+    the raw runs are first appended to one gzip NDJSON file per day.
+    Each day's rollup and deletion are committed together, so a day's runs are
+    never counted both in SyncHistoryDaily totals and as raw rows; on
+    PostgreSQL an advisory lock keeps concurrent runs from rolling up the same
+    day twice.
+    Returns {'days_rolled_up', 'runs_deleted', 'archives'}.
+    """
+    if retention_days is None:
+        retention_days = getattr(Config, 'SYNC_HISTORY_RETENTION_DAYS', 30)
+    if archive_dir is None:
+        archive_dir = getattr(Config, 'SYNC_HISTORY_ARCHIVE_DIR', None)
+
+    today = get_asia_bangkok_time().date()
+    cutoff = today - timedelta(days=retention_days)
+
+    # วันที่ยังมีข้อมูลดิบ (ไม่รวมวันนี้ซึ่งยังไม่จบวัน)
+    day_column = func.date(SyncHistory.start_time)
+    days = [
+        value if not isinstance(value, str) else datetime.strptime(value, '%Y-%m-%d').date()
+        for (value,) in db.session.execute(
+            select(day_column).where(SyncHistory.start_time < datetime.combine(today, time.min)).distinct()
+        )
+    ]
+
+    result = {'days_rolled_up': 0, 'runs_deleted': 0, 'archives': []}
+    for day in sorted(days):
+        if db.engine.dialect.name == 'postgresql':
+            db.session.execute(text("SELECT pg_advisory_xact_lock(:key)"), {'key': RETENTION_LOCK_KEY})
+        raw_deleted = db.session.query(SyncHistoryDaily.id).filter_by(day=day, raw_deleted=True).first() is not None
+        runs = rollup_day(day)
+        # วันที่ลบข้อมูลดิบไปแล้ว ยอดของรอบที่บันทึกย้อนหลังถูกบวกเข้าไปแล้ว ต้องลบรอบเหล่านั้นใน commit เดียวกัน
+        # แม้วันนั้นจะยังอยู่ในช่วงเก็บข้อมูล (เช่น เพิ่ม retention_days) ไม่เช่นนั้นรอบถัดไปจะนับซ้ำ
+        if runs and (day < cutoff or raw_deleted):
+            if archive_dir:
+                path = _archive_runs(archive_dir, day, runs)
+                if path not in result['archives']:
+                    result['archives'].append(path)
+            _delete_runs([run.id for run in runs])
+            SyncHistoryDaily.query.filter_by(day=day).update({'raw_deleted': True})
+            result['runs_deleted'] += len(runs)
+        db.session.commit()
+        result['days_rolled_up'] += 1
+
+    logger.info(f"Sync history retention: {result['days_rolled_up']} days rolled up, {result['runs_deleted']} runs deleted")
+    return result
+
+def recent_daily_stats(days=14):
+    """
+    Daily rollup rows for the dashboard, newest first.
+    """
+    since = get_asia_bangkok_time().date() - timedelta(days=days)
+    return SyncHistoryDaily.query.filter(SyncHistoryDaily.day >= since).order_by(
+        SyncHistoryDaily.day.desc(), SyncHistoryDaily.sync_type
+    ).all()
@@ -0,0 +1,209 @@
+import logging
+import math
+import random
+import threading
+from datetime import timedelta
+from sqlalchemy import text
+from app_factory import db, get_asia_bangkok_time
+from app.models.sync_schedule_state import SyncScheduleState
+from app.services import job_runner
+from config import Config
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# key ของ pg advisory lock ('HRSY') ใช้ร่วมกันทุก replica
+SCHEDULER_LOCK_KEY = 0x48525359
+
+_process_lock = threading.Lock()
+
+def parse_schedules(value):
+    """
+    Parse SYNC_SCHEDULES into {job_type: interval_seconds}.
+    Accepts a dict or a string such as "ftp=600,ad=1800"; intervals may use
+    an s/m/h/d suffix ("ftp=10m,ad=30m,retention=1d").
+    """
+    if not value:
+        return {}
+    if isinstance(value, dict):
+        items = value.items()
+    else:
+        items = [part.split('=', 1) for part in value.split(',') if part.strip()]
+
+    units = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+    schedules = {}
+    for job_type, interval in items:
+        job_type = job_type.strip()
+        if job_type not in job_runner.JOB_FUNCTIONS:
+            raise ValueError(f"Unknown job type in SYNC_SCHEDULES: {job_type}")
+        if isinstance(interval, str):
+            interval = interval.strip().lower()
+            multiplier = units.get(interval[-1:], None)
+            seconds = int(interval[:-1]) * multiplier if multiplier else int(interval)
+        else:
+            seconds = int(interval)
+        if seconds <= 0:
+            raise ValueError(f"Schedule interval for {job_type} must be positive")
+        schedules[job_type] = seconds
+    return schedules
+
+class SchedulerLock:
+    """
+    Leadership lock so only one scheduler submits jobs across all replicas.
+    On PostgreSQL it is a session advisory lock held on a dedicated connection;
+    otherwise an exclusive lock on SCHEDULER_LOCK_FILE (or, without fcntl, a
+    lock inside this process).
+    """
+
+    def __init__(self):
+        self._conn = None
+        self._file = None
+        self._thread_lock_held = False
+
+    def acquire(self):
+        if self.is_held():
+            return True
+        if db.engine.dialect.name == 'postgresql':
+            conn = db.engine.connect().execution_options(isolation_level='AUTOCOMMIT')
+            if conn.execute(text("SELECT pg_try_advisory_lock(:key)"), {'key': SCHEDULER_LOCK_KEY}).scalar():
+                self._conn = conn
+                return True
+            conn.close()
+            return False
+
+        if fcntl is not None:
+            lock_path = getattr(Config, 'SCHEDULER_LOCK_FILE', '/tmp/hr_sync_scheduler.lock')
+            lock_file = open(lock_path, 'a')
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                lock_file.close()
+                return False
+            self._file = lock_file
+            return True
+
+        self._thread_lock_held = _process_lock.acquire(blocking=False)
+        return self._thread_lock_held
+
+    def is_held(self):
+        if self._conn is not None:
+            try:
+                # ถ้า connection หลุด lock จะหายไปด้วย
+                self._conn.execute(text("SELECT 1"))
+                return True
+            except Exception as e:
+                logger.warning(f"Lost scheduler lock connection: {e}")
+                self._close_connection()
+                return False
+        return self._file is not None or self._thread_lock_held
+
+    def _close_connection(self):
+        try:
+            self._conn.close()
+        except Exception:
+            pass
+        self._conn = None
+
+    def release(self):
+        if self._conn is not None:
+            try:
+                self._conn.execute(text("SELECT pg_advisory_unlock(:key)"), {'key': SCHEDULER_LOCK_KEY})
+            except Exception:
+                pass
+            self._close_connection()
+        if self._file is not None:
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+            self._file.close()
+            self._file = None
+        if self._thread_lock_held:
+            _process_lock.release()
+            self._thread_lock_held = False
+
+def _jitter():
+    jitter_seconds = getattr(Config, 'SCHEDULER_JITTER_SECONDS', 0)
+    return timedelta(seconds=random.uniform(0, jitter_seconds)) if jitter_seconds > 0 else timedelta(0)
+
+def run_due_schedules(app, schedules, now=None):
+    """
+    Submit every schedule whose next run is due and move it to its next slot.
+    Returns the list of (job_type, job_id, created) submitted in this tick.
+    """
+    now = now or get_asia_bangkok_time()
+    catch_up = getattr(Config, 'SCHEDULER_CATCH_UP', 'run_once')
+    submitted = []
+
+    for job_type, interval_seconds in schedules.items():
+        interval = timedelta(seconds=interval_seconds)
+        state = SyncScheduleState.query.filter_by(job_type=job_type).first()
+        if state is None:
+            state = SyncScheduleState(job_type=job_type, next_run_at=now + _jitter())
+            db.session.add(state)
+        if state.next_run_at is None or state.next_run_at > now:
+            continue
+
+        overdue = now - state.next_run_at
+        if catch_up == 'skip' and overdue >= interval:
+            # พลาดรอบไปแล้ว (เช่น scheduler หยุดทำงาน) ไม่รันย้อนหลัง รอรอบถัดไปตามตาราง
+            missed = math.ceil(overdue / interval)
+            state.next_run_at = state.next_run_at + interval * missed + _jitter()
+            logger.info(f"Skipped {missed} missed {job_type} run(s); next run at {state.next_run_at}")
+            continue
+
+        job, created = job_runner.submit_job(app, job_type)
+        if created:
+            state.last_run_at = now
+            state.last_job_id = job.id
+            logger.info(f"Scheduled {job_type} sync started as job {job.id}")
+        else:
+            logger.info(f"Scheduled {job_type} sync skipped: job {job.id} ({job.job_type}) is still {job.status}")
+        state.next_run_at = now + interval + _jitter()
+        submitted.append((job_type, job.id, created))
+
+    db.session.commit()
+    return submitted
+
+def run_scheduler(app, stop_event=None):
+    """
+    Run the scheduler loop until stop_event is set. Only the instance holding the
+    scheduler lock submits jobs; the others wait and take over if it goes away.
+    """
+    stop_event = stop_event or threading.Event()
+    with app.app_context():
+        schedules = parse_schedules(getattr(Config, 'SYNC_SCHEDULES', None))
+        if not schedules:
+            logger.warning("SYNC_SCHEDULES is empty, scheduler has nothing to run")
+            return
+        tick = getattr(Config, 'SCHEDULER_TICK_SECONDS', 15)
+        logger.info(f"Scheduler started with schedules: {schedules}")
+
+        lock = SchedulerLock()
+        leader = False
+        try:
+            while not stop_event.is_set():
+                try:
+                    held = lock.acquire()
+                    if held != leader:
+                        logger.info("Scheduler became leader" if held else "Scheduler is on standby, another instance holds the lock")
+                        leader = held
+                    if held:
+                        run_due_schedules(app, schedules)
+                except Exception as e:
+                    logger.error(f"Scheduler tick failed: {e}")
+                    db.session.rollback()
+                finally:
+                    db.session.remove()
+                stop_event.wait(tick)
+        finally:
+            lock.release()
+
+def start_scheduler_thread(app):
+    """
+    Run the scheduler in a daemon thread inside the web process.
+    """
+    thread = threading.Thread(target=run_scheduler, args=(app,), name='sync-scheduler', daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,241 @@
+import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app
+from app_factory import db, get_asia_bangkok_time
+from app.models.sync_history import SyncHistory
+from app.services import ad_service, ftp_service, myhr_service
+from app.services.employee_ingest import settle_touched_employees, upsert_employee_records
+from app.services.job_runner import report_progress
+from app.utils.metrics import PhaseTimer, record_error
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+def _download_ftp(app, timer):
+    """
+    Fetch stage for FTP: list the pending CSV files and download them into
+    spooled temporary files (large files go to disk, so memory stays bounded).
+    Returns (batches, failed_files, already_processed, error); each batch is a
+    dict holding the file's ledger fields and its open spool.
+    """
+    with app.app_context():
+        started = time.perf_counter()
+        batches = []
+        failed_files = []
+        already_processed = 0
+        ftp = None
+        try:
+            ftp = ftp_service.connect_ftp()
+            file_info, already_processed = ftp_service.list_pending_files(ftp)
+            ftp.quit()
+
+            for filename, spool, sha256, error in ftp_service.download_files(list(file_info)):
+                if error:
+                    print(f"Failed to download {filename}: {error}")
+                    failed_files.append(filename)
+                    continue
+                size, modified_at = file_info[filename]
+                batch = {'filename': filename, 'size': size, 'modified_at': modified_at,
+                         'sha256': sha256, 'spool': spool, 'duplicate': False}
+                if ftp_service.is_content_processed(sha256):
+                    logger.warning(f"Skipping {filename} - same content as the last processed file")
+                    batch['duplicate'] = True
+                batches.append(batch)
+            return batches, failed_files, already_processed, None
+        except Exception as e:
+            logger.error(f"FTP fetch failed: {e}")
+            record_error('ftp', e)
+            if ftp:
+                ftp.close()
+            return batches, failed_files, already_processed, e
+        finally:
+            db.session.remove()
+            timer.add('fetch_ftp', time.perf_counter() - started)
+
+def _apply_myhr(timer, touched, totals):
+    """
+    Stream MyHR page by page into the chunked upsert and commit it, using the
+    same delta/full decision and source state as fetch_employees_from_api.
+    Returns (records_received, fetch_mode, error); on error nothing from
+    MyHR is kept and the source state is left as it was.
+    """
+    state = myhr_service.get_source_state()
+    fetch, mode = myhr_service.start_myhr_fetch(state)
+    try:
+        stats = upsert_employee_records(
+            myhr_service.parse_myhr_records(timer.iterate(fetch, 'fetch_myhr')),
+            touched=touched
+        )
+        myhr_service.advance_source_state(state, fetch, mode)
+        with timer.phase('commit'):
+            db.session.commit()
+    except Exception as e:
+        logger.error(f"MyHR fetch failed: {e}")
+        record_error('myhr', e)
+        db.session.rollback()
+        return fetch.records_received, mode, e
+    totals['unchanged'] += stats['unchanged']
+    totals['skipped'] += stats['skipped']
+    return fetch.records_received, mode, None
+
+def _apply_ftp(timer, touched, totals, ftp_result):
+    """
+    Upsert each downloaded FTP file through the chunked upsert, committing it
+    together with its ledger entry. Returns (applied_files, rows_read); files
+    that fail are rolled back and added to the failed list in ftp_result.
+    """
+    batches, failed_files, _, _ = ftp_result
+    applied = []
+    rows_read = 0
+    for batch in batches:
+        row_count = 0
+        try:
+            if not batch['duplicate']:
+                def rows():
+                    nonlocal row_count
+                    for row in ftp_service.iter_csv_rows(batch['spool']):
+                        row_count += 1
+                        yield row
+
+                # พนักงานใหม่ที่มาจาก FTP เท่านั้นต้องมีชื่อ (เหมือน fetch_employees_from_ftp)
+                stats = upsert_employee_records(timer.iterate(ftp_service.parse_ftp_rows(rows()), 'parse'),
+                                                require_name=True, touched=touched)
+                totals['unchanged'] += stats['unchanged']
+                totals['skipped'] += stats['skipped']
+            with timer.phase('commit'):
+                ftp_service.record_processed_file(batch['filename'], batch['size'], batch['modified_at'],
+                                                  batch['sha256'], row_count)
+                db.session.commit()
+            applied.append(batch['filename'])
+            rows_read += row_count
+        except Exception as e:
+            print(f"Error processing {batch['filename']}: {e}")
+            record_error('ftp', e)
+            db.session.rollback()
+            failed_files.append(batch['filename'])
+        finally:
+            batch['spool'].close()
+    return applied, rows_read
+
+def run_full_sync():
+    """
+    Download FTP files in the background while MyHR is streamed into the
+    database, then apply each FTP file, so sources are written in
+    SYNC_SOURCE_PRECEDENCE order (a later source wins field by field) without
+    holding all records in memory. Then push the dirty set to AD. Per-stage
+    timings are stored on the run's SyncHistory record.
+    """
+    sync_record = SyncHistory(sync_type='all', status='running')
+    db.session.add(sync_record)
+    db.session.commit()
+
+    app = current_app._get_current_object()
+    timer = PhaseTimer('all')
+    executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='sync-fetch')
+    ftp_future = None
+    try:
+        # ขั้นที่ 1: เริ่มดาวน์โหลดไฟล์ FTP เบื้องหลังระหว่างดึงข้อมูล MyHR
+        sources = getattr(Config, 'SYNC_SOURCE_PRECEDENCE', ('myhr', 'ftp'))
+        report_progress(stage='fetch')
+        if 'ftp' in sources:
+            ftp_future = executor.submit(_download_ftp, app, timer)
+
+        # ขั้นที่ 2: เขียนข้อมูลทีละแหล่งตามลำดับความสำคัญ แหล่งหลังชนะ
+        # touched เก็บค่าก่อนเขียนของพนักงานที่ถูกแก้ เพื่อคืนสถานะเมื่อแหล่งข้อมูลขัดกันเอง
+        report_progress(stage='upsert')
+        touched = {}
+        totals = {'unchanged': 0, 'skipped': 0}
+        myhr_records = 0
+        myhr_mode = None
+        myhr_error = None
+        applied_files = []
+        ftp_rows = 0
+        ftp_result = ([], [], 0, None)
+        for source in sources:
+            if source == 'myhr':
+                myhr_records, myhr_mode, myhr_error = _apply_myhr(timer, touched, totals)
+            elif source == 'ftp':
+                ftp_result = ftp_future.result()
+                applied_files, ftp_rows = _apply_ftp(timer, touched, totals, ftp_result)
+        batches, failed_files, already_processed, ftp_error = ftp_result
+        duplicate_files = sum(1 for batch in batches if batch['duplicate'])
+
+        stats = settle_touched_employees(touched)
+        stats['unchanged'] += totals['unchanged']
+        db.session.commit()
+
+        # ย้ายไฟล์เฉพาะที่ commit สำเร็จแล้ว
+        if applied_files:
+            with timer.phase('move'):
+                ftp = ftp_service.connect_ftp()
+                for filename in applied_files:
+                    ftp_service.move_to_processed(ftp, filename)
+                ftp.quit()
+
+        # ขั้นที่ 4: อัปเดต Active Directory จากรายการที่เปลี่ยนแปลง
+        report_progress(stage='ad')
+        with timer.phase('ad'):
+            ad_result = ad_service.update_active_directory()
+
+        myhr_success = myhr_error is None
+        ftp_success = ftp_error is None and not failed_files
+        errors = []
+        if myhr_error:
+            errors.append(f"MyHR: {myhr_error}")
+        if ftp_error:
+            errors.append(f"FTP: {ftp_error}")
+        if failed_files:
+            errors.append(f"Failed files: {', '.join(failed_files)}")
+        if not ad_result['success']:
+            errors.append(f"AD: {ad_result.get('error')}")
+
+        sync_record.status = 'success' if not errors else 'failed'
+        sync_record.end_time = get_asia_bangkok_time()
+        sync_record.message = (
+            f"Full sync completed. New: {stats['inserted']}, Updated: {stats['updated']}, "
+            f"Unchanged: {stats['unchanged']}, Files already processed: {already_processed}, "
+            f"Duplicate files skipped: {duplicate_files}, "
+            f"AD updated: {ad_result['updated_count']}, AD not found: {ad_result['not_found_count']}"
+        )
+        sync_record.error_message = '; '.join(errors) or None
+        sync_record.updated_count = stats['inserted'] + stats['updated']
+        sync_record.unchanged_count = stats['unchanged']
+        sync_record.not_found_count = ad_result['not_found_count']
+        sync_record.fetch_mode = myhr_mode
+        sync_record.records_received = myhr_records + ftp_rows
+        sync_record.phase_timings = timer.finish(sync_record.status)
+        db.session.add(sync_record)
+        db.session.commit()
+
+        return {
+            'success': not errors,
+            'myhr_success': myhr_success,
+            'ftp_success': ftp_success,
+            'ad_success': ad_result,
+            'phase_timings': json.loads(sync_record.phase_timings),
+            'message': 'Full sync process completed.'
+        }
+    except Exception as e:
+        logger.error(f"Full sync failed: {e}")
+        if ftp_future is not None and ftp_future.done() and not ftp_future.exception():
+            for batch in ftp_future.result()[0]:
+                batch['spool'].close()
+        record_error('sync', e)
+        db.session.rollback()
+
+        sync_record.status = 'failed'
+        sync_record.end_time = get_asia_bangkok_time()
+        sync_record.error_message = str(e)
+        sync_record.phase_timings = timer.finish('failed')
+        db.session.add(sync_record)
+        db.session.commit()
+        return {
+            'success': False,
+            'error': str(e),
+            'phase_timings': json.loads(sync_record.phase_timings),
+            'message': 'Full sync process failed.'
+        }
+    finally:
+        executor.shutdown(wait=True)
@@ -0,0 +1,61 @@
+from sqlalchemy import func, insert
+from app_factory import db
+from app.models.employee import Employee
+from app.models.sync_item_result import OUTCOMES, SyncItemResult, encode_changed_attributes
+from config import Config
+
+def item_result(employee_id, outcome, changes=None, error=None):
+    """
+    Build one SyncItemResult row as a dict for record_item_results().
+    """
+    row = {
+        'employee_id': employee_id,
+        'outcome': outcome,
+        'changed_mask': encode_changed_attributes(changes or ()),
+        'error_code': None,
+        'error_message': None
+    }
+    if error is not None:
+        # LDAPOperationResult มี description เช่น 'insufficientAccessRights'
+        row['error_code'] = (getattr(error, 'description', None) or type(error).__name__)[:64]
+        row['error_message'] = str(error)[:255]
+    return row
+
+def record_item_results(sync_id, rows):
+    """
+    Bulk insert per-item results for a sync run; the caller commits.
+    """
+    chunk_size = getattr(Config, 'INGEST_CHUNK_SIZE', 1000)
+    for start in range(0, len(rows), chunk_size):
+        chunk = [dict(row, sync_id=sync_id) for row in rows[start:start + chunk_size]]
+        db.session.execute(insert(SyncItemResult), chunk)
+
+def outcome_counts(sync_id):
+    rows = db.session.query(SyncItemResult.outcome, func.count(SyncItemResult.id)).filter(
+        SyncItemResult.sync_id == sync_id
+    ).group_by(SyncItemResult.outcome).all()
+    counts = dict.fromkeys(OUTCOMES, 0)
+    counts.update(dict(rows))
+    return counts
+
+def item_results_page(sync_id, outcome=None, page=1, per_page=None):
+    """
+    One page of item results for a sync run.
+    Returns (pagination, names) where names maps employee_id to "fname lname"
+    for the employees on the page that still exist.
+    """
+    per_page = per_page or getattr(Config, 'SYNC_DETAILS_PAGE_SIZE', 100)
+    query = db.select(SyncItemResult).where(SyncItemResult.sync_id == sync_id)
+    if outcome:
+        query = query.where(SyncItemResult.outcome == outcome)
+    pagination = db.paginate(query.order_by(SyncItemResult.id), page=page, per_page=per_page,
+                             max_per_page=1000, error_out=False)
+
+    employee_ids = {item.employee_id for item in pagination.items if item.employee_id}
+    names = {}
+    if employee_ids:
+        rows = db.session.query(Employee.employee_id, Employee.fname, Employee.lname).filter(
+            Employee.employee_id.in_(employee_ids)
+        ).all()
+        names = {employee_id: f"{fname or ''} {lname or ''}".strip() for employee_id, fname, lname in rows}
+    return pagination, names
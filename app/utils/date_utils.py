@@ -1,4 +1,64 @@
-from datetime import datetime, timezone, timedelta
+from datetime import date, datetime, timezone, timedelta
+from functools import lru_cache
+from itertools import islice
+
+# ปีที่มากกว่านี้ถือเป็นปี พ.ศ.
+BUDDHIST_ERA_MIN_YEAR = 2500
+BUDDHIST_ERA_OFFSET = 543
+# ไฟล์ HR มีวันที่ซ้ำกันไม่กี่ค่า cache ตามข้อความดิบจึงได้ผลดี
+DATE_CACHE_SIZE = 4096
+
+@lru_cache(maxsize=DATE_CACHE_SIZE)
+def _parse_be_date(value):
+    parts = value.split('-')
+    if len(parts) != 3:
+        return None
+    year, month, day = parts
+    if len(year) != 4 or not 1 <= len(month) <= 2 or not 1 <= len(day) <= 2:
+        return None
+    digits = year + month + day
+    if not (digits.isascii() and digits.isdigit()):
+        return None
+    year = int(year)
+    if year > BUDDHIST_ERA_MIN_YEAR:
+        year -= BUDDHIST_ERA_OFFSET
+    try:
+        # แปลงปีก่อนตรวจวันที่ 29 ก.พ. จึงตรวจกับปี ค.ศ. ที่ถูกต้อง
+        return date(year, int(month), int(day))
+    except ValueError:
+        return None
+
+def parse_be_date(value):
+    """
+    แปลงวันที่ 'YYYY-MM-DD' จาก MyHR API หรือไฟล์ FTP เป็น date
+    ปีที่มากกว่า 2500 ถือเป็นปี พ.ศ. และแปลงเป็น ค.ศ.
+    คืนค่า None เมื่อว่างหรือรูปแบบไม่ถูกต้อง (ไม่ใช้ strptime และ cache ผลตามข้อความดิบ)
+    """
+    if not value or not isinstance(value, str):
+        return None
+    return _parse_be_date(value)
+
+def parse_be_dates(values):
+    """
+    แปลงวันที่ทั้งคอลัมน์ในครั้งเดียว ค่าที่ซ้ำกันจะถูกแปลงเพียงครั้งเดียว
+    :return: list ของ date (หรือ None) ตามลำดับเดิม
+    """
+    values = list(values)
+    converted = {value: parse_be_date(value) for value in set(values)}
+    return list(map(converted.__getitem__, values))
+
+def parse_be_date_columns(rows, columns, chunk_size=1000):
+    """
+    อ่าน rows (dict) ทีละ chunk และแปลงคอลัมน์วันที่ของแต่ละ chunk ด้วย parse_be_dates
+    :return: generator ของ (row, dates) โดย dates เป็น tuple ของ date ตามลำดับ columns
+    """
+    iterator = iter(rows)
+    while True:
+        chunk = list(islice(iterator, chunk_size))
+        if not chunk:
+            return
+        converted = [parse_be_dates(row.get(column) for row in chunk) for column in columns]
+        yield from zip(chunk, zip(*converted))
 
 def get_current_time_gmt7():
     """
@@ -15,9 +75,19 @@ def get_current_time_gmt7():
     # คืนค่าเป็น datetime โดยไม่รวม timezone information
     return gmt7_now.replace(tzinfo=None)
 
+# ค่าคงที่ของ FILETIME: จำนวนช่วง 100 นาโนวินาทีนับจาก 1601-01-01 UTC
+WINDOWS_EPOCH_ORDINAL = date(1601, 1, 1).toordinal()
+HNS_PER_SECOND = 10000000
+HNS_PER_DAY = 86400 * HNS_PER_SECOND
+# accountExpires ที่ AD ใช้แทน "ไม่มีวันหมดอายุ" นอกจาก 0
+AD_NEVER_EXPIRES = 0x7FFFFFFFFFFFFFFF
+# เขตเวลา Asia/Bangkok ที่ใช้กำหนดวันหมดอายุบัญชี
+ACCOUNT_EXPIRES_TZ_OFFSET_HOURS = 7
+
 def convert_ce_to_ad_filetime(year_ce, month, day, hour, minute, second, timezone_offset_hours):
     """
     แปลงวันที่เวลาในรูปแบบ ค.ศ. และ Time Zone Offset เป็นค่า accountExpires (FILETIME) ของ AD
+    คำนวณด้วยจำนวนเต็มทั้งหมด (ไม่ผ่าน float) จึงได้ค่าที่แน่นอน
     
     :param year_ce: ปี ค.ศ. (เช่น 2025)
     :param month: เดือน (1-12)
@@ -28,26 +98,56 @@ def convert_ce_to_ad_filetime(year_ce, month, day, hour, minute, second, timezon
     :param timezone_offset_hours: ผลต่างเขตเวลาจาก UTC (เช่น +7 สำหรับ GMT+7)
     :return: ค่า Long Integer ของ accountExpires (FILETIME)
     """
-    
-    # --- 1. กำหนดค่าคงที่ ---
-    WINDOWS_EPOCH = datetime(1601, 1, 1, tzinfo=timezone.utc)
-    HNS_PER_SECOND = 10000000 # 100-nanosecond intervals ต่อ 1 วินาที
+    days = date(year_ce, month, day).toordinal() - WINDOWS_EPOCH_ORDINAL
+    # ลบ Time Zone Offset เพื่อให้ได้เวลา UTC
+    seconds = days * 86400 + hour * 3600 + minute * 60 + second - round(timezone_offset_hours * 3600)
+    return seconds * HNS_PER_SECOND
 
-    # --- 2. กำหนดวันที่เป้าหมาย (Local Time) ---
-    # สร้างวัตถุ datetime จาก ค.ศ. ที่ป้อน
-    local_time = datetime(year_ce, month, day, hour, minute, second)
-    
-    # --- 3. แปลงเวลาท้องถิ่นเป็น UTC ---
-    # ต้องลบ Time Zone Offset ออกเพื่อให้ได้เวลา UTC ที่แท้จริง
-    tz_offset = timedelta(hours=timezone_offset_hours)
-    utc_time = local_time - tz_offset
-    
-    # --- 4. คำนวณค่า FILETIME ---
-    # คำนวณระยะเวลา (timedelta) ตั้งแต่ 1601 UTC ถึงวันที่หมดอายุ UTC
-    # .replace(tzinfo=timezone.utc) เพื่อให้ Python รู้ว่าเรากำลังทำงานกับ UTC Time
-    time_difference = utc_time.replace(tzinfo=timezone.utc) - WINDOWS_EPOCH
-    
-    # แปลงเป็นช่วงเวลา 100-nanosecond intervals
-    accountExpires_value = int(time_difference.total_seconds() * HNS_PER_SECOND)
-    
-    return accountExpires_value
\ No newline at end of file
+def ad_filetime_to_datetime(filetime, timezone_offset_hours):
+    """
+    แปลงค่า FILETIME กลับเป็น datetime ตามเวลาท้องถิ่น (ไม่มี tzinfo)
+    :return: datetime หรือ None ถ้าเป็นค่า "ไม่มีวันหมดอายุ" หรืออยู่นอกช่วงที่ datetime รองรับ
+    """
+    if not filetime or filetime >= AD_NEVER_EXPIRES:
+        return None
+    local = filetime + round(timezone_offset_hours * 3600) * HNS_PER_SECOND
+    days, remainder = divmod(local, HNS_PER_DAY)
+    try:
+        return datetime.fromordinal(WINDOWS_EPOCH_ORDINAL + days) + timedelta(microseconds=remainder // 10)
+    except (ValueError, OverflowError):
+        return None
+
+@lru_cache(maxsize=DATE_CACHE_SIZE)
+def account_expires_filetime(expires_date):
+    """
+    ค่า accountExpires (string) สำหรับบัญชีที่ต้องหยุดใช้งานเมื่อสิ้นวัน expires_date ตามเวลา Asia/Bangkok
+    คือเวลา 00:00:00 ของวันถัดไป ผลลัพธ์ถูก cache ตามวันที่
+    """
+    next_day = expires_date + timedelta(days=1)
+    return str(convert_ce_to_ad_filetime(next_day.year, next_day.month, next_day.day, 0, 0, 0,
+                                         ACCOUNT_EXPIRES_TZ_OFFSET_HOURS))
+
+def parse_account_expires(value):
+    """
+    อ่านค่า accountExpires จาก AD เป็นจำนวนเต็ม โดยให้ "ไม่มีวันหมดอายุ" (0 หรือ 0x7FFFFFFFFFFFFFFF) เป็น 0
+    :return: int หรือ None ถ้าไม่มีค่าหรืออ่านไม่ได้
+    """
+    if value is None or value == '':
+        return None
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        return None
+    return 0 if value >= AD_NEVER_EXPIRES else value
+
+def account_expires_date(value):
+    """
+    แปลง accountExpires กลับเป็นวันสุดท้ายที่บัญชียังใช้งานได้ (ตรงข้ามกับ account_expires_filetime)
+    :return: date หรือ None ถ้าไม่มีวันหมดอายุหรืออ่านไม่ได้
+    """
+    filetime = parse_account_expires(value)
+    if not filetime:
+        return None
+    # ถอยไป 100 นาโนวินาทีเพื่อให้เที่ยงคืนตรงนับเป็นวันก่อนหน้า
+    expires_at = ad_filetime_to_datetime(filetime - 1, ACCOUNT_EXPIRES_TZ_OFFSET_HOURS)
+    return expires_at.date() if expires_at else None
@@ -0,0 +1,189 @@
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+# ตัวเก็บ metrics ภายใน process แสดงผลในรูปแบบ Prometheus text ที่ /metrics
+_registry = []
+_registry_lock = threading.Lock()
+_active_timer = threading.local()
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+def _format_labels(labelnames, values, extra=None):
+    pairs = list(zip(labelnames, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+class Counter:
+    """
+    Monotonic counter, optionally split by labels.
+    """
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        with _registry_lock:
+            _registry.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+class Histogram:
+    """
+    Histogram with cumulative buckets, sum and count per label set.
+    """
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}
+        self._lock = threading.Lock()
+        with _registry_lock:
+            _registry.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = {'buckets': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series['buckets'][index] += 1
+            series['sum'] += value
+            series['count'] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._values.items()):
+                for bound, bucket_count in zip(self.buckets, series['buckets']):
+                    lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, ('le', _format_value(bound)))} {bucket_count}")
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, ('le', '+Inf'))} {series['count']}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(series['sum'])}")
+                lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {series['count']}")
+        return lines
+
+def render_metrics():
+    """
+    Render every registered metric in the Prometheus text exposition format.
+    """
+    with _registry_lock:
+        metrics = list(_registry)
+    lines = []
+    for metric in metrics:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+# --- metrics ของระบบ sync ---
+SYNC_RUNS = Counter('hr_sync_runs_total', 'Sync runs by type and final status.', ('sync_type', 'status'))
+SYNC_RUN_SECONDS = Histogram('hr_sync_run_seconds', 'Wall time of a sync run.', ('sync_type',))
+SYNC_PHASE_SECONDS = Histogram('hr_sync_phase_seconds', 'Time spent in each phase of a sync run.', ('sync_type', 'phase'))
+FTP_DOWNLOAD_BYTES = Counter('hr_sync_ftp_download_bytes_total', 'Bytes downloaded from the FTP server.')
+FTP_DOWNLOAD_SECONDS = Histogram('hr_sync_ftp_download_seconds', 'Time to download one FTP file.')
+CSV_ROWS_PARSED = Counter('hr_sync_csv_rows_parsed_total', 'CSV rows parsed from FTP files.')
+HTTP_REQUEST_SECONDS = Histogram('hr_sync_http_request_seconds', 'Latency of requests to HR source APIs.', ('source',))
+DB_UPSERT_SECONDS = Histogram('hr_sync_db_upsert_seconds', 'Latency of one employee upsert chunk (select + write).')
+DB_UPSERT_ROWS = Counter('hr_sync_db_upsert_rows_total', 'Employee records processed by the upsert, by result.', ('result',))
+LDAP_OPERATION_SECONDS = Histogram('hr_sync_ldap_operation_seconds', 'Latency of LDAP operations.', ('operation',))
+AD_USER_MATCHES = Counter('hr_sync_ad_user_matches_total', 'Employees resolved to an AD user, by lookup method.', ('method',))
+SYNC_ERRORS = Counter('hr_sync_errors_total', 'Errors by component and exception class.', ('component', 'error_class'))
+
+def record_error(component, error):
+    SYNC_ERRORS.inc(component=component, error_class=type(error).__name__)
+
+class PhaseTimer:
+    """
+    Collect how long each phase of one sync run takes.
+    While started, record_phase() from the same thread (e.g. deep inside the
+    upsert code) adds to it as well. finish() publishes the totals as metrics
+    and returns them as a JSON string for SyncHistory.phase_timings.
+    """
+
+    def __init__(self, sync_type):
+        self.sync_type = sync_type
+        self.timings = {}
+        self._lock = threading.Lock()
+        self._started = time.perf_counter()
+        self._previous = getattr(_active_timer, 'timer', None)
+        _active_timer.timer = self
+
+    def add(self, phase, seconds):
+        with self._lock:
+            self.timings[phase] = self.timings.get(phase, 0.0) + seconds
+
+    @contextmanager
+    def phase(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - started)
+
+    def iterate(self, iterable, name):
+        """
+        Yield from iterable, counting only the time spent producing items as phase name.
+        """
+        iterator = iter(iterable)
+        while True:
+            started = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.add(name, time.perf_counter() - started)
+                return
+            self.add(name, time.perf_counter() - started)
+            yield item
+
+    def finish(self, status):
+        if getattr(_active_timer, 'timer', None) is self:
+            _active_timer.timer = self._previous
+        total = time.perf_counter() - self._started
+        with self._lock:
+            timings = {phase: round(seconds, 3) for phase, seconds in self.timings.items()}
+        for phase, seconds in timings.items():
+            SYNC_PHASE_SECONDS.observe(seconds, sync_type=self.sync_type, phase=phase)
+        SYNC_RUN_SECONDS.observe(total, sync_type=self.sync_type)
+        SYNC_RUNS.inc(sync_type=self.sync_type, status=status)
+        timings['total'] = round(total, 3)
+        return json.dumps(timings)
+
+def record_phase(phase, seconds):
+    """
+    Add time to a phase of the sync run active in this thread, if any.
+    """
+    timer = getattr(_active_timer, 'timer', None)
+    if timer is not None:
+        timer.add(phase, seconds)
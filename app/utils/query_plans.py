@@ -0,0 +1,81 @@
+import json
+import logging
+from sqlalchemy import false, select, text
+from app_factory import db
+from app.models.employee import Employee
+from app.models.sync_history import SyncHistory
+
+logger = logging.getLogger(__name__)
+
+def hot_path_queries():
+    """
+    Queries that run on every sync or dashboard load, as (name, table, statement).
+    Each of them must be answerable from an index.
+    """
+    from app.services.employee_query import SORT_COLUMNS
+    return [
+        ('ad_pending_employees', 'employee',
+         select(Employee).where(Employee.ad_updated == false())),
+        ('employee_page', 'employee',
+         select(Employee).order_by(*SORT_COLUMNS).limit(51)),
+        ('employee_lookup', 'employee',
+         select(Employee).where(Employee.employee_id.in_(['E0001', 'E0002']))),
+        ('recent_sync_history', 'sync_history',
+         select(SyncHistory).order_by(SyncHistory.start_time.desc()).limit(4)),
+        ('sync_history_by_type', 'sync_history',
+         select(SyncHistory).where(SyncHistory.sync_type == 'ad').order_by(SyncHistory.start_time.desc()).limit(10)),
+    ]
+
+def _postgresql_seq_scans(conn, sql):
+    # ปิด seq scan ชั่วคราว ถ้ายังได้ Seq Scan แปลว่าไม่มี index ที่ใช้ได้ (ตารางเล็กจะไม่ทำให้ผลผิด)
+    conn.execute(text("SET LOCAL enable_seqscan = off"))
+    plan = conn.execute(text(f"EXPLAIN (FORMAT JSON) {sql}")).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+
+    scans = []
+    nodes = [plan[0]['Plan']]
+    while nodes:
+        node = nodes.pop()
+        if node.get('Node Type') == 'Seq Scan':
+            scans.append(node.get('Relation Name'))
+        nodes.extend(node.get('Plans', []))
+    return scans
+
+def _sqlite_seq_scans(conn, sql):
+    scans = []
+    for row in conn.execute(text(f"EXPLAIN QUERY PLAN {sql}")):
+        detail = row[-1]
+        # "SCAN employee" คืออ่านทั้งตาราง ส่วน "SCAN employee USING INDEX ..." ยังใช้ index
+        if detail.startswith('SCAN ') and ' USING ' not in detail:
+            scans.append(detail.split()[1])
+    return scans
+
+def check_hot_path_plans():
+    """
+    EXPLAIN each hot-path query and report whether it falls back to a full table scan.
+    Returns a list of (name, result) in hot_path_queries() order, where result is
+    'ok', 'sequential scan on <table>', or 'skipped: unsupported dialect <name>'
+    when the database has no supported EXPLAIN format.
+    """
+    engine = db.engine
+    if engine.dialect.name == 'postgresql':
+        find_seq_scans = _postgresql_seq_scans
+    elif engine.dialect.name == 'sqlite':
+        find_seq_scans = _sqlite_seq_scans
+    else:
+        logger.warning(f"Query plan check is not supported for {engine.dialect.name}")
+        return [(name, f"skipped: unsupported dialect {engine.dialect.name}") for name, _, _ in hot_path_queries()]
+
+    results = []
+    for name, table, statement in hot_path_queries():
+        sql = str(statement.compile(dialect=engine.dialect, compile_kwargs={'literal_binds': True}))
+        with engine.connect() as conn:
+            scans = find_seq_scans(conn, sql)
+            conn.rollback()  # ยกเลิก SET LOCAL
+        if table in scans:
+            results.append((name, f"sequential scan on {table}"))
+            logger.warning(f"Query {name} does a sequential scan on {table}: {sql}")
+        else:
+            results.append((name, 'ok'))
+    return results
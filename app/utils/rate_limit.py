@@ -0,0 +1,28 @@
+import threading
+import time
+
+class RateLimiter:
+    """
+    Thread-safe limiter that spaces calls evenly so no more than
+    max_per_second operations start in any one second.
+    A max_per_second of 0 or None disables limiting.
+    """
+
+    def __init__(self, max_per_second):
+        self.interval = 1.0 / max_per_second if max_per_second else 0.0
+        self._lock = threading.Lock()
+        self._next_slot = time.monotonic()
+
+    def acquire(self):
+        """
+        Block until the caller is allowed to start its next operation.
+        """
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(self._next_slot, now)
+            self._next_slot = slot + self.interval
+        delay = slot - now
+        if delay > 0:
+            time.sleep(delay)
@@ -0,0 +1,116 @@
+import logging
+import warnings
+from sqlalchemy import insert, inspect, select, text
+from sqlalchemy.exc import SAWarning
+from sqlalchemy.schema import CreateIndex
+from app_factory import db, get_asia_bangkok_time
+from app.models.schema_version import SchemaVersion
+
+logger = logging.getLogger(__name__)
+
+# key ของ pg advisory lock ('HRSM') ให้มีเพียง replica เดียวที่ upgrade schema ในเวลาเดียวกัน
+SCHEMA_LOCK_KEY = 0x4852534D
+
+def _column_default_sql(column, dialect):
+    """
+    Render a scalar Python-side column default as a SQL literal, or None.
+    """
+    default = column.default
+    if default is None or not default.is_scalar:
+        return None
+    value = default.arg
+    if isinstance(value, bool):
+        return str(value).upper() if dialect.name != 'sqlite' else str(int(value))
+    if isinstance(value, (int, float)):
+        return str(value)
+    if isinstance(value, str):
+        return "'" + value.replace("'", "''") + "'"
+    return None
+
+def _add_columns(conn, table_name, column_names):
+    """
+    ALTER TABLE ADD COLUMN for each named model column the table does not have yet.
+    """
+    table = db.metadata.tables[table_name]
+    preparer = conn.dialect.identifier_preparer
+    existing_columns = {column['name'] for column in inspect(conn).get_columns(table_name)}
+    for name in column_names:
+        if name in existing_columns:
+            continue
+        column = table.columns[name]
+        column_type = column.type.compile(dialect=conn.dialect)
+        statement = f"ALTER TABLE {preparer.format_table(table)} ADD COLUMN {preparer.format_column(column)} {column_type}"
+        default_sql = _column_default_sql(column, conn.dialect)
+        if default_sql is not None:
+            statement += f" DEFAULT {default_sql}"
+        conn.execute(text(statement))
+        logger.info(f"Added column {table_name}.{name}")
+
+def _create_indexes(conn, table_name):
+    """
+    Create the model's indexes on a table that are missing in the database.
+    """
+    table = db.metadata.tables[table_name]
+    # index แบบ expression ไม่ถูกคืนค่าจาก inspector จึงใช้ IF NOT EXISTS แทน
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', SAWarning)
+        existing_indexes = {index['name'] for index in inspect(conn).get_indexes(table_name)}
+    for index in table.indexes:
+        if index.name in existing_indexes:
+            continue
+        conn.execute(CreateIndex(index, if_not_exists=True))
+        logger.info(f"Created index {index.name} on {table_name}")
+
+def _migrate_employee_fingerprint(conn):
+    _add_columns(conn, 'employee', ['sync_fingerprint'])
+    _create_indexes(conn, 'employee')
+
+def _migrate_sync_history_stats(conn):
+    _add_columns(conn, 'sync_history', ['unchanged_count', 'attribute_writes_skipped', 'drift_count',
+                                        'fetch_mode', 'records_received', 'phase_timings'])
+    _create_indexes(conn, 'sync_history')
+
+def _migrate_source_watermark(conn):
+    _add_columns(conn, 'sync_source_state', ['watermark', 'last_full_sync_at'])
+
+# migration ตามลำดับ (version, คำอธิบาย, ฟังก์ชัน) เพิ่มต่อท้ายเท่านั้น ห้ามแก้ของเดิมที่ออกไปแล้ว
+# ทุกขั้นต้องรันซ้ำได้ เพราะฐานข้อมูลที่สร้างด้วย db.create_all() มีคอลัมน์ใหม่อยู่แล้ว
+MIGRATIONS = [
+    (1, 'employee: sync_fingerprint and lookup indexes', _migrate_employee_fingerprint),
+    (2, 'sync_history: run counters, MyHR fetch details, phase timings and indexes', _migrate_sync_history_stats),
+    (3, 'sync_source_state: delta watermark and last full pull', _migrate_source_watermark),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+def get_schema_version():
+    """
+    Return the highest migration recorded in schema_version (0 when none).
+    """
+    SchemaVersion.__table__.create(db.engine, checkfirst=True)
+    with db.engine.connect() as conn:
+        return conn.execute(select(db.func.max(SchemaVersion.version))).scalar() or 0
+
+def upgrade_schema():
+    """
+    Bring the database to SCHEMA_VERSION: run every migration not yet recorded
+    in schema_version, each in one transaction together with its version row.
+    Call it after db.create_all(), which creates missing tables. On PostgreSQL
+    an advisory lock keeps replicas starting at the same time from racing.
+    Returns the list of versions applied.
+    """
+    engine = db.engine
+    SchemaVersion.__table__.create(engine, checkfirst=True)
+    applied = []
+    for version, description, migrate in MIGRATIONS:
+        with engine.begin() as conn:
+            if engine.dialect.name == 'postgresql':
+                conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {'key': SCHEMA_LOCK_KEY})
+            if conn.execute(select(SchemaVersion.version).where(SchemaVersion.version == version)).first():
+                continue
+            migrate(conn)
+            conn.execute(insert(SchemaVersion).values(version=version, description=description,
+                                                      applied_at=get_asia_bangkok_time()))
+            applied.append(version)
+            logger.info(f"Applied schema migration {version}: {description}")
+    return applied
@@ -41,11 +41,15 @@ def create_app(config_class='config.Config'):
     def init_database():
         with app.app_context():
             # Import models ภายใน app context เพื่อหลีกเลี่ยง circular import
-            from app.models import user, employee, sync_history
+            from app.models import user, employee, sync_history, ad_sync_state, ftp_file_ledger, sync_job, sync_item_result, sync_history_daily, sync_schedule_state, sync_source_state, ad_identity, schema_version
             
             # สร้างตารางทั้งหมดที่กำหนดไว้ใน models
             db.create_all()
             
+            # รัน migration ที่ยังไม่เคยรัน (เพิ่มคอลัมน์และ index ใหม่ให้ตารางที่มีอยู่แล้ว)
+            from app.utils.schema import upgrade_schema
+            upgrade_schema()
+            
             # สร้าง user admin ถ้ายังไม่มี (ใช้ try-except เพื่อความปลอดภัย)
             try:
                 if not user.User.query.filter_by(username='admin').first():
@@ -66,7 +70,16 @@ def create_app(config_class='config.Config'):
     app.register_blueprint(api.bp, url_prefix='/api')
     app.register_blueprint(main.bp)
     
+    # คำสั่ง flask CLI สำหรับงานดูแลฐานข้อมูล
+    from app.cli import register_commands
+    register_commands(app)
+    
     # เรียกใช้ฟังก์ชันสร้างฐานข้อมูล
     init_database()
     
+    # ตัวตั้งเวลา sync อัตโนมัติภายใน web process (ถ้าเปิดใช้)
+    if app.config.get('SCHEDULER_ENABLED'):
+        from app.services.scheduler import start_scheduler_thread
+        start_scheduler_thread(app)
+    
     return app
\ No newline at end of file
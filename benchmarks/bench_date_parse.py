@@ -0,0 +1,113 @@
+"""
+Micro-benchmark of Buddhist-era date parsing and accountExpires conversion
+on HR-like columns.
+
+    python benchmarks/bench_date_parse.py --rows 200000 --distinct 500
+
+Each row has start_date, resigndate and account_expires_date drawn from a
+small pool of distinct BE dates (plus empty cells), as in the MyHR and FTP
+exports. Compares the previous strptime-based conversion with the cached
+fixed-format parser per value (parse_be_date) and per column through the
+batch API (parse_be_dates), both on the raw columns and through the MyHR
+record converters (parse_myhr_record per record, parse_myhr_records per
+chunk as the ingest paths call it), then the previous float-based
+FILETIME conversion with the cached integer one on every parsed resigndate.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.myhr_service import parse_myhr_record, parse_myhr_records
+from app.utils.date_utils import _parse_be_date, account_expires_filetime, parse_be_date, parse_be_dates
+
+
+def legacy_convert_date_format(date_str):
+    """
+    The conversion the ingest paths used before (myhr_service.convert_date_format).
+    """
+    if not date_str:
+        return None
+    try:
+        date_obj = datetime.strptime(date_str, '%Y-%m-%d')
+        if date_obj.year > 2500:
+            date_obj = date_obj.replace(year=date_obj.year - 543)
+        return date_obj.date()
+    except (ValueError, TypeError):
+        return None
+
+
+def legacy_account_expires(expires_date):
+    """
+    The accountExpires value ad_service computed before (datetime arithmetic and
+    total_seconds() for every employee).
+    """
+    next_day = datetime.combine(expires_date + timedelta(days=1), datetime.min.time())
+    utc_time = (next_day - timedelta(hours=7)).replace(tzinfo=timezone.utc)
+    return str(int((utc_time - datetime(1601, 1, 1, tzinfo=timezone.utc)).total_seconds() * 10000000))
+
+
+def generate_rows(rows, distinct, seed=7):
+    rng = random.Random(seed)
+    pool = [f'{rng.randrange(2540, 2575)}-{rng.randrange(1, 13):02d}-{rng.randrange(1, 29):02d}'
+            for _ in range(distinct)]
+    return [
+        (rng.choice(pool), rng.choice(pool) if rng.random() < 0.1 else '', rng.choice(pool) if rng.random() < 0.3 else '')
+        for _ in range(rows)
+    ]
+
+
+def run(label, func, rows):
+    started = time.perf_counter()
+    result = func(rows)
+    elapsed = time.perf_counter() - started
+    print(f"{label:<22} time={elapsed:7.3f}s  rows/s={len(rows) / elapsed:12,.0f}")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--distinct', type=int, default=500)
+    args = parser.parse_args()
+
+    rows = generate_rows(args.rows, args.distinct)
+    print(f"{args.rows} rows, {args.distinct} distinct dates, 3 date columns per row")
+
+    legacy = run('legacy strptime', lambda rs: [tuple(legacy_convert_date_format(v) for v in row) for row in rs], rows)
+    _parse_be_date.cache_clear()
+    cached = run('parse_be_date (cold)', lambda rs: [tuple(parse_be_date(v) for v in row) for row in rs], rows)
+    run('parse_be_date (warm)', lambda rs: [tuple(parse_be_date(v) for v in row) for row in rs], rows)
+    _parse_be_date.cache_clear()
+    batch = run('parse_be_dates (batch)', lambda rs: list(zip(*(parse_be_dates(column) for column in zip(*rs)))), rows)
+
+    records = [{'employeeid': str(i), 'start_date': start, 'resigndate': resign, 'account_expires_date': expires}
+               for i, (start, resign, expires) in enumerate(rows)]
+    _parse_be_date.cache_clear()
+    per_record = run('parse_myhr_record', lambda rs: [parse_myhr_record(r) for r in rs], records)
+    _parse_be_date.cache_clear()
+    chunked = run('parse_myhr_records', lambda rs: list(parse_myhr_records(rs)), records)
+    expected = [(start, resign, resign or expires) for start, resign, expires in legacy]
+
+    assert cached == legacy, 'cached parser disagrees with the legacy conversion'
+    assert batch == legacy, 'batch parser disagrees with the legacy conversion'
+    for parsed in (per_record, chunked):
+        ingested = [(r['start_date'], r['resigndate'], r['account_expires_date']) for r in parsed]
+        assert ingested == expected, 'MyHR record conversion disagrees with the legacy conversion'
+    print('Results identical to the legacy conversion.')
+
+    resigndates = [row[1] for row in legacy if row[1]] * 10
+    print(f"{len(resigndates)} resigndates to accountExpires")
+    legacy_filetimes = run('legacy float FILETIME', lambda ds: [legacy_account_expires(d) for d in ds], resigndates)
+    account_expires_filetime.cache_clear()
+    filetimes = run('cached int FILETIME', lambda ds: [account_expires_filetime(d) for d in ds], resigndates)
+    assert filetimes == legacy_filetimes, 'integer FILETIME disagrees with the legacy conversion'
+    print('accountExpires identical to the legacy conversion.')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+"""
+Compare peak memory of the legacy /employees JSON response with the streamed export.
+
+    python benchmarks/bench_export_memory.py --rows 200000
+
+A temporary SQLite database is filled with synthetic employees (or pass
+--database-url to use an existing database). Each mode requests /employees
+through the Flask test client in its own subprocess so peak RSS is measured
+independently.
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def create_app_for(database_url):
+    os.environ['DATABASE_URL'] = database_url
+    from app_factory import create_app
+    return create_app('config.Config')
+
+
+def populate(database_url, rows):
+    from sqlalchemy import insert
+    app = create_app_for(database_url)
+    from app_factory import db
+    from app.models.employee import Employee
+    with app.app_context():
+        batch = []
+        for i in range(rows):
+            batch.append({'employee_id': f'E{i:07d}', 'fname': f'ชื่อ{i}', 'lname': f'นามสกุล{i}',
+                          'phone': f'08{i % 100000000:08d}', 'department': f'Division {i % 40}',
+                          'position': f'Position {i % 120}', 'start_date': date(2022, 1, 15),
+                          'status': 'Active', 'ad_updated': True})
+            if len(batch) == 10000:
+                db.session.execute(insert(Employee), batch)
+                batch = []
+        if batch:
+            db.session.execute(insert(Employee), batch)
+        db.session.commit()
+
+
+def run_mode(mode, database_url, export_format):
+    """
+    Request the employee export in the given mode, returning bytes, seconds and peak RSS in MB.
+    """
+    app = create_app_for(database_url)
+    from flask import jsonify
+    from app.models.employee import Employee
+
+    started = time.perf_counter()
+    size = 0
+    if mode == 'legacy':
+        with app.test_request_context():
+            employees_data = [
+                {
+                    'employee_id': emp.employee_id,
+                    'fname': emp.fname,
+                    'lname': emp.lname,
+                    'phone': emp.phone,
+                    'department': emp.department,
+                    'position': emp.position,
+                    'start_date': emp.start_date.strftime('%Y-%m-%d') if emp.start_date else None,
+                    'status': emp.status,
+                    'ad_updated': emp.ad_updated
+                } for emp in Employee.query.all()
+            ]
+            size = len(jsonify(employees_data).get_data())
+    else:
+        client = app.test_client()
+        client.post('/login', data={'username': 'admin', 'password': 'admin123'})
+        response = client.get(f'/employees?format={export_format}', buffered=False)
+        for chunk in response.response:
+            size += len(chunk)
+        response.close()
+    elapsed = time.perf_counter() - started
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return {'mode': mode, 'bytes': size, 'seconds': round(elapsed, 2), 'peak_rss_mb': round(peak_kb / 1024, 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--database-url', help='Use an existing database instead of generating one')
+    parser.add_argument('--format', default='json', choices=['json', 'ndjson', 'csv'])
+    parser.add_argument('--modes', nargs='+', default=['streaming', 'legacy'])
+    parser.add_argument('--child', nargs=3, metavar=('MODE', 'DATABASE_URL', 'FORMAT'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        mode, database_url, export_format = args.child
+        print(json.dumps(run_mode(mode, database_url, export_format)))
+        return
+
+    with tempfile.TemporaryDirectory() as directory:
+        database_url = args.database_url
+        if not database_url:
+            database_url = f"sqlite:///{os.path.join(directory, 'bench.db')}"
+            print(f"Generating {args.rows} employees...")
+            populate(database_url, args.rows)
+        for mode in args.modes:
+            output = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), '--child', mode, database_url, args.format],
+                capture_output=True, text=True, cwd=ROOT, check=True
+            ).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            print(f"{result['mode']:<10} bytes={result['bytes']:<11} time={result['seconds']:>7}s  peak RSS={result['peak_rss_mb']} MB")
+
+
+if __name__ == '__main__':
+    main()
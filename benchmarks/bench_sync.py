@@ -0,0 +1,458 @@
+"""
+End-to-end sync benchmark against local stand-ins for FTP, MyHR and AD.
+
+    python benchmarks/bench_sync.py --employees 1000 10000 100000 --churn 5
+    python benchmarks/bench_sync.py --compare results/old.json results/new.json
+
+For every workforce size a database is seeded with a synthetic baseline that
+is already in sync with AD. Then the three sync stages run in order, each in
+its own subprocess so peak RSS is measured on its own:
+
+  ftp   fetch_employees_from_ftp reads a CSV with churn % changed employees
+        (plus new hires) from a local pyftpdlib server
+  myhr  fetch_employees_from_api asks a local HTTP stub of the MyHR
+        endpoint for records changed since the stored watermark (another
+        churn % of the workforce); use the myhr_full stage for a full pull
+  ad    update_active_directory pushes the dirty employees to an ldap3
+        MOCK_SYNC directory seeded with the baseline
+
+Each stage reports wall time, round trips to its source (FTP commands, HTTP
+requests, LDAP operations), LDAP entries returned, SQL statements, peak RSS
+and the phase timings stored on its SyncHistory record. The mock directory
+evaluates every search by scanning all entries in Python, so for the AD stage
+ldap_entries is a better guide to DC load than wall time. Results are written as JSON (by default to
+benchmarks/results/) so two commits can be compared with --compare.
+
+A temporary SQLite database is used unless --scratch-database-url is given.
+All tables of that database are dropped and recreated.
+"""
+import argparse
+import csv
+import json
+import logging
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+FTP_USER = 'bench'
+FTP_PASSWORD = 'bench'
+FTP_FILENAME = 'employees_delta.csv'
+FTP_FIELDNAMES = ['employeeid', 'EFNAME', 'ELNAME', 'phone', 'Division', 'POSITION',
+                  'start_date', 'status', 'resigndate', 'account_expires_date']
+BASE_DN = 'OU=Staff,DC=bench,DC=local'
+ADMIN_DN = 'CN=admin,DC=bench,DC=local'
+ADMIN_PASSWORD = 'bench'
+STAGES = ('ftp', 'myhr', 'ad')
+OPTIONAL_STAGES = ('myhr_full',)
+BASELINE_UPDATED_AT = '2025-01-01T00:00:00'
+CHANGED_UPDATED_AT = '2025-02-01T00:00:00'
+
+
+class Workforce:
+    """
+    A deterministic synthetic workforce: the baseline already stored in the
+    database and AD, and the changed snapshots served by FTP and MyHR.
+    """
+
+    def __init__(self, size, churn_pct, hires_pct, seed=42):
+        rng = random.Random(seed)
+        self.baseline = [self._employee(i) for i in range(size)]
+        churned = rng.sample(range(size), min(size, 2 * int(size * churn_pct / 100)))
+        half = len(churned) // 2
+        self.ftp_changed = sorted(churned[:half])
+        self.myhr_changed = sorted(churned[half:])
+
+        current = [dict(emp) for emp in self.baseline]
+        for i in churned:
+            self._change(current[i], rng)
+        self.hires = [dict(self._employee(i), updated_at=CHANGED_UPDATED_AT)
+                      for i in range(size, size + int(size * hires_pct / 100))]
+        self.current = current + self.hires
+
+    @staticmethod
+    def _employee(i):
+        return {
+            'employeeid': f'E{i:07d}', 'fname': f'Given{i}', 'lname': f'Surname{i}',
+            'phone': f'08{i % 100000000:08d}', 'department': f'Division {i % 40}',
+            'empPostionTdesc': f'Position {i % 120}', 'start_date': '2565-01-15',
+            'status': 'Active', 'resigndate': '', 'account_expires_date': '',
+            'updated_at': BASELINE_UPDATED_AT,
+        }
+
+    @staticmethod
+    def _change(emp, rng):
+        emp['updated_at'] = CHANGED_UPDATED_AT
+        kind = rng.choice(('phone', 'department', 'position', 'resign'))
+        if kind == 'phone':
+            emp['phone'] = f'09{rng.randrange(10 ** 8):08d}'
+        elif kind == 'department':
+            emp['department'] = f'Division {rng.randrange(40, 60)}'
+        elif kind == 'position':
+            emp['empPostionTdesc'] = f'Position {rng.randrange(120, 200)}'
+        else:
+            emp['status'] = 'Resigned'
+            emp['resigndate'] = '2568-06-30'
+
+    def ftp_rows(self):
+        for emp in [self.current[i] for i in self.ftp_changed] + self.hires:
+            yield [emp['employeeid'], emp['fname'], emp['lname'], emp['phone'], emp['department'],
+                   emp['empPostionTdesc'], emp['start_date'], emp['status'], emp['resigndate'],
+                   emp['account_expires_date']]
+
+
+def counting_ftp_handler(authorizer, counter):
+    """
+    Build a pyftpdlib handler class that counts the commands it receives.
+    """
+    from pyftpdlib.handlers import FTPHandler
+
+    class Handler(FTPHandler):
+        def pre_process_command(self, line, cmd, arg):
+            counter.add()
+            return super().pre_process_command(line, cmd, arg)
+
+    Handler.authorizer = authorizer
+    return Handler
+
+
+class RequestCounter:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0
+
+    def add(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def reset(self):
+        with self._lock:
+            value, self.value = self.value, 0
+        return value
+
+
+def start_ftp_server(directory, counter):
+    from pyftpdlib.authorizers import DummyAuthorizer
+    from pyftpdlib.log import config_logging
+    from pyftpdlib.servers import FTPServer
+
+    config_logging(level=logging.WARNING)
+    authorizer = DummyAuthorizer()
+    authorizer.add_user(FTP_USER, FTP_PASSWORD, directory, perm='elradfmw')
+    server = FTPServer(('127.0.0.1', 0), counting_ftp_handler(authorizer, counter))
+    thread = threading.Thread(target=server.serve_forever, kwargs={'handle_exit': False}, daemon=True)
+    thread.start()
+    return server
+
+
+def start_myhr_stub(payload, counter):
+    """
+    Serve the MyHR employee list as JSON. updated_since=<timestamp> returns
+    only records with a later updated_at.
+    """
+    from urllib.parse import parse_qs, urlparse
+
+    full_body = json.dumps(payload).encode('utf-8')
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            counter.add()
+            since = parse_qs(urlparse(self.path).query).get('updated_since')
+            if since:
+                body = json.dumps([emp for emp in payload if emp['updated_at'] > since[0]]).encode('utf-8')
+            else:
+                body = full_body
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def create_app_for(database_url):
+    # Config อ่าน DATABASE_URL ตอน import จึงต้องตั้งค่าตรงๆ เมื่อเปลี่ยนฐานข้อมูลใน process เดิม
+    os.environ['DATABASE_URL'] = database_url
+    from config import Config
+    Config.SQLALCHEMY_DATABASE_URI = database_url
+    from app_factory import create_app
+    return create_app('config.Config')
+
+
+def prepare_database(database_url, workforce):
+    """
+    Recreate the schema and store the baseline workforce as already synced to
+    AD, with the MyHR watermark of a full pull of the baseline.
+    """
+    app = create_app_for(database_url)
+    from sqlalchemy import update
+    from app_factory import db
+    from app_factory import get_asia_bangkok_time
+    from app.models.employee import Employee
+    from app.models.sync_source_state import SyncSourceState
+    from app.services.employee_ingest import upsert_employee_records
+    from app.services.myhr_service import parse_myhr_records
+    from app.utils.schema import upgrade_schema
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        upgrade_schema()
+        upsert_employee_records(parse_myhr_records(workforce.baseline))
+        db.session.execute(update(Employee).values(ad_updated=True))
+        db.session.add(SyncSourceState(source='myhr', watermark=BASELINE_UPDATED_AT,
+                                       last_full_sync_at=get_asia_bangkok_time()))
+        db.session.commit()
+        db.engine.dispose()
+
+
+def seed_directory(workforce):
+    from ldap3 import Connection, MOCK_SYNC, Server
+
+    server = Server('bench-dc')
+    seed = Connection(server, user=ADMIN_DN, password=ADMIN_PASSWORD, client_strategy=MOCK_SYNC)
+    seed.strategy.add_entry(ADMIN_DN, {'userPassword': ADMIN_PASSWORD, 'sn': 'admin'})
+    for i, emp in enumerate(workforce.baseline):
+        dn = f'CN=user{i:07d},{BASE_DN}'
+        guid = uuid.UUID(int=i + 1)
+        seed.strategy.add_entry(dn, {
+            'objectClass': ['top', 'person', 'organizationalPerson', 'user'],
+            'givenName': emp['fname'], 'sn': emp['lname'], 'distinguishedName': dn,
+            'employeeID': emp['employeeid'], 'telephoneNumber': emp['phone'],
+            'department': emp['department'], 'title': emp['empPostionTdesc'],
+            'userAccountControl': '512', 'objectGUID': guid.bytes_le,
+        })
+    return server
+
+
+def peak_rss_mb():
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def run_stage(stage, spec):
+    """
+    Run one sync stage in this process and return its measurements.
+    """
+    from config import Config
+    Config.FTP_HOST = '127.0.0.1'
+    Config.FTP_PORT = spec['ftp_port']
+    Config.FTP_USER = FTP_USER
+    Config.FTP_PASSWORD = FTP_PASSWORD
+    Config.FTP_PATH = '/'
+    Config.MYHR_API_URL = f"http://127.0.0.1:{spec['http_port']}/employees"
+    Config.AD_BASE_DN = BASE_DN
+
+    app = create_app_for(spec['database_url'])
+    from ldap3 import Connection, MOCK_SYNC
+    from sqlalchemy import event
+    from app_factory import db
+    from app.models.sync_history import SyncHistory
+    from app.services import ad_service, ftp_service, myhr_service
+    from app.services.ldap_pool import LDAPConnectionPool, set_ad_pool
+
+    ldap_operations = RequestCounter()
+    ldap_entries = RequestCounter()
+    if stage == 'ad':
+        server = seed_directory(Workforce(spec['employees'], spec['churn'], spec['hires']))
+
+        class CountingConnection(Connection):
+            def bind(self, *args, **kwargs):
+                ldap_operations.add()
+                return super().bind(*args, **kwargs)
+
+            def search(self, *args, **kwargs):
+                ldap_operations.add()
+                result = super().search(*args, **kwargs)
+                ldap_entries.add(sum(1 for entry in self.response or [] if entry.get('type') == 'searchResEntry'))
+                return result
+
+            def modify(self, *args, **kwargs):
+                ldap_operations.add()
+                return super().modify(*args, **kwargs)
+
+        set_ad_pool(LDAPConnectionPool(
+            create_connection=lambda: CountingConnection(server, user=ADMIN_DN, password=ADMIN_PASSWORD,
+                                                         client_strategy=MOCK_SYNC),
+            max_size=Config.AD_MODIFY_WORKERS + 1
+        ))
+
+    stage_functions = {
+        'ftp': ftp_service.fetch_employees_from_ftp,
+        'myhr': myhr_service.fetch_employees_from_api,
+        'myhr_full': lambda: myhr_service.fetch_employees_from_api(full=True),
+        'ad': ad_service.update_active_directory,
+    }
+    sync_type = 'myhr' if stage == 'myhr_full' else stage
+    with app.app_context():
+        statements = RequestCounter()
+        event.listen(db.engine, 'before_cursor_execute', lambda *args: statements.add())
+        setup_rss = peak_rss_mb()
+
+        started = time.perf_counter()
+        result = stage_functions[stage]()
+        elapsed = time.perf_counter() - started
+
+        record = SyncHistory.query.filter_by(sync_type=sync_type).order_by(SyncHistory.id.desc()).first()
+        return {
+            'success': bool(result.get('success') if isinstance(result, dict) else result),
+            'wall_seconds': round(elapsed, 3),
+            'sql_statements': statements.value,
+            'ldap_operations': ldap_operations.value,
+            'ldap_entries': ldap_entries.value,
+            'setup_rss_mb': setup_rss,
+            'peak_rss_mb': peak_rss_mb(),
+            'updated_count': record.updated_count if record else None,
+            'not_found_count': record.not_found_count if record else None,
+            'fetch_mode': record.fetch_mode if record else None,
+            'records_received': record.records_received if record else None,
+            'phase_timings': json.loads(record.phase_timings) if record and record.phase_timings else None,
+        }
+
+
+def run_scenario(args, size, database_url):
+    workforce = Workforce(size, args.churn, args.hires)
+    print(f"Preparing {size} employees ({len(workforce.ftp_changed)} FTP changes, "
+          f"{len(workforce.myhr_changed)} MyHR changes, {len(workforce.hires)} new hires)...")
+    prepare_database(database_url, workforce)
+
+    ftp_commands = RequestCounter()
+    http_requests = RequestCounter()
+    with tempfile.TemporaryDirectory() as directory:
+        os.makedirs(os.path.join(directory, 'processed'))
+        with open(os.path.join(directory, FTP_FILENAME), 'w', encoding='utf-8', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(FTP_FIELDNAMES)
+            writer.writerows(workforce.ftp_rows())
+        ftp_server = start_ftp_server(directory, ftp_commands)
+        http_server = start_myhr_stub(workforce.current, http_requests)
+        spec = {'employees': size, 'churn': args.churn, 'hires': args.hires, 'database_url': database_url,
+                'ftp_port': ftp_server.address[1], 'http_port': http_server.server_address[1]}
+        stages = {}
+        try:
+            for stage in args.stages:
+                ftp_commands.reset()
+                http_requests.reset()
+                output = subprocess.run(
+                    [sys.executable, os.path.abspath(__file__), '--child', stage, json.dumps(spec)],
+                    capture_output=True, text=True, cwd=ROOT
+                )
+                if output.returncode != 0:
+                    raise RuntimeError(f"{stage} stage failed:\n{output.stderr}")
+                result = json.loads(output.stdout.strip().splitlines()[-1])
+                result['ftp_commands'] = ftp_commands.reset()
+                result['http_requests'] = http_requests.reset()
+                stages[stage] = result
+                print(f"  {stage:<9} time={result['wall_seconds']:>8}s  sql={result['sql_statements']:<7} "
+                      f"ftp={result['ftp_commands']:<5} http={result['http_requests']:<3} "
+                      f"received={result['records_received'] or 0:<7} "
+                      f"ldap={result['ldap_operations']:<7} entries={result['ldap_entries']:<7} peak RSS={result['peak_rss_mb']} MB"
+                      f"{'' if result['success'] else '  FAILED'}")
+        finally:
+            ftp_server.close_all()
+            http_server.shutdown()
+    return {'employees': size, 'churn_pct': args.churn, 'hires_pct': args.hires, 'stages': stages}
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=ROOT, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(old_path, new_path):
+    """
+    Print per-stage changes between two result files.
+    """
+    with open(old_path, encoding='utf-8') as f:
+        old = json.load(f)
+    with open(new_path, encoding='utf-8') as f:
+        new = json.load(f)
+    print(f"{old.get('git_revision')} -> {new.get('git_revision')}")
+    old_scenarios = {(s['employees'], s['churn_pct']): s for s in old['scenarios']}
+    metrics = ('wall_seconds', 'records_received', 'sql_statements', 'ftp_commands', 'http_requests', 'ldap_operations', 'ldap_entries', 'peak_rss_mb')
+    for scenario in new['scenarios']:
+        previous = old_scenarios.get((scenario['employees'], scenario['churn_pct']))
+        if previous is None:
+            continue
+        print(f"employees={scenario['employees']} churn={scenario['churn_pct']}%")
+        for stage, result in scenario['stages'].items():
+            before = previous['stages'].get(stage)
+            if before is None:
+                continue
+            changes = []
+            for metric in metrics:
+                a, b = before.get(metric), result.get(metric)
+                if a is None or b is None or a == b:
+                    continue
+                pct = f" ({(b - a) / a * 100:+.0f}%)" if a else ''
+                changes.append(f"{metric} {a} -> {b}{pct}")
+            print(f"  {stage:<9} {'; '.join(changes) or 'no change'}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--employees', type=int, nargs='+', default=[1000, 10000])
+    parser.add_argument('--churn', type=float, default=5.0, help='percent of employees changed by each source')
+    parser.add_argument('--hires', type=float, default=0.5, help='percent of new employees in the FTP file')
+    parser.add_argument('--stages', nargs='+', choices=STAGES + OPTIONAL_STAGES, default=list(STAGES))
+    parser.add_argument('--scratch-database-url', help='database to use instead of a temporary SQLite file')
+    parser.add_argument('--output', help='result file (default: benchmarks/results/sync-<time>-<revision>.json)')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help='compare two result files and exit')
+    parser.add_argument('--child', nargs=2, metavar=('STAGE', 'SPEC'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        stage, spec = args.child
+        print(json.dumps(run_stage(stage, json.loads(spec))))
+        return
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    revision = git_revision()
+    results = {
+        'git_revision': revision,
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'database': 'sqlite' if not args.scratch_database_url else args.scratch_database_url.split(':', 1)[0],
+        'scenarios': [],
+    }
+    with tempfile.TemporaryDirectory() as directory:
+        for size in args.employees:
+            database_url = args.scratch_database_url or f"sqlite:///{os.path.join(directory, f'bench_{size}.db')}"
+            results['scenarios'].append(run_scenario(args, size, database_url))
+
+    output = args.output or os.path.join(
+        ROOT, 'benchmarks', 'results',
+        f"sync-{datetime.now().strftime('%Y%m%d-%H%M%S')}-{revision or 'unknown'}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -9,12 +9,55 @@ class Config:
     # MyHR API Config
     MYHR_API_URL = 'https://api.myhr.com/employees' # แก้ไข URL ให้ถูกต้อง
     MYHR_API_KEY = 'your-api-key-here' # ใส่ API Key จริง
+    MYHR_TIMEOUT = 30  # Seconds per MyHR request
+    MYHR_PAGE_SIZE = 0  # Page size sent as MYHR_PAGE_SIZE_PARAM (0 = let the API choose)
+    MYHR_PAGE_SIZE_PARAM = 'limit'
+    MYHR_CURSOR_PARAM = 'cursor'  # Query parameter for a next_cursor token returned by the API
+    MYHR_POOL_MAX_SIZE = 4  # Kept-alive HTTP connections to the MyHR API
+    MYHR_CONDITIONAL_REQUESTS = True  # Send If-None-Match/If-Modified-Since (single-page responses only) so an unchanged dataset returns 304
+    MYHR_DELTA_SYNC = True  # Request only records changed since the stored watermark
+    MYHR_DELTA_PARAM = 'updated_since'  # Query parameter carrying the watermark
+    MYHR_WATERMARK_FIELD = 'updated_at'  # Record field whose highest value becomes the next watermark
+    MYHR_WATERMARK_TOKEN_KEY = 'sync_token'  # Response key with a change token; preferred over MYHR_WATERMARK_FIELD
+    MYHR_FULL_SYNC_INTERVAL_HOURS = 24  # Do a full pull when the last one is older than this
+    INGEST_CHUNK_SIZE = 1000  # Number of employee records written per upsert statement
+    SYNC_SOURCE_PRECEDENCE = ('myhr', 'ftp')  # Lowest precedence first: FTP values win over MyHR in a full sync
+    
+    # Background sync jobs
+    SYNC_JOB_WORKERS = 2  # Number of sync jobs that can run at the same time
+    SYNC_JOB_HEARTBEAT_SECONDS = 5  # How often a running job persists its progress
+    SYNC_JOB_STALE_SECONDS = 300  # Active jobs without a heartbeat for this long are treated as dead
+    SYNC_JOB_RESULT_LOG_LIMIT = 200  # Log lines kept in a job result (the full log stays in sync history)
+
+    # Scheduler (run with `python scheduler.py`, or SCHEDULER_ENABLED=true to run inside the web process)
+    SYNC_SCHEDULES = os.environ.get('SYNC_SCHEDULES', '')  # Per-job intervals, e.g. "ftp=10m,ad=30m,retention=1d"
+    SCHEDULER_ENABLED = os.environ.get('SCHEDULER_ENABLED', 'false').lower() == 'true'
+    SCHEDULER_TICK_SECONDS = 15  # How often due schedules are checked
+    SCHEDULER_JITTER_SECONDS = 30  # Random delay added to each next run so replicas and stages do not align
+    SCHEDULER_CATCH_UP = 'run_once'  # After downtime: 'run_once' runs a missed schedule once, 'skip' waits for the next slot
+    SCHEDULER_LOCK_FILE = '/tmp/hr_sync_scheduler.lock'  # Leader lock when the database is not PostgreSQL
+
+    # Sync history retention
+    SYNC_HISTORY_RETENTION_DAYS = 30  # Raw runs older than this are rolled up into daily stats and deleted
+    SYNC_HISTORY_ARCHIVE_DIR = os.environ.get('SYNC_HISTORY_ARCHIVE_DIR')  # Write deleted runs to gzip NDJSON here first (unset = no archive)
+
+    # Employee table on the dashboard
+    EMPLOYEE_PAGE_SIZE = 50  # Default rows per page for /api/employees
+    EMPLOYEE_PAGE_MAX_SIZE = 500  # Upper bound for the limit parameter
+    EXPORT_BATCH_SIZE = 1000  # Rows fetched per batch and written per chunk by the /employees export
+    SYNC_DETAILS_PAGE_SIZE = 100  # Item results per page on the sync details page
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')  # Bearer token required by /metrics (unset = /metrics disabled)
    
    # FTP Config
     FTP_HOST = '161.82.212.91' # แก้ไข Host ให้ถูกต้อง
+    FTP_PORT = 21
     FTP_USER = 'ftpuser'
     FTP_PASSWORD = '123456'
     FTP_PATH = '/'
+    FTP_SPOOL_MAX_MEMORY = 8 * 1024 * 1024  # Bytes of a download kept in memory before spooling to a temp file
+    FTP_BLOCK_SIZE = 64 * 1024  # Block size for FTP transfers
+    FTP_DOWNLOAD_WORKERS = 3  # Number of FTP sessions used to download files in parallel
+    FTP_DUPLICATE_WINDOW_HOURS = 24  # A file repeating the last processed file's content within this window is skipped
     
     # Active Directory Config
     AD_SERVER = '192.168.2.10'
@@ -27,4 +70,18 @@ class Config:
     AD_CONNECTION_TIMEOUT = 30  # Connection timeout in seconds
     AD_READ_TIMEOUT = 30  # Read timeout in seconds
     AD_MAX_RETRIES = 3  # Maximum connection retry attempts
-    AD_RETRY_DELAY = 5  # Delay between retries in seconds
\ No newline at end of file
+    AD_RETRY_DELAY = 5  # Base delay for exponential backoff between retries in seconds
+    AD_RETRY_MAX_DELAY = 60  # Upper bound for the backoff delay in seconds
+    AD_GET_INFO = 'NONE'  # Server info to download on first bind: NONE, DSA, SCHEMA or ALL
+    AD_POOL_MAX_SIZE = 8  # Maximum number of pooled AD connections (AD_MODIFY_WORKERS is capped at this - 1)
+    AD_POOL_MIN_IDLE = 1  # Idle connections kept open between syncs
+    AD_POOL_MAX_IDLE_SECONDS = 300  # Idle connections above AD_POOL_MIN_IDLE are closed after this long
+    AD_POOL_HEALTH_CHECK_SECONDS = 60  # Idle connections older than this are checked before reuse
+    AD_POOL_ACQUIRE_TIMEOUT = 60  # Seconds to wait for a free pooled connection
+    AD_PREFETCH_USERS = True  # Load all AD users with one paged search when AD_PREFETCH_MIN_EMPLOYEES or more are pending; off = always batched lookups
+    AD_PREFETCH_MIN_EMPLOYEES = 200  # Below this many pending employees, look users up in batches by objectGUID/employeeID/name instead
+    AD_LOOKUP_BATCH_SIZE = 100  # objectGUID/employeeID values per LDAP search when looking users up directly
+    AD_SEARCH_PAGE_SIZE = 1000  # Page size for paged LDAP searches
+    AD_INCREMENTAL_SYNC = True  # Detect direct AD edits by reading only objects whose uSNChanged moved since the last run
+    AD_MODIFY_WORKERS = 4  # Number of concurrent connections used for AD modify operations
+    AD_MODIFY_MAX_OPS_PER_SECOND = 50  # Ceiling on modify operations per second against the DC (0 = unlimited)
\ No newline at end of file
@@ -0,0 +1,11 @@
+import logging
+from app_factory import create_app
+from app.services.scheduler import run_scheduler
+
+# ตัวตั้งเวลา sync อัตโนมัติ รันแยกจาก web server
+# กำหนดตารางเวลาด้วย SYNC_SCHEDULES เช่น "ftp=10m,ad=30m,retention=1d"
+app = create_app('config.Config')
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+    run_scheduler(app)
@@ -0,0 +1,89 @@
+import sqlite3
+
+import pytest
+from sqlalchemy import inspect
+
+from app_factory import create_app, db
+from app.utils.query_plans import check_hot_path_plans
+from app.utils.schema import SCHEMA_VERSION, get_schema_version, upgrade_schema
+from config import Config
+
+# ตาราง employee และ sync_history ตามโครงสร้างเดิมก่อนมี migration
+ORIGINAL_SCHEMA = """
+CREATE TABLE employee (
+    id INTEGER PRIMARY KEY,
+    employee_id VARCHAR(20) NOT NULL UNIQUE,
+    fname VARCHAR(64),
+    lname VARCHAR(64),
+    phone VARCHAR(20),
+    department VARCHAR(64),
+    position VARCHAR(64),
+    start_date DATE,
+    status VARCHAR(20),
+    last_updated DATETIME,
+    ad_updated BOOLEAN,
+    resigndate DATE,
+    account_expires_date DATE
+);
+CREATE TABLE sync_history (
+    id INTEGER PRIMARY KEY,
+    sync_type VARCHAR(20) NOT NULL,
+    status VARCHAR(20) NOT NULL,
+    message TEXT,
+    details TEXT,
+    start_time DATETIME,
+    end_time DATETIME,
+    updated_count INTEGER,
+    not_found_count INTEGER,
+    error_message TEXT
+);
+INSERT INTO employee (employee_id, fname, lname, ad_updated) VALUES ('E0001', 'Somchai', 'Jaidee', 1);
+"""
+
+
+def make_app(database_path):
+    class TestConfig(Config):
+        SQLALCHEMY_DATABASE_URI = f'sqlite:///{database_path}'
+        SCHEDULER_ENABLED = False
+
+    return create_app(TestConfig)
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = make_app(tmp_path / 'fresh.db')
+    with app.app_context():
+        yield app
+        db.session.remove()
+        db.engine.dispose()
+
+
+def test_fresh_database_is_at_latest_version(app):
+    assert get_schema_version() == SCHEMA_VERSION
+    assert upgrade_schema() == []
+
+
+def test_hot_path_queries_use_indexes(app):
+    results = dict(check_hot_path_plans())
+    assert results and all(result == 'ok' for result in results.values()), results
+
+
+def test_upgrade_from_original_schema(tmp_path):
+    database_path = tmp_path / 'original.db'
+    with sqlite3.connect(database_path) as conn:
+        conn.executescript(ORIGINAL_SCHEMA)
+
+    app = make_app(database_path)
+    with app.app_context():
+        columns = {column['name'] for column in inspect(db.engine).get_columns('employee')}
+        assert 'sync_fingerprint' in columns
+        columns = {column['name'] for column in inspect(db.engine).get_columns('sync_history')}
+        assert {'unchanged_count', 'drift_count', 'fetch_mode', 'phase_timings'} <= columns
+        assert get_schema_version() == SCHEMA_VERSION
+        assert all(result == 'ok' for _, result in check_hot_path_plans())
+
+        # รันซ้ำได้โดยไม่ทำอะไรเพิ่ม และข้อมูลเดิมยังอยู่
+        assert upgrade_schema() == []
+        assert db.session.execute(db.text("SELECT fname FROM employee")).scalar() == 'Somchai'
+        db.session.remove()
+        db.engine.dispose()